@@ -0,0 +1,138 @@
+# -----------------------------------------------------------------------------
+# Benchmark dell'indice delle immagini quasi identiche (PerceptualHashIndex).
+# Verifica che ricompressione, ridimensionamento e piccoli ritagli restino
+# entro IMAGE_HASH_MAX_DISTANCE mentre immagini diverse ne restano fuori,
+# che la stessa scheda compilata da due studenti con risposte diverse non
+# venga riutilizzata tra sessioni, e misura la latenza di ricerca con 1.000,
+# 10.000 e 50.000 impronte rispetto a un ciclo Python sulle stesse impronte.
+#
+# Uso: python benchmarks/bench_image_hash_index.py
+# -----------------------------------------------------------------------------
+
+import random
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw, ImageFilter  # noqa: E402
+
+from edubot.files import PerceptualHashIndex  # noqa: E402
+from edubot.media import ImagePreprocessor  # noqa: E402
+from edubot.settings import IMAGE_HASH_MAX_DISTANCE  # noqa: E402
+
+SAMPLE_IMAGES = 40
+INDEX_SIZES = [1_000, 10_000, 50_000]
+LOOKUPS = 200
+CONTEXT = ("scienze_pure", "argomenti generali", "gemini-2.5-flash")
+SESSION = "session_benchmark"
+
+
+def make_slide(seed: int) -> Image.Image:
+    """Immagine sintetica a blocchi sfumati, simile alla foto di una slide."""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(blocks).resize((1600, 1200), Image.Resampling.NEAREST)
+    return image.filter(ImageFilter.GaussianBlur(12))
+
+
+def make_worksheet(answer: str) -> Image.Image:
+    """Scheda di esercizi stampata, uguale per tutta la classe, con una risposta scritta a mano."""
+    image = Image.new('RGB', (1240, 1754), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((80, 60, 1160, 200), fill=(40, 70, 140))
+    for row in range(8):
+        top = 280 + row * 170
+        draw.text((100, top), f"Esercizio {row + 1}: risolvi l'equazione", fill='black')
+        draw.rectangle((100, top + 40, 1140, top + 130), outline='black', width=3)
+    draw.text((120, 300 + 7 * 170), answer, fill=(20, 20, 160))
+    return image
+
+
+def recompress(image: Image.Image, quality: int) -> Image.Image:
+    buffer = BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return Image.open(BytesIO(buffer.getvalue()))
+
+
+def crop(image: Image.Image, ratio: float) -> Image.Image:
+    width, height = image.size
+    dx, dy = int(width * ratio), int(height * ratio)
+    return image.crop((dx, dy, width - dx, height - dy))
+
+
+VARIANTS = {
+    "JPEG qualità 50": lambda image: recompress(image, 50),
+    "Ridotta al 50%": lambda image: image.resize((image.width // 2, image.height // 2)),
+    "Ritaglio 2%": lambda image: crop(image, 0.02),
+    "Ritaglio 5%": lambda image: crop(image, 0.05),
+}
+
+
+def measure_accuracy():
+    originals = [make_slide(seed) for seed in range(SAMPLE_IMAGES)]
+    hashes = [ImagePreprocessor.dhash(image) for image in originals]
+
+    print(f"{'Variante':<18} {'Riconosciute':>13} {'Distanza media':>15}")
+    for label, variant in VARIANTS.items():
+        distances = [bin(ImagePreprocessor.dhash(variant(image)) ^ image_hash).count("1")
+                     for image, image_hash in zip(originals, hashes)]
+        matched = sum(1 for distance in distances if distance <= IMAGE_HASH_MAX_DISTANCE)
+        print(f"{label:<18} {matched:>7}/{SAMPLE_IMAGES:<5} {sum(distances) / len(distances):>15.1f}")
+
+    different = [bin(a ^ b).count("1") for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+    false_matches = sum(1 for distance in different if distance <= IMAGE_HASH_MAX_DISTANCE)
+    print(f"{'Immagini diverse':<18} {false_matches:>7}/{len(different):<5} {sum(different) / len(different):>15.1f}"
+          f"  (coppie scambiate per duplicati)")
+
+
+def check_shared_worksheet():
+    """Due studenti caricano la stessa scheda con risposte diverse: niente riutilizzo tra sessioni."""
+    first, second = make_worksheet("x = 4"), make_worksheet("x = -7, verificata sostituendo")
+    first_hash, second_hash = ImagePreprocessor.dhash(first), ImagePreprocessor.dhash(second)
+    index = PerceptualHashIndex()
+    index.add(first_hash, CONTEXT, "chiave-studente-a", "scheda_equazioni.jpg", "session_studente_a")
+
+    other_session = index.find(second_hash, CONTEXT, "session_studente_b")
+    same_session = index.find(second_hash, CONTEXT, "session_studente_a")
+    print(f"\nScheda condivisa, risposte diverse: distanza {bin(first_hash ^ second_hash).count('1')}/64 bit")
+    print(f"  altra sessione:  {'riutilizzata ✗' if other_session else 'analizzata di nuovo ✓'}")
+    print(f"  stessa sessione: {'riutilizzata' if same_session else 'analizzata di nuovo'}")
+    assert other_session is None, "l'analisi di un altro studente non deve essere riutilizzata"
+
+
+def measure_latency():
+    rng = random.Random(0)
+    print(f"\n{'Impronte':>9} {'Indice numpy':>13} {'Ciclo Python':>13} {'Speed-up':>9}")
+    for size in INDEX_SIZES:
+        stored = [rng.getrandbits(64) for _ in range(size)]
+        index = PerceptualHashIndex(max_entries=size)
+        for position, image_hash in enumerate(stored):
+            index.add(image_hash, CONTEXT, f"chiave-{position}", f"immagine_{position}.png", SESSION)
+        queries = [stored[rng.randrange(size)] ^ (1 << rng.randrange(64)) for _ in range(LOOKUPS)]
+
+        start = time.perf_counter()
+        for query in queries:
+            assert index.find(query, CONTEXT, SESSION) is not None
+        numpy_ms = (time.perf_counter() - start) * 1000 / LOOKUPS
+
+        start = time.perf_counter()
+        for query in queries[:20]:
+            min(stored, key=lambda image_hash: bin(image_hash ^ query).count("1"))
+        loop_ms = (time.perf_counter() - start) * 1000 / 20
+
+        print(f"{size:>9} {numpy_ms:>10.3f} ms {loop_ms:>10.3f} ms {loop_ms / numpy_ms:>8.1f}x")
+
+
+def main():
+    print(f"Soglia: {IMAGE_HASH_MAX_DISTANCE}/64 bit diversi\n")
+    measure_accuracy()
+    check_shared_worksheet()
+    measure_latency()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# -----------------------------------------------------------------------------
+# Benchmark dell'avvio e dei rerun dello script di ingresso app.py.
+# Misura in un processo separato l'import a freddo del pacchetto edubot, che
+# Streamlit paga una sola volta per processo, e poi con AppTest il tempo
+# dell'intero script per ogni rerun: la prima esecuzione di una sessione
+# (creazione dei gestori) e la mediana dei rerun successivi, in cui app.py
+# ritrova il pacchetto in sys.modules e l'applicazione nella sessione.
+# Le chiamate al modello vengono sostituite da una risposta fissa.
+#
+# Uso: python benchmarks/bench_startup.py
+# -----------------------------------------------------------------------------
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("DOCUMENT_BACKEND", "local")
+
+import google.generativeai as genai  # noqa: E402
+import streamlit.runtime.scriptrunner.script_runner as script_runner  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from bench_tab_rerun import APP_PATH, build_history, fixed_generate_content  # noqa: E402
+
+REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+IMPORT_RUNS = 3
+HISTORY_MESSAGES = 60
+RERUNS = 15
+TABS = ["💬 Chat AI", "📊 Statistiche"]
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import edubot.application; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+script_times = []
+
+
+def record_script_time():
+    """Registra la durata di ogni esecuzione dello script, dall'inizio di app.py alla fine di main()."""
+    exec_func = script_runner.exec_func_with_error_handling
+
+    def timed_exec_func(func, ctx):
+        start = time.perf_counter()
+        try:
+            return exec_func(func, ctx)
+        finally:
+            script_times.append((time.perf_counter() - start) * 1000)
+
+    script_runner.exec_func_with_error_handling = timed_exec_func
+
+
+def measure_cold_import():
+    timings = []
+    for _ in range(IMPORT_RUNS):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=REPO_ROOT, env=os.environ,
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def measure_session(tab: str):
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    app.session_state["api_key_configured"] = True
+    app.session_state["final_privacy_accepted"] = True
+    app.session_state["active_tab"] = tab
+    script_times.clear()
+    app.run()
+    first_run = script_times[-1]
+    setup_time = app.session_state["application_setup_time"] * 1000
+
+    app.session_state["history"] = build_history(HISTORY_MESSAGES)
+    app.run()
+    script_times.clear()
+    for _ in range(RERUNS):
+        app.run()
+    assert not app.exception, [exception.value for exception in app.exception]
+    return first_run, setup_time, statistics.median(script_times)
+
+
+def main():
+    print(f"Import a freddo di edubot (mediana di {IMPORT_RUNS} processi): {measure_cold_import():.0f} ms\n")
+
+    genai.GenerativeModel.generate_content = fixed_generate_content
+    record_script_time()
+    print(f"{'Scheda':<16} {'Primo run':>10} {'Gestori':>9} {'Rerun (mediana)':>16}")
+    for tab in TABS:
+        first_run, setup_time, rerun = measure_session(tab)
+        print(f"{tab:<16} {first_run:>7.1f} ms {setup_time:>6.1f} ms {rerun:>13.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
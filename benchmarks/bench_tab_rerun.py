@@ -0,0 +1,103 @@
+# -----------------------------------------------------------------------------
+# Benchmark del tempo di esecuzione di un rerun dell'interfaccia principale.
+# Con AppTest esegue lo script come farebbe Streamlit a ogni interazione,
+# con una cronologia di HISTORY_MESSAGES messaggi, e riporta per ciascuna
+# scheda attiva la mediana del tempo registrato dall'app (rerun_metrics), del
+# tempo complessivo di AppTest.run e dei byte dei messaggi che il server
+# invierebbe al browser sul websocket (ForwardMsg). I file multimediali, come
+# la miniatura dell'icona, viaggiano a parte via HTTP e non sono conteggiati.
+# Misura poi la scheda della chat con cronologie via via più lunghe, per
+# verificare che il costo di un rerun resti costante. Le chiamate al modello
+# vengono sostituite da una risposta fissa: si misura solo il lavoro dell'app.
+#
+# Uso: python benchmarks/bench_tab_rerun.py
+# -----------------------------------------------------------------------------
+
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+os.environ.setdefault("DOCUMENT_BACKEND", "local")
+
+import google.generativeai as genai  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner  # noqa: E402
+
+APP_PATH = str(Path(__file__).resolve().parent.parent / "app.py")
+HISTORY_MESSAGES = 60
+LONG_HISTORY_SIZES = [300, 1000]
+RERUNS = 10
+TABS = ["💬 Chat AI", "📚 Preset Materie", "🗂️ Gestione File", "🎯 Argomenti", "🧠 Principi Pedagogici",
+        "⚙️ Impostazioni", "🕵️ Editor Prompt", "🛡️ Sicurezza", "📊 Statistiche"]
+
+
+class FixedResponse:
+    text = "Equazioni di secondo grado, Teorema di Pitagora, Derivate, Integrali, Probabilità, Statistica"
+
+
+def fixed_generate_content(self, contents, *args, **kwargs):
+    return FixedResponse()
+
+
+payload_sizes = []
+
+
+def record_payload_size():
+    """Registra i byte dei ForwardMsg prodotti da ogni esecuzione dello script."""
+    forward_msgs = LocalScriptRunner.forward_msgs
+
+    def recording_forward_msgs(runner):
+        messages = forward_msgs(runner)
+        payload_sizes.append(sum(message.ByteSize() for message in messages))
+        return messages
+
+    LocalScriptRunner.forward_msgs = recording_forward_msgs
+
+
+def build_history(messages: int):
+    history = []
+    for turn in range(messages // 2):
+        history.append({'role': 'user', 'parts': [{'text': f"Domanda {turn}: come si risolve un'equazione di secondo grado?"}]})
+        history.append({'role': 'model', 'parts': [{'text': f"**Risposta {turn}**\n\n- Calcola il discriminante\n- Applica la formula\n\n$x = \\frac{{-b \\pm \\sqrt{{\\Delta}}}}{{2a}}$"}]})
+    return history
+
+
+def measure_tab(tab_name: str, history_messages: int = HISTORY_MESSAGES):
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    app.session_state["api_key_configured"] = True
+    app.session_state["final_privacy_accepted"] = True
+    app.session_state["active_tab"] = tab_name
+    app.run()
+    app.session_state["history"] = build_history(history_messages)
+    app.run()
+    wall_timings = []
+    payload_sizes.clear()
+    for _ in range(RERUNS):
+        start = time.perf_counter()
+        app.run()
+        wall_timings.append((time.perf_counter() - start) * 1000)
+    assert not app.exception, [exception.value for exception in app.exception]
+    script_timings = [metric['elapsed'] * 1000 for metric in app.session_state["rerun_metrics"][-RERUNS:]]
+    return statistics.median(script_timings), statistics.median(wall_timings), statistics.median(payload_sizes), len(app.chat_message)
+
+
+def main():
+    genai.GenerativeModel.generate_content = fixed_generate_content
+    record_payload_size()
+    print(f"{'Scheda attiva':<24} {'Script':>10} {'AppTest.run':>12} {'Websocket':>11} {'Messaggi disegnati':>19}")
+    for tab_name in TABS:
+        script_ms, wall_ms, payload_bytes, rendered_messages = measure_tab(tab_name)
+        print(f"{tab_name:<24} {script_ms:>7.1f} ms {wall_ms:>9.1f} ms {payload_bytes / 1024:>8.1f} KB {rendered_messages:>19}")
+
+    print(f"\n{'Cronologia (chat)':<24} {'Script':>10} {'AppTest.run':>12} {'Websocket':>11} {'Messaggi disegnati':>19}")
+    for history_messages in LONG_HISTORY_SIZES:
+        script_ms, wall_ms, payload_bytes, rendered_messages = measure_tab(TABS[0], history_messages)
+        print(f"{f'{history_messages} messaggi':<24} {script_ms:>7.1f} ms {wall_ms:>9.1f} ms {payload_bytes / 1024:>8.1f} KB {rendered_messages:>19}")
+
+
+if __name__ == "__main__":
+    main()
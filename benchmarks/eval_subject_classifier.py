@@ -0,0 +1,202 @@
+# -----------------------------------------------------------------------------
+# Valutazione del classificatore locale delle materie (SubjectClassifier).
+# Riporta accuratezza e latenza del percorso locale e, se è configurata una
+# chiave API (GOOGLE_API_KEY), le confronta con il percorso AI.
+# Con SUBJECT_LOCAL_MIN_CONFIDENCE mostra anche quante richieste verrebbero
+# risolte in locale e l'accuratezza del percorso ibrido. La validazione
+# incrociata sugli esempi di addestramento indica come scegliere la soglia
+# senza usare i messaggi di valutazione.
+#
+# Uso: python benchmarks/eval_subject_classifier.py
+# -----------------------------------------------------------------------------
+
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import google.generativeai as genai  # noqa: E402
+
+from edubot.models import ModelManager, SubjectClassifier  # noqa: E402
+from edubot.settings import SUBJECT_EXAMPLES_PATH, SUBJECT_LOCAL_MIN_CONFIDENCE  # noqa: E402
+
+EXAMPLES_PATH = REPO_ROOT / SUBJECT_EXAMPLES_PATH
+CV_FOLDS = 5
+CV_THRESHOLDS = (0.6, 0.7, 0.8, 0.9, 0.95)
+
+# Messaggi etichettati: (testo, chiave attesa). Formulati senza le parole chiave di config.py e
+# assenti da subject_examples.jsonl, su cui il classificatore è addestrato: misurano la
+# generalizzazione, non la memoria
+LABELLED_MESSAGES = [
+    ("Come trovo l'ipotenusa se conosco i due cateti?", "logico_matematica"),
+    ("Quanto fa la radice quadrata di 144 e come si calcola a mano?", "logico_matematica"),
+    ("Non riesco a semplificare questa espressione con le potenze", "logico_matematica"),
+    ("Se estraggo due carte da un mazzo, che possibilità ho di pescare due assi?", "logico_matematica"),
+    ("Perché in autunno le foglie diventano gialle e rosse?", "scienze_pure"),
+    ("Come si trasmettono i caratteri ereditari dai genitori ai figli?", "scienze_pure"),
+    ("Perché la Luna non cade sulla Terra?", "scienze_pure"),
+    ("Cosa succede quando mescolo un acido con una base?", "scienze_pure"),
+    ("Come si scrive un while che si ferma quando l'utente digita zero?", "discipline_tecnologiche"),
+    ("Che differenza c'è tra RAM e memoria di massa in un computer?", "discipline_tecnologiche"),
+    ("Come faccio a collegare un LED con il giusto resistore?", "discipline_tecnologiche"),
+    ("Quali eventi portarono allo scoppio del conflitto nel 1914?", "storico_filosofiche"),
+    ("Cosa intendeva Cartesio con il dubbio metodico?", "storico_filosofiche"),
+    ("Come vivevano i contadini nel sistema feudale?", "storico_filosofiche"),
+    ("Che poteri ha il Presidente della Repubblica?", "giuridico_economiche"),
+    ("Come si calcola l'IVA su una fattura?", "giuridico_economiche"),
+    ("Un quindicenne può comprare un motorino firmando da solo?", "giuridico_economiche"),
+    ("Mi spieghi il significato dei Promessi sposi?", "letteratura"),
+    ("Chi era Laura, la donna cantata nel Canzoniere?", "letteratura"),
+    ("Qual è il messaggio de Il fu Mattia Pascal?", "letteratura"),
+    ("Nella frase 'Luca guarda un film', che funzione ha 'un film'?", "linguistica_e_grammatica"),
+    ("Si scrive qual è con l'apostrofo o senza?", "linguistica_e_grammatica"),
+    ("Come si coniuga il passato remoto di cuocere?", "linguistica_e_grammatica"),
+    ("Cosa rappresenta la Gioconda e perché è così famosa?", "discipline_artistiche_visive"),
+    ("Come si ottiene l'effetto del chiaroscuro in un ritratto a matita?", "discipline_artistiche_visive"),
+    ("Che differenza c'è tra affresco e tempera?", "discipline_artistiche_visive"),
+    ("Come si accorda un violino?", "musicali"),
+    ("Cosa significa tempo in quattro quarti?", "musicali"),
+    ("Chi ha composto Le quattro stagioni e come sono strutturate?", "musicali"),
+    ("Come posso concentrarmi meglio il pomeriggio quando preparo gli esami?", "generale"),
+    ("Come si calcola la diagonale di un quadrato?", "logico_matematica"),
+    ("Non ho capito come si trasforma un numero decimale con la virgola in un rapporto tra interi", "logico_matematica"),
+    ("Qual è la formula per l'area del trapezio?", "logico_matematica"),
+    ("Quanto fa due elevato alla decima?", "logico_matematica"),
+    ("Come fa il cuore a pompare il sangue?", "scienze_pure"),
+    ("Perché i metalli conducono il calore?", "scienze_pure"),
+    ("Che cos'è un buco nero?", "scienze_pure"),
+    ("Come si formano le nuvole e la pioggia?", "scienze_pure"),
+    ("Come si stampa a schermo una stringa in C?", "discipline_tecnologiche"),
+    ("A cosa serve un firewall?", "discipline_tecnologiche"),
+    ("Come funziona una stampante 3D?", "discipline_tecnologiche"),
+    ("Chi era Carlo Magno e perché fu incoronato nell'anno 800?", "storico_filosofiche"),
+    ("Cosa intendeva Spinoza quando parlava di Dio come natura?", "storico_filosofiche"),
+    ("Perché gli Stati Uniti dichiararono l'indipendenza?", "storico_filosofiche"),
+    ("Cosa fa il Consiglio dei ministri?", "giuridico_economiche"),
+    ("Che cosa sono le azioni e le obbligazioni?", "giuridico_economiche"),
+    ("Un datore di lavoro può licenziare senza motivo?", "giuridico_economiche"),
+    ("Che tipo di personaggio è Renzo?", "letteratura"),
+    ("Cosa simboleggia la rondine uccisa in X Agosto?", "letteratura"),
+    ("Di cosa parla Se questo è un uomo di Primo Levi?", "letteratura"),
+    ("Chi compie l'azione nella frase 'andiamo al mare' se nessuno è nominato?", "linguistica_e_grammatica"),
+    ("Si scrive familiare o famigliare?", "linguistica_e_grammatica"),
+    ("Come si trasforma una frase dal singolare al plurale?", "linguistica_e_grammatica"),
+    ("Cosa rappresenta l'Urlo di Munch?", "discipline_artistiche_visive"),
+    ("Come si disegna un cubo visto di spigolo con due punti di fuga?", "discipline_artistiche_visive"),
+    ("Quali colori uso per dipingere un tramonto?", "discipline_artistiche_visive"),
+    ("Cosa indica il punto coronato sopra una semiminima?", "musicali"),
+    ("Quanti tasti bianchi e neri ci sono sulla tastiera del piano?", "musicali"),
+    ("Chi ha scritto il Flauto magico?", "musicali"),
+    ("Come faccio a non arrivare stanco alla fine del quadrimestre?", "generale"),
+]
+
+
+def load_examples():
+    with open(EXAMPLES_PATH, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def cross_validate(examples):
+    """Precisione e copertura alle varie soglie, addestrando ogni volta su 4/5 degli esempi."""
+    shuffled = examples[:]
+    random.Random(0).shuffle(shuffled)
+    predictions = []
+    for fold in range(CV_FOLDS):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', encoding='utf-8', delete=False) as training_file:
+            for index, example in enumerate(shuffled):
+                if index % CV_FOLDS != fold:
+                    training_file.write(json.dumps(example, ensure_ascii=False) + "\n")
+        try:
+            classifier = SubjectClassifier(training_file.name)
+        finally:
+            os.remove(training_file.name)
+        for example in shuffled[fold::CV_FOLDS]:
+            predicted, confidence = classifier.predict(example['text'])
+            predictions.append((example['subject_key'], predicted, confidence))
+    return predictions
+
+
+def evaluate_local():
+    classifier = SubjectClassifier(str(EXAMPLES_PATH))
+    results = []
+    start = time.perf_counter()
+    for text, expected in LABELLED_MESSAGES:
+        predicted, confidence = classifier.predict(text)
+        results.append((text, expected, predicted, confidence))
+    latency_ms = (time.perf_counter() - start) * 1000 / len(LABELLED_MESSAGES)
+    return results, latency_ms
+
+
+def evaluate_ai():
+    results = []
+    start = time.perf_counter()
+    for text, expected in LABELLED_MESSAGES:
+        predicted = ModelManager._detect_subject_with_ai(f"CONTESTO CHAT:\nuser: {text}\n\nFILE ANALIZZATI:\n")
+        results.append((text, expected, predicted))
+    latency_ms = (time.perf_counter() - start) * 1000 / len(LABELLED_MESSAGES)
+    return results, latency_ms
+
+
+def main():
+    examples = load_examples()
+    overlap = {example['text'] for example in examples} & {text for text, _ in LABELLED_MESSAGES}
+    assert not overlap, f"Messaggi di valutazione presenti anche tra gli esempi di addestramento: {overlap}"
+
+    print(f"--- VALIDAZIONE INCROCIATA ({CV_FOLDS} parti, {len(examples)} esempi) ---")
+    cv_predictions = cross_validate(examples)
+    for threshold in CV_THRESHOLDS:
+        accepted = [(expected, predicted) for expected, predicted, confidence in cv_predictions
+                    if predicted != "generale" and confidence >= threshold]
+        accepted_correct = sum(1 for expected, predicted in accepted if expected == predicted)
+        precision = accepted_correct / len(accepted) if accepted else 0.0
+        print(f"Soglia {threshold:.2f}: precisione {accepted_correct}/{len(accepted)} ({precision:.0%}), "
+              f"copertura {len(accepted) / len(cv_predictions):.0%}")
+    print()
+
+    local_results, local_latency = evaluate_local()
+    print(f"{'Atteso':<30} {'Locale':<30} {'Conf.':>5}  Testo")
+    for text, expected, predicted, confidence in local_results:
+        marker = " " if predicted == expected else "✗"
+        print(f"{expected:<30} {predicted:<30} {confidence:>5.2f} {marker} {text}")
+
+    total = len(local_results)
+    correct = sum(1 for _, expected, predicted, _ in local_results if predicted == expected)
+    confident = [r for r in local_results if SubjectClassifier.is_reliable(r[2], r[3])]
+    confident_correct = sum(1 for _, expected, predicted, _ in confident if predicted == expected)
+
+    # Conta solo quello che il percorso locale risolve davvero: il resto passa al modello
+    print("\n--- PERCORSO LOCALE ---")
+    if confident:
+        print(f"Accuratezza sui risolti:   {confident_correct}/{len(confident)} ({confident_correct / len(confident):.0%})")
+    print(f"Risolti in locale (≥{SUBJECT_LOCAL_MIN_CONFIDENCE:.2f}): {len(confident)}/{total} ({len(confident) / total:.0%})")
+    print(f"Accuratezza complessiva:   {correct}/{total} ({correct / total:.0%}, incluse le previsioni sotto soglia)")
+    print(f"Latenza media:             {local_latency:.3f} ms/messaggio")
+
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        print("\nGOOGLE_API_KEY non impostata: confronto con il percorso AI saltato.")
+        return
+
+    genai.configure(api_key=api_key)
+    ai_results, ai_latency = evaluate_ai()
+    ai_correct = sum(1 for _, expected, predicted in ai_results if predicted == expected)
+    hybrid_correct = sum(
+        1 for (_, expected, local_pred, confidence), (_, _, ai_pred) in zip(local_results, ai_results)
+        if (local_pred if SubjectClassifier.is_reliable(local_pred, confidence) else ai_pred) == expected
+    )
+    print("\n--- PERCORSO AI ---")
+    print(f"Accuratezza:               {ai_correct}/{total} ({ai_correct / total:.0%})")
+    print(f"Latenza media:             {ai_latency:.0f} ms/messaggio")
+    print("\n--- PERCORSO IBRIDO ---")
+    print(f"Accuratezza:               {hybrid_correct}/{total} ({hybrid_correct / total:.0%})")
+    print(f"Chiamate AI evitate:       {len(confident)}/{total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "generale": {
         "display_name": "🧠 Generale / Interdisciplinare",
         "description": "Approccio bilanciato per argomenti di base o che collegano più materie.",
+        "keywords": "studio, metodo di studio, ripasso, compiti, verifica, interrogazione, riassunto, mappa concettuale, collegamenti interdisciplinari, esame di maturità",
         "temperature": 0.7,
         "top_k": 40,
         "methodology_template": """
@@ -35,6 +36,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "logico_matematica": {
         "display_name": "🧮 Logica e Matematica",
         "description": "Matematica, Logica, Statistica. Massima enfasi su rigore, astrazione e deduzione.",
+        "keywords": "equazione, disequazione, funzione, derivata, integrale, limite, frazione, polinomio, teorema, dimostrazione, geometria, triangolo, Pitagora, probabilità, statistica, media, logaritmo, matrice, insieme, calcolo",
         "temperature": 0.2,
         "top_k": 15,
         "methodology_template": """
@@ -64,6 +66,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "scienze_pure": {
         "display_name": "🔬 Scienze Pure",
         "description": "Fisica, Chimica, Biologia, Scienze della Terra. Focus sul metodo scientifico e la modellizzazione.",
+        "keywords": "fisica, chimica, biologia, cellula, DNA, fotosintesi, mitosi, atomo, molecola, reazione chimica, energia, forza, velocità, accelerazione, gravità, termodinamica, evoluzione, genetica, pianeta, vulcano",
         "temperature": 0.5,
         "top_k": 35,
         "methodology_template": """
@@ -93,6 +96,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "discipline_tecnologiche": {
         "display_name": "💻 Discipline Tecnologiche",
         "description": "Informatica, Elettronica, Meccanica, Sistemi e Reti. Focus su progettazione e problem-solving pratico.",
+        "keywords": "programmazione, codice, Python, Java, algoritmo, ciclo for, variabile, database, rete, protocollo, server, circuito, elettronica, resistenza, microcontrollore, Arduino, software, debug, sistema operativo, cybersecurity",
         "temperature": 0.4,
         "top_k": 30,
         "methodology_template": """
@@ -122,6 +126,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "storico_filosofiche": {
         "display_name": "🏛️ Discipline Storico-Filosofiche",
         "description": "Storia, Filosofia, Scienze Umane. Focus sull'analisi delle fonti e l'argomentazione.",
+        "keywords": "storia, guerra, impero, Roma, rivoluzione, medioevo, Rinascimento, Risorgimento, guerra mondiale, fonte storica, filosofia, Platone, Aristotele, Kant, Hegel, Nietzsche, etica, pedagogia, sociologia, antropologia",
         "temperature": 0.8,
         "top_k": 45,
         "methodology_template": """
@@ -151,6 +156,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "giuridico_economiche": {
         "display_name": "⚖️ Discipline Giuridico-Economiche",
         "description": "Diritto, Economia, Finanza. Focus sull'interpretazione di norme e modelli.",
+        "keywords": "diritto, legge, Costituzione, articolo, contratto, norma, tribunale, economia, mercato, domanda, offerta, inflazione, PIL, finanza, banca, impresa, bilancio, tasse, moneta, parlamento",
         "temperature": 0.6,
         "top_k": 40,
         "methodology_template": """
@@ -180,6 +186,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "letteratura": {
         "display_name": "📚 Letteratura",
         "description": "Italiano, Latino, Greco, Lingue Straniere (analisi letteraria). Focus sull'interpretazione critica.",
+        "keywords": "letteratura, poesia, romanzo, autore, Dante, Divina Commedia, Petrarca, Leopardi, Manzoni, Verga, Pascoli, Montale, Ungaretti, Pirandello, Svevo, Omero, Virgilio, latino, greco, figura retorica, metrica",
         "temperature": 0.85,
         "top_k": 50,
         "methodology_template": """
@@ -209,6 +216,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "linguistica_e_grammatica": {
         "display_name": "🗣️ Linguistica e Grammatica",
         "description": "Grammatica, Sintassi, Analisi del periodo, Fonetica. Focus sull'analisi strutturale della lingua.",
+        "keywords": "grammatica, sintassi, analisi logica, analisi del periodo, soggetto, predicato, complemento, verbo, congiuntivo, proposizione subordinata, pronome, aggettivo, ortografia, accento, punteggiatura, fonetica, morfologia",
         "temperature": 0.4,
         "top_k": 30,
         "methodology_template": """
@@ -238,6 +246,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "discipline_artistiche_visive": {
         "display_name": "🎨 Discipline Artistiche Visive",
         "description": "Storia dell'Arte, Disegno, Grafica, Design. Focus su analisi formale e linguaggio visuale.",
+        "keywords": "arte, pittura, scultura, architettura, dipinto, quadro, Caravaggio, Michelangelo, Leonardo, Barocco, Impressionismo, prospettiva, colore, composizione, disegno, grafica, design, logo, museo",
         "temperature": 0.9,
         "top_k": 55,
         "methodology_template": """
@@ -267,6 +276,7 @@ SUBJECT_METHODOLOGY_CONFIGS = {
     "musicali": {
         "display_name": "🎵 Discipline Musicali",
         "description": "Analisi di teoria, armonia, storia della musica e brani audio.",
+        "keywords": "musica, brano, canzone, accordo, armonia, melodia, ritmo, tonalità, scala, pentagramma, nota, spartito, strumento, pianoforte, chitarra, orchestra, sinfonia, sonata, Mozart, Beethoven, Bach",
         "temperature": 0.75,
         "top_k": 45,
         "methodology_template": """
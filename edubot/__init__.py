@@ -0,0 +1,6 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Pacchetto dell'applicazione.
+# Streamlit riesegue a ogni interazione solo lo script di ingresso (app.py):
+# moduli, classi e risorse condivise del pacchetto vengono caricati una sola
+# volta per processo.
+# -----------------------------------------------------------------------------
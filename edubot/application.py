@@ -0,0 +1,89 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Applicazione EduBot: componenti della sessione e ciclo di rerun.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import time
+import logging
+
+from edubot.settings import DEPLOYMENT_MODE, PACKAGE_IMPORT_STARTED, SERVER_API_KEY, STARTUP_METRICS
+from edubot.configuration import ConfigurationManager, FileManager
+from edubot.models import ModelManager
+from edubot.files import FileAnalyzer
+from edubot.session import SessionManager
+from edubot.ui import InformativeManager, StyleManager, UserInterface
+
+logger = logging.getLogger(__name__)
+
+
+class EduBotApplication:
+    """Classe principale dell'applicazione EduBot."""
+    def __init__(self):
+        self.session_manager = SessionManager()
+        self.config_manager = ConfigurationManager()
+        self.file_manager = FileManager()
+        self.model_manager = ModelManager(self.config_manager)
+        self.file_analyzer = FileAnalyzer(self.model_manager)
+        self.informative_manager = InformativeManager(DEPLOYMENT_MODE)
+        self.style_manager = StyleManager()
+        self.ui = UserInterface(
+            self.session_manager, self.config_manager, self.model_manager,
+            self.file_analyzer, self.informative_manager, self.file_manager
+        )
+
+    def run(self):
+        """Funzione principale dell'applicazione."""
+        rerun_start = time.perf_counter()
+        self.style_manager.inject_custom_css()
+        if 'session_start_time' not in st.session_state:
+            self.session_manager.initialize_session_state()
+
+        if self.session_manager.check_session_timeout():
+            st.warning("⏰ Sessione scaduta. Reset in corso.")
+            time.sleep(2)
+            self.session_manager.reset_session()
+        self.session_manager.mark_activity()
+
+        if DEPLOYMENT_MODE == "server" and not SERVER_API_KEY:
+            st.error("❌ ERRORE CRITICO: Chiave API del server non configurata.")
+            st.stop()
+        
+        if not st.session_state.get("api_key_configured", False) or not st.session_state.get("final_privacy_accepted", False):
+            setup_steps = {
+                "welcome": self.ui.show_welcome_content,
+                "informative": self.ui.show_informative_sequential,
+                "api_key": self.ui.gestore_setup_chiave_api,
+                "final_privacy": self.ui.show_final_privacy_content,
+            }
+            current_step = st.session_state.get("setup_step", "welcome")
+            step_function = setup_steps.get(current_step, self.ui.show_welcome_content)
+            step_function()
+        else:
+            active_tab = self.ui.main_interface()
+            if active_tab:
+                self.ui.record_rerun_metrics(active_tab, time.perf_counter() - rerun_start)
+
+
+def get_application() -> EduBotApplication:
+    """
+    Restituisce l'applicazione della sessione, creandola al primo rerun: i gestori non vengono
+    ricostruiti a ogni interazione. Le risorse condivise tra sessioni restano nei getter con st.cache_resource.
+    """
+    if st.session_state.get("edubot_application") is None:
+        setup_start = time.perf_counter()
+        st.session_state.edubot_application = EduBotApplication()
+        st.session_state.application_setup_time = time.perf_counter() - setup_start
+    return st.session_state.edubot_application
+
+
+def main():
+    """Punto di ingresso dell'applicazione, eseguito a ogni rerun dallo script app.py."""
+    try:
+        get_application().run()
+    except Exception as e:
+        logger.error(f"Errore critico nell'applicazione: {e}")
+        st.error(f"❌ Errore critico: {e}. Ricarica la pagina.")
+
+
+STARTUP_METRICS['package_import'] = time.perf_counter() - PACKAGE_IMPORT_STARTED
+logger.info(f"🚀 Pacchetto edubot caricato in {STARTUP_METRICS['package_import'] * 1000:.0f}ms")
@@ -0,0 +1,221 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Contesto delle conversazioni, generazione speculativa e visualizzazione dei messaggi.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import google.generativeai as genai
+import time
+import uuid
+import logging
+import re
+import threading
+import queue
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple, Iterator
+
+from edubot.settings import (
+    CHAT_RENDER_CACHE_MAX_ENTRIES, CONTEXT_CHARS_PER_TOKEN, CONTEXT_REFILL_RATIO, CONTEXT_SUMMARY_MAX_TOKENS
+)
+from edubot.models import ModelManager
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationContextManager:
+    """
+    Costruisce il contesto di ogni richiesta entro un budget di token.
+    I turni più recenti vengono inviati testualmente, quelli più vecchi confluiscono in un riepilogo
+    aggiornato in modo incrementale. La cronologia completa resta in sessione per la visualizzazione.
+    """
+    SUMMARY_PROMPT = """
+        Sei l'assistente di EduBot, un tutor didattico. Il tuo compito è mantenere aggiornato il riepilogo
+        di una conversazione tra uno studente ed EduBot, in modo che il tutor possa proseguire senza rileggerla.
+
+        REGOLE:
+        - Integra il riepilogo esistente con i nuovi turni, senza perdere le informazioni ancora utili.
+        - Conserva argomenti trattati, dubbi dello studente, esercizi svolti e risultati, file analizzati e impegni presi.
+        - Scrivi in italiano, in forma di elenco puntato sintetico.
+        - Non aggiungere commenti né informazioni che non compaiono nella conversazione.
+        """
+    SUMMARY_ACKNOWLEDGEMENT = "Ricevuto: proseguo la conversazione tenendo conto di questo riepilogo."
+
+    def __init__(self, token_budget: int, summary_max_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS,
+                 refill_ratio: float = CONTEXT_REFILL_RATIO):
+        self.token_budget = token_budget
+        self.summary_max_tokens = summary_max_tokens
+        self.refill_ratio = refill_ratio
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Stima approssimativa dei token di un testo."""
+        return -(-len(text) // CONTEXT_CHARS_PER_TOKEN)
+
+    @classmethod
+    def message_tokens(cls, message: Dict) -> int:
+        """Stima i token di un messaggio della cronologia."""
+        return sum(cls.estimate_tokens(part.get('text', '')) for part in message['parts'])
+
+    def build(self, history: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """Restituisce i contenuti da inviare al modello e le statistiche sui token prima/dopo."""
+        state = st.session_state.setdefault("context_summary", {"text": "", "covered_messages": 0})
+        if state['covered_messages'] > len(history):
+            # La cronologia è stata azzerata: il riepilogo non è più valido
+            state.update(text="", covered_messages=0)
+
+        message_tokens = [self.message_tokens(message) for message in history]
+        tokens_before = sum(message_tokens)
+        start = state['covered_messages']
+        verbatim_start = start
+
+        if self.estimate_tokens(state['text']) + sum(message_tokens[start:]) > self.token_budget:
+            # Si riassume fino a scendere sotto la quota di riempimento, così il riepilogo
+            # non va aggiornato a ogni turno ma solo quando il budget torna a esaurirsi
+            verbatim_budget = int((self.token_budget - self.summary_max_tokens) * self.refill_ratio)
+            split = len(history) - 1 # L'ultimo messaggio viene sempre inviato testualmente
+            used_tokens = message_tokens[split]
+            while split > start and used_tokens + message_tokens[split - 1] <= verbatim_budget:
+                split -= 1
+                used_tokens += message_tokens[split]
+            if split > start:
+                if self._fold_into_summary(state, history[start:split]):
+                    start = verbatim_start = state['covered_messages']
+                else:
+                    # Riepilogo non aggiornato: i turni restano da riassumere al prossimo tentativo,
+                    # ma questa richiesta invia solo quelli che rientrano nel budget
+                    verbatim_start = split
+
+        contents = []
+        if state['text']:
+            contents.append({'role': 'user', 'parts': [{'text': f"RIEPILOGO DELLA CONVERSAZIONE PRECEDENTE:\n{state['text']}"}]})
+            contents.append({'role': 'model', 'parts': [{'text': self.SUMMARY_ACKNOWLEDGEMENT}]})
+        contents.extend(ModelManager.build_request_contents(history[verbatim_start:]))
+
+        stats = {
+            'tokens_before': tokens_before,
+            'tokens_after': sum(self.message_tokens(message) for message in contents),
+            'summarized_messages': start
+        }
+        return contents, stats
+
+    def _fold_into_summary(self, state: Dict, messages: List[Dict]) -> bool:
+        """Integra i messaggi indicati nel riepilogo esistente. Restituisce False se l'aggiornamento non riesce."""
+        transcript = "\n".join(
+            f"{'Studente' if message['role'] == 'user' else 'EduBot'}: "
+            f"{' '.join(part.get('text', '') for part in message['parts'])}"
+            for message in messages
+        )
+        try:
+            state['text'] = self._summarize_with_ai(state['text'], transcript, self.summary_max_tokens)
+        except Exception as e:
+            # I messaggi non vengono segnati come riassunti: altrimenti sparirebbero dal contesto
+            logger.error(f"Errore durante l'aggiornamento del riepilogo: {e}")
+            return False
+        state['covered_messages'] += len(messages)
+        logger.info(f"📝 Riepilogo aggiornato con {len(messages)} messaggi")
+        return True
+
+    @classmethod
+    def _summarize_with_ai(cls, previous_summary: str, transcript: str, max_tokens: int) -> str:
+        """Aggiorna il riepilogo con un modello veloce."""
+        summary_model = genai.GenerativeModel('gemini-1.5-flash')
+        response = summary_model.generate_content(
+            f"{cls.SUMMARY_PROMPT}\n\n--- RIEPILOGO ESISTENTE ---\n{previous_summary or 'Nessuno.'}"
+            f"\n\n--- NUOVI TURNI DA INTEGRARE ---\n{transcript}",
+            generation_config=genai.types.GenerationConfig(temperature=0.0, max_output_tokens=max_tokens)
+        )
+        return response.text.strip()
+
+
+class SpeculativeGeneration:
+    """
+    Generazione della risposta avviata in parallelo alla verifica di sicurezza AI.
+    I frammenti vengono accumulati in una coda e rilasciati all'interfaccia solo dopo
+    un verdetto positivo; in caso di minaccia la generazione viene interrotta e scartata.
+    Il thread di lavoro non accede mai a st.session_state.
+    """
+    _END_OF_STREAM = object()
+
+    def __init__(self, model: genai.GenerativeModel, contents: List[Dict]):
+        self.start_time = time.perf_counter()
+        self.first_token_time: Optional[float] = None
+        self.total_time: Optional[float] = None
+        self.chunks: List[str] = []
+        self.error: Optional[Exception] = None
+        self._queue: "queue.Queue" = queue.Queue()
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(model, contents), daemon=True)
+        self._thread.start()
+
+    def _run(self, model: genai.GenerativeModel, contents: List[Dict]):
+        try:
+            response = model.generate_content(contents, stream=True)
+            for chunk_text in ModelManager.iter_response_text(response):
+                if self._cancelled.is_set():
+                    return # Il resto della risposta non verrà mai mostrato
+                if self.first_token_time is None:
+                    self.first_token_time = time.perf_counter() - self.start_time
+                self._queue.put(chunk_text)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.total_time = time.perf_counter() - self.start_time
+            self._queue.put(self._END_OF_STREAM)
+
+    def cancel(self):
+        """Interrompe la generazione: i frammenti già ricevuti vengono scartati."""
+        self._cancelled.set()
+        logger.info("🛑 Generazione speculativa annullata dopo il verdetto di sicurezza.")
+
+    def iter_chunks(self) -> Iterator[str]:
+        """Rilascia i frammenti generati (da chiamare solo dopo un verdetto positivo)."""
+        while True:
+            item = self._queue.get()
+            if item is self._END_OF_STREAM:
+                break
+            self.chunks.append(item)
+            yield item
+        if self.error:
+            raise self.error
+
+
+class ChatRenderCache:
+    """
+    Testo dei messaggi della chat già preparato per la visualizzazione, indicizzato per id del messaggio.
+    Ogni messaggio viene elaborato una sola volta: nei rerun successivi si riusa il testo in cache.
+    """
+    _code_pattern = re.compile(r"(```.*?```|`[^`\n]*`)", re.DOTALL)
+    _display_math_pattern = re.compile(r"\\\[(.+?)\\\]", re.DOTALL)
+    _inline_math_pattern = re.compile(r"\\\((.+?)\\\)", re.DOTALL)
+
+    def __init__(self, max_entries: int = CHAT_RENDER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    @staticmethod
+    def message_id(message: Dict) -> str:
+        """Restituisce l'id del messaggio, assegnandolo la prima volta che il messaggio viene mostrato."""
+        return message.setdefault('id', uuid.uuid4().hex)
+
+    @classmethod
+    def prepare(cls, text: str) -> str:
+        """
+        Converte le formule LaTeX delimitate da \\( \\) e \\[ \\], frequenti nelle risposte del modello,
+        nei delimitatori $ e $$ supportati da st.markdown. Il codice resta invariato.
+        """
+        segments = cls._code_pattern.split(text)
+        for position in range(0, len(segments), 2):
+            segment = cls._display_math_pattern.sub(lambda match: f"\n$$\n{match.group(1).strip()}\n$$\n", segments[position])
+            segments[position] = cls._inline_math_pattern.sub(lambda match: f"${match.group(1).strip()}$", segment)
+        return "".join(segments)
+
+    def get(self, message: Dict) -> str:
+        """Restituisce il testo del messaggio pronto per st.markdown."""
+        key = self.message_id(message)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        rendered = self.prepare(message['parts'][0]['text'])
+        self._entries[key] = rendered
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return rendered
@@ -0,0 +1,135 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Caricamento dei file di configurazione (icona, template del prompt) e delle metodologie.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import logging
+import re
+import os
+from pathlib import Path
+from typing import Optional, Dict
+from io import BytesIO
+from PIL import Image
+
+from edubot.settings import (
+    ICON_THUMBNAIL_COLORS, ICON_THUMBNAIL_PX, MODEL_CONFIGS, PEDAGOGICAL_PRINCIPLES, SUBJECT_METHODOLOGY_CONFIGS
+)
+
+logger = logging.getLogger(__name__)
+
+
+class FileManager:
+    """Gestione dei file e delle icone personalizzate."""
+    @staticmethod
+    @st.cache_data
+    def load_icon_thumbnail(icon_filename: str = "icon.png", max_edge: int = ICON_THUMBNAIL_PX) -> Optional[bytes]:
+        """Carica un'icona e ne genera una miniatura PNG a tavolozza di pochi KB."""
+        try:
+            if os.path.exists(icon_filename):
+                with Image.open(icon_filename) as image:
+                    thumbnail = image.convert("RGBA")
+                thumbnail.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+                buffer = BytesIO()
+                thumbnail.quantize(colors=ICON_THUMBNAIL_COLORS, method=Image.Quantize.FASTOCTREE).save(buffer, format='PNG', optimize=True)
+                return buffer.getvalue()
+        except Exception as e:
+            logger.error(f"Errore caricamento icona: {e}")
+        return None
+
+    @staticmethod
+    @st.cache_data(ttl=3600)
+    def load_base_template_from_file(file_path: str) -> str:
+        """Carica il template di base dal file prompt.md, con fallback sicuri."""
+        try:
+            prompt_file = Path(file_path)
+            if prompt_file.exists():
+                with open(prompt_file, 'r', encoding='utf-8') as f:
+                    base_template = f.read()
+                # Verifica la presenza dei placeholder essenziali
+                required_keys = ["{base_methodology}", "{user_topics}"]
+                if all(key in base_template for key in required_keys):
+                    logger.info(f"✅ Template del prompt caricato correttamente da '{file_path}'.")
+                    return base_template
+                else:
+                    logger.error(f"❌ File '{file_path}' non contiene i segnaposto dinamici essenziali.")
+                    return "ERRORE: Template non valido. Contattare l'amministratore."
+            else:
+                logger.error(f"❌ File prompt '{file_path}' non trovato.")
+                return "ERRORE: File template non trovato. Contattare l'amministratore."
+        except Exception as e:
+            logger.error(f"❌ Errore critico nel caricamento di '{file_path}': {e}")
+            return "ERRORE: Impossibile caricare il template. Contattare l'amministratore."
+
+
+class ConfigurationManager:
+    """Gestore delle configurazioni metodologiche e dei modelli."""
+    @staticmethod
+    def get_methodology_config(subject_key: str) -> Dict:
+        """Ottiene la configurazione metodologica per la materia selezionata in modo sicuro."""
+        return SUBJECT_METHODOLOGY_CONFIGS.get(subject_key, SUBJECT_METHODOLOGY_CONFIGS["generale"])
+
+    @staticmethod
+    def subject_options_for_prompt() -> str:
+        """Elenco delle materie disponibili, nel formato usato dai prompt dei classificatori."""
+        return "\n".join(f"- Chiave: '{key}', Nome: '{config['display_name']}'" for key, config in SUBJECT_METHODOLOGY_CONFIGS.items())
+
+    @staticmethod
+    def get_model_config(model_name: str, subject_type: str = "generale") -> Dict:
+        """Ottiene la configurazione del modello con parametri dinamici per materia."""
+        base_config = MODEL_CONFIGS.get(model_name, MODEL_CONFIGS["gemini-2.5-flash"])
+        if subject_type in base_config.get("subject_configs", {}):
+            subject_config = base_config["subject_configs"][subject_type]
+            config = base_config.copy()
+            config.update(subject_config)
+            return config
+        return base_config
+
+    # All'interno della classe ConfigurationManager
+    
+    def build_dynamic_system_prompt(self, base_template: str) -> str:
+        """Costruisce il system prompt dinamico con sezioni personalizzabili."""
+        if "ERRORE" in base_template:
+            st.error(base_template)
+            return "Sei un assistente AI. A causa di un errore di configurazione, rispondi brevemente."
+
+        selected_subject = st.session_state.get("selected_subject_methodology", "generale")
+        methodology_config = self.get_methodology_config(selected_subject)
+        
+        # Gestione sezioni personalizzabili dall'editor
+        custom_sections = st.session_state.get("custom_prompt_sections", {})
+        
+        # Gestione principi pedagogici aggiuntivi
+        custom_methodology_parts = []
+        selected_principles = st.session_state.get("custom_pedagogical_principles", [])
+        if selected_principles:
+            custom_methodology_parts.append("**PRINCIPI PEDAGOGICI INTEGRATIVI:**")
+            for key in selected_principles:
+                principle = PEDAGOGICAL_PRINCIPLES.get(key)
+                if principle:
+                    custom_methodology_parts.append(f"- **{principle['name']}:** {principle['principle']}")
+        
+        user_methodology_text = st.session_state.get("custom_methodology_text", "")
+        if user_methodology_text:
+            custom_methodology_parts.append("**PRINCIPI PERSONALIZZATI:**")
+            custom_methodology_parts.append(user_methodology_text)
+
+        # Pre-processa il template per le sezioni custom prima del format principale
+        final_template = base_template
+        if custom_sections.get('ruolo_personalita'):
+            final_template = re.sub(r'## 1\.\s*IDENTITÀ E MISSIONE FONDAMENTALE.*?(?=## 2\.|$)', f"## 1. IDENTITÀ E MISSIONE FONDAMENTALE\n{custom_sections['ruolo_personalita']}\n", final_template, 1, re.DOTALL | re.IGNORECASE)
+        if custom_sections.get('obiettivi_comportamento'):
+             final_template = re.sub(r'## 5\.\s*REGOLE ASSOLUTE E PROTOCOLLO DI SICUREZZA.*?(?=## 6\.|$)', f"## 5. REGOLE ASSOLUTE E PROTOCOLLO DI SICUREZZA\n{custom_sections['obiettivi_comportamento']}\n", final_template, 1, re.DOTALL | re.IGNORECASE)
+
+        try:
+            # VERSIONE CORRETTA: Le chiavi 'methodology_section' e 
+            # 'specific_methodology_section' sono state rimosse.
+            return final_template.format(
+                subject_methodology_type=methodology_config['display_name'],
+                base_methodology=custom_sections.get('metodologia_base') or methodology_config['methodology_template'],
+                custom_methodology="\n".join(custom_methodology_parts) if custom_methodology_parts else "Nessuno.",
+                user_topics=st.session_state.get("user_topics", "Nessun argomento specifico fornito.")
+            )
+        except KeyError as e:
+            logger.error(f"❌ Errore nel popolare il template: manca la chiave {e}")
+            st.error(f"Errore di configurazione del prompt: chiave '{e}' mancante nel file prompt.md.")
+            return "Errore nella configurazione del prompt."
@@ -0,0 +1,474 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Documenti della sessione: caricamento, estrazione del testo e ricerca dei passaggi.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import google.generativeai as genai
+import time
+import hashlib
+import uuid
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, List, Tuple, Iterator
+from io import BytesIO
+from PyPDF2 import PdfReader
+import numpy as np
+
+from edubot.settings import (
+    DOCUMENT_BACKEND, DOCUMENT_CACHE_MIN_TTL, DOCUMENT_SWEEP_INTERVAL, PDF_TEXT_ONLY_MIN_CHARS_PER_PAGE, PDF_VERSION_MIN_PAGE_CHARS,
+    RETRIEVAL_CHUNK_CHARS, RETRIEVAL_TOP_K
+)
+from edubot.text_processing import ItalianTextProcessor
+from edubot.models import ModelManager
+
+logger = logging.getLogger(__name__)
+
+
+class GeminiDocumentBackend:
+    """Backend reale: Files API per i documenti e context caching per il contesto condiviso della chat."""
+    def __init__(self):
+        self.caches: Dict[str, genai.caching.CachedContent] = {}
+
+    def upload(self, name: str, mime_type: str, data: bytes) -> Dict:
+        uploaded = genai.upload_file(BytesIO(data), mime_type=mime_type, display_name=name)
+        # Audio e video vengono elaborati in modo asincrono: il riferimento è utilizzabile solo a elaborazione conclusa
+        while uploaded.state.name == "PROCESSING":
+            time.sleep(1)
+            uploaded = genai.get_file(uploaded.name)
+        if uploaded.state.name == "FAILED":
+            raise ValueError(f"Elaborazione del file '{name}' non riuscita")
+        return {'handle': uploaded.name, 'uri': uploaded.uri}
+
+    def delete(self, handle: str):
+        genai.delete_file(handle)
+
+    def create_cache(self, model_name: str, system_prompt: str, file_parts: List[Dict], ttl_seconds: int) -> str:
+        cache = genai.caching.CachedContent.create(
+            model=model_name,
+            display_name=f"edubot-{st.session_state.get('anonymous_session_id', 'sessione')}",
+            system_instruction=system_prompt,
+            contents=[{'role': 'user', 'parts': file_parts}],
+            ttl=ttl_seconds
+        )
+        self.caches[cache.name] = cache
+        return cache.name
+
+    def model_from_cache(self, cache_name: str, base_model: genai.GenerativeModel, generation_config, safety_settings) -> genai.GenerativeModel:
+        return genai.GenerativeModel.from_cached_content(
+            self.caches[cache_name], generation_config=generation_config, safety_settings=safety_settings
+        )
+
+    def delete_cache(self, cache_name: str):
+        cache = self.caches.pop(cache_name, None)
+        if cache:
+            cache.delete()
+
+
+class LocalDocumentBackend:
+    """
+    Backend locale che simula Files API e context caching senza rete.
+    Serve a provare offline il ciclo di vita dei riferimenti (caricamento, cache, scadenza, eliminazione):
+    il modello restituito per il contesto in cache è quello di partenza.
+    """
+    def __init__(self):
+        self.files: Dict[str, Dict] = {}
+        self.caches: Dict[str, Dict] = {}
+
+    def upload(self, name: str, mime_type: str, data: bytes) -> Dict:
+        handle = f"files/local-{hashlib.sha256(data).hexdigest()[:16]}"
+        self.files[handle] = {'name': name, 'mime_type': mime_type, 'size': len(data)}
+        return {'handle': handle, 'uri': f"local://{handle}"}
+
+    def delete(self, handle: str):
+        self.files.pop(handle, None)
+
+    def create_cache(self, model_name: str, system_prompt: str, file_parts: List[Dict], ttl_seconds: int) -> str:
+        cache_name = f"cachedContents/local-{uuid.uuid4().hex[:12]}"
+        self.caches[cache_name] = {
+            'model': model_name, 'system_prompt': system_prompt,
+            'file_parts': file_parts, 'expires_at': time.time() + ttl_seconds
+        }
+        return cache_name
+
+    def model_from_cache(self, cache_name: str, base_model: genai.GenerativeModel, generation_config, safety_settings) -> genai.GenerativeModel:
+        return base_model
+
+    def delete_cache(self, cache_name: str):
+        self.caches.pop(cache_name, None)
+
+
+def create_document_backend():
+    """Crea il backend dei documenti indicato da DOCUMENT_BACKEND."""
+    return LocalDocumentBackend() if DOCUMENT_BACKEND == "local" else GeminiDocumentBackend()
+
+
+class DocumentStore:
+    """
+    Riferimenti ai documenti caricati nella sessione corrente, indicizzati per hash del contenuto.
+    Ogni file viene caricato una sola volta: l'analisi e i turni di chat successivi lo richiamano
+    tramite riferimento, oppure tramite un contesto in cache che include anche il prompt di sistema.
+    Il nome è solo un'etichetta: una nuova versione con lo stesso nome sostituisce la precedente.
+    File e cache scadono insieme alla sessione.
+    """
+    DOCUMENTS_ACKNOWLEDGEMENT = "Ricevuto: userò questi documenti per rispondere alle domande dello studente."
+
+    def __init__(self, backend, expires_at: float):
+        self.backend = backend
+        self.expires_at = expires_at
+        self.documents: Dict[str, Dict] = {}
+        self.cache_name: Optional[str] = None
+        self.cache_key: Optional[Tuple] = None
+        self.failed_cache_key: Optional[Tuple] = None
+        self._lock = threading.RLock() # La pulizia dei documenti scaduti può arrivare dal thread del registro
+
+    @staticmethod
+    def file_part(document: Dict) -> Dict:
+        """Parte di contenuto che richiama il documento tramite riferimento."""
+        return {'file_data': {'mime_type': document['mime_type'], 'file_uri': document['uri']}}
+
+    def add(self, name: str, mime_type: str, data: bytes) -> Optional[Dict]:
+        """Carica il documento (se non già presente) e ne restituisce il riferimento, oppure None in caso di errore."""
+        self.purge_expired()
+        content_hash = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if content_hash in self.documents:
+                return self.documents[content_hash]
+            try:
+                reference = self.backend.upload(name, mime_type, data)
+            except Exception as e:
+                logger.warning(f"⚠️ Caricamento di '{name}' non riuscito, il file verrà inviato direttamente: {e}")
+                return None
+            for previous_hash in [key for key, document in self.documents.items() if document['name'] == name]:
+                self._remove(previous_hash) # Versione precedente dello stesso file
+            document = {'name': name, 'mime_type': mime_type, 'hash': content_hash, **reference}
+            self.documents[content_hash] = document
+        logger.info(f"📎 Documento '{name}' caricato ({reference['handle']})")
+        return document
+
+    @contextmanager
+    def temporary_part(self, name: str, mime_type: str, data: bytes) -> Iterator[Dict]:
+        """
+        Carica un file necessario a una sola richiesta (es. un blocco di pagine troppo grande per l'invio
+        diretto) e lo elimina al termine. Non entra tra i documenti della sessione allegati alla chat.
+        """
+        reference = self.backend.upload(name, mime_type, data)
+        try:
+            yield self.file_part({'mime_type': mime_type, **reference})
+        finally:
+            try:
+                self.backend.delete(reference['handle'])
+            except Exception as e:
+                logger.warning(f"⚠️ Eliminazione del file temporaneo '{name}' non riuscita: {e}")
+
+    def _remove(self, content_hash: str):
+        """Elimina un documento dal backend e dalla sessione."""
+        document = self.documents.pop(content_hash)
+        try:
+            self.backend.delete(document['handle'])
+            logger.info(f"♻️ Versione precedente di '{document['name']}' sostituita")
+        except Exception as e:
+            logger.warning(f"⚠️ Eliminazione di '{document['name']}' non riuscita: {e}")
+
+    def is_expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+    def purge_expired(self):
+        """Elimina file e cache se la sessione è scaduta."""
+        with self._lock:
+            if self.is_expired() and (self.documents or self.cache_name):
+                logger.info("⌛ Documenti di sessione scaduti")
+                self.clear()
+
+    def clear(self):
+        """Elimina dal backend tutti i file e il contesto in cache della sessione."""
+        with self._lock:
+            self._drop_cache()
+            for document in self.documents.values():
+                try:
+                    self.backend.delete(document['handle'])
+                except Exception as e:
+                    logger.warning(f"⚠️ Eliminazione di '{document['name']}' non riuscita: {e}")
+            self.documents = {}
+            self.failed_cache_key = None
+
+    def prepare_chat_request(self, model: genai.GenerativeModel, contents: List[Dict], model_name: str,
+                             system_prompt: str) -> Tuple[genai.GenerativeModel, List[Dict]]:
+        """Collega i documenti della sessione alla richiesta di chat, tramite cache o riferimenti diretti."""
+        self.purge_expired()
+        if not self.documents:
+            return model, contents
+
+        cache_key = (model_name, hashlib.sha256(system_prompt.encode()).hexdigest(), tuple(sorted(self.documents)))
+        if cache_key not in (self.cache_key, self.failed_cache_key):
+            self._refresh_cache(cache_key, model_name, system_prompt)
+
+        if self.cache_name:
+            generation_config, safety_settings = ModelManager.build_generation_settings(model_name)
+            return self.backend.model_from_cache(self.cache_name, model, generation_config, safety_settings), contents
+
+        # Senza cache (es. documenti sotto la soglia minima di token) i riferimenti viaggiano con la richiesta
+        document_names = ", ".join(document['name'] for document in self.documents.values())
+        document_turn = [
+            {'role': 'user', 'parts': [self.file_part(document) for document in self.documents.values()]
+                                      + [{'text': f"DOCUMENTI CARICATI DALLO STUDENTE: {document_names}"}]},
+            {'role': 'model', 'parts': [{'text': self.DOCUMENTS_ACKNOWLEDGEMENT}]}
+        ]
+        return model, document_turn + contents
+
+    def _refresh_cache(self, cache_key: Tuple, model_name: str, system_prompt: str):
+        """Ricrea il contesto in cache dopo un cambio di documenti, modello o prompt di sistema."""
+        self._drop_cache()
+        ttl_seconds = int(self.expires_at - time.time())
+        if not system_prompt or ttl_seconds < DOCUMENT_CACHE_MIN_TTL:
+            self.failed_cache_key = cache_key
+            return
+        try:
+            file_parts = [self.file_part(document) for document in self.documents.values()]
+            self.cache_name = self.backend.create_cache(model_name, system_prompt, file_parts, ttl_seconds)
+            self.cache_key = cache_key
+            logger.info(f"🗄️ Contesto in cache creato per {len(self.documents)} documenti (scadenza tra {ttl_seconds}s)")
+        except Exception as e:
+            # Il context caching richiede un numero minimo di token: sotto soglia si usano i riferimenti diretti
+            logger.info(f"Contesto in cache non disponibile, uso i riferimenti diretti: {e}")
+            self.failed_cache_key = cache_key
+
+    def _drop_cache(self):
+        if self.cache_name:
+            try:
+                self.backend.delete_cache(self.cache_name)
+            except Exception as e:
+                logger.warning(f"⚠️ Eliminazione del contesto in cache non riuscita: {e}")
+        self.cache_name = None
+        self.cache_key = None
+
+    def get_status(self) -> Dict:
+        return {
+            'documents': len(self.documents),
+            'cached': self.cache_name is not None,
+            'expires_at': self.expires_at
+        }
+
+
+class DocumentStoreRegistry:
+    """
+    Registro dei DocumentStore di tutte le sessioni del processo. Un thread elimina periodicamente
+    file e cache delle sessioni scadute, anche se lo studente ha chiuso la pagina: altrimenti
+    resterebbero sulla Files API fino alla scadenza automatica di Google (circa 48 ore).
+    """
+
+    def __init__(self, sweep_interval: int = DOCUMENT_SWEEP_INTERVAL):
+        self.sweep_interval = sweep_interval
+        self._stores: Dict[str, DocumentStore] = {}
+        self._lock = threading.Lock()
+        self._sweeper = threading.Thread(target=self._sweep_periodically, daemon=True)
+        self._sweeper.start()
+
+    def register(self, session_id: str, store: DocumentStore):
+        """Registra il DocumentStore della sessione (sostituisce quello precedente dopo un reset)."""
+        with self._lock:
+            self._stores[session_id] = store
+        self.sweep_expired()
+
+    def sweep_expired(self) -> int:
+        """Elimina i documenti delle sessioni scadute e restituisce il numero di sessioni liberate."""
+        with self._lock:
+            expired = {session_id: store for session_id, store in self._stores.items() if store.is_expired()}
+            for session_id in expired:
+                del self._stores[session_id]
+        for session_id, store in expired.items():
+            store.purge_expired()
+            logger.info(f"⌛ Documenti della sessione {session_id} eliminati alla scadenza")
+        return len(expired)
+
+    def _sweep_periodically(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep_expired()
+            except Exception as e:
+                logger.warning(f"⚠️ Pulizia dei documenti scaduti non riuscita: {e}")
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {'sessions': len(self._stores)}
+
+
+@st.cache_resource
+def get_document_store_registry() -> DocumentStoreRegistry:
+    """Registro dei documenti condiviso da tutte le sessioni del processo."""
+    return DocumentStoreRegistry()
+
+
+class PdfTextExtractor:
+    """
+    Estrazione locale del testo dei PDF, divisa in passaggi che rispettano pagine e sezioni.
+    Permette di ancorare la chat ai documenti senza reinviarli e di analizzare i PDF
+    di solo testo senza caricarli come file multimediali.
+    """
+    _heading_pattern = re.compile(r"^(?:(?:capitolo|sezione|paragrafo|unita|lezione)\b|\d+(?:\.\d+)*\.?\s+\S)", re.IGNORECASE)
+    _sentence_pattern = re.compile(r"(?<=[.!?])\s+")
+
+    def __init__(self, chunk_chars: int = RETRIEVAL_CHUNK_CHARS):
+        self.chunk_chars = chunk_chars
+
+    @staticmethod
+    def _page_graphics(page) -> List:
+        """Immagini e oggetti grafici della pagina."""
+        resources = page.get('/Resources')
+        xobjects = resources.get_object().get('/XObject') if resources else None
+        if not xobjects:
+            return []
+        xobjects = xobjects.get_object()
+        return [xobjects[name].get_object() for name in xobjects
+                if xobjects[name].get_object().get('/Subtype') in ('/Image', '/Form')]
+
+    @staticmethod
+    def page_fingerprint(page_text: str, graphics: List) -> str:
+        """Impronta della pagina: testo normalizzato più contenuto delle immagini."""
+        fingerprint = hashlib.sha256(ItalianTextProcessor.normalize(page_text).encode("utf-8"))
+        for graphic in graphics:
+            try:
+                fingerprint.update(hashlib.sha256(graphic.get_data()).digest())
+            except Exception:
+                fingerprint.update(b"?") # Immagine non decodificabile: conta solo la sua presenza
+        return fingerprint.hexdigest()
+
+    def extract(self, data: bytes) -> Tuple[List[str], bool, List[str], List[str]]:
+        """
+        Restituisce il testo e l'impronta di ogni pagina, se il documento è di solo testo e le impronte
+        delle pagine distintive: quelle bianche o quasi, comuni a qualunque documento, sono escluse.
+        """
+        reader = PdfReader(BytesIO(data))
+        pages, fingerprints, distinctive_fingerprints, text_only = [], [], [], True
+        for page in reader.pages:
+            page_text = page.extract_text() or ""
+            graphics = self._page_graphics(page)
+            pages.append(page_text)
+            fingerprints.append(self.page_fingerprint(page_text, graphics))
+            if len(page_text.strip()) >= PDF_VERSION_MIN_PAGE_CHARS or graphics:
+                distinctive_fingerprints.append(fingerprints[-1])
+            if len(page_text.strip()) < PDF_TEXT_ONLY_MIN_CHARS_PER_PAGE or graphics:
+                text_only = False
+        return pages, text_only and bool(pages), fingerprints, distinctive_fingerprints
+
+    @classmethod
+    def _is_heading(cls, line: str) -> bool:
+        line = line.strip()
+        if not line or len(line) > 80 or line[-1] in ".,;:":
+            return False
+        letters = [ch for ch in line if ch.isalpha()]
+        return bool(cls._heading_pattern.match(line)) or (len(letters) >= 4 and all(ch.isupper() for ch in letters))
+
+    def _lines(self, page_text: str) -> Iterator[str]:
+        """Righe della pagina; quelle troppo lunghe vengono spezzate a fine frase."""
+        for line in page_text.splitlines():
+            if len(line) <= self.chunk_chars:
+                yield line
+            else:
+                yield from self._sentence_pattern.split(line)
+
+    def split_into_passages(self, document_name: str, pages: List[str]) -> List[Dict]:
+        """Divide le pagine in passaggi: ogni titolo apre un nuovo passaggio, che non supera mai la pagina."""
+        passages = []
+        section = ""
+        for page_number, page_text in enumerate(pages, start=1):
+            buffer: List[str] = []
+            for line in self._lines(page_text):
+                starts_section = self._is_heading(line)
+                if buffer and (starts_section or sum(len(chunk) for chunk in buffer) + len(line) > self.chunk_chars):
+                    passages.append(self._make_passage(document_name, page_number, section, buffer))
+                    buffer = []
+                if starts_section:
+                    section = line.strip()
+                buffer.append(line)
+            if buffer:
+                passages.append(self._make_passage(document_name, page_number, section, buffer))
+        return [passage for passage in passages if passage['text']]
+
+    @staticmethod
+    def _make_passage(document_name: str, page_number: int, section: str, lines: List[str]) -> Dict:
+        return {'document': document_name, 'page': page_number, 'section': section, 'text': "\n".join(lines).strip()}
+
+
+class DocumentRetrievalIndex:
+    """
+    Indice BM25 dei passaggi estratti dai documenti della sessione.
+    A ogni domanda vengono recuperati i passaggi più pertinenti, da allegare alla richiesta.
+    """
+    K1 = 1.5
+    B = 0.75
+    _page_reference_pattern = re.compile(r"\bpag(?:ina|\.)?\s*(\d+)", re.IGNORECASE)
+
+    def __init__(self):
+        self.passages: List[Dict] = []
+        self.passage_lengths = np.zeros(0, dtype=np.float32)
+        self.postings: Dict[str, Tuple[List[int], List[int]]] = {}
+
+    def add_passages(self, passages: List[Dict]):
+        """Aggiunge all'indice i passaggi di un documento."""
+        lengths = []
+        for passage in passages:
+            passage_id = len(self.passages)
+            self.passages.append(passage)
+            tokens = ItalianTextProcessor.stem_tokens(f"{passage['section']} {passage['text']}")
+            lengths.append(len(tokens))
+            term_counts: Dict[str, int] = {}
+            for token in tokens:
+                term_counts[token] = term_counts.get(token, 0) + 1
+            for term, count in term_counts.items():
+                passage_ids, frequencies = self.postings.setdefault(term, ([], []))
+                passage_ids.append(passage_id)
+                frequencies.append(count)
+        self.passage_lengths = np.concatenate([self.passage_lengths, np.array(lengths, dtype=np.float32)])
+
+    def remove_document(self, document_name: str):
+        """Ricostruisce l'indice senza i passaggi del documento indicato."""
+        remaining = [passage for passage in self.passages if passage['document'] != document_name]
+        self.__init__()
+        self.add_passages(remaining)
+
+    def search(self, query: str, top_k: int = RETRIEVAL_TOP_K) -> List[Dict]:
+        """Restituisce i passaggi più pertinenti alla domanda, in ordine di punteggio."""
+        if not self.passages:
+            return []
+        total_passages = len(self.passages)
+        average_length = float(self.passage_lengths.mean()) or 1.0
+        scores = np.zeros(total_passages, dtype=np.float32)
+        for term in set(ItalianTextProcessor.stem_tokens(query)):
+            if term not in self.postings:
+                continue
+            passage_ids, frequencies = self.postings[term]
+            ids = np.array(passage_ids)
+            tf = np.array(frequencies, dtype=np.float32)
+            idf = np.log(1 + (total_passages - len(ids) + 0.5) / (len(ids) + 0.5))
+            length_norm = 1 - self.B + self.B * self.passage_lengths[ids] / average_length
+            scores[ids] += idf * tf * (self.K1 + 1) / (tf + self.K1 * length_norm)
+
+        # Le domande su una pagina precisa ("cosa dice pagina 7?") privilegiano i passaggi di quella pagina
+        requested_pages = {int(page) for page in self._page_reference_pattern.findall(query)}
+        if requested_pages:
+            page_bonus = float(scores.max()) + 1.0
+            for passage_id, passage in enumerate(self.passages):
+                if passage['page'] in requested_pages:
+                    scores[passage_id] += page_bonus
+
+        ranked = np.argsort(-scores)[:top_k]
+        return [self.passages[passage_id] for passage_id in ranked if scores[passage_id] > 0]
+
+    @staticmethod
+    def format_source(passage: Dict) -> str:
+        """Riferimento leggibile al passaggio: documento, pagina ed eventuale sezione."""
+        if passage['page'] is None: # Trascrizioni audio: la sezione indica l'intervallo di tempo
+            return f"{passage['document']} – {passage['section']}"
+        source = f"{passage['document']}, pag. {passage['page']}"
+        return f"{source} – {passage['section']}" if passage['section'] else source
+
+    @classmethod
+    def ground_request(cls, contents: List[Dict], passages: List[Dict]) -> List[Dict]:
+        """Allega i passaggi recuperati all'ultima domanda dello studente."""
+        excerpts = "\n\n".join(f"[{cls.format_source(passage)}]\n{passage['text']}" for passage in passages)
+        grounding_part = {'text': f"ESTRATTI PERTINENTI DAI DOCUMENTI CARICATI:\n{excerpts}\n\nDOMANDA DELLO STUDENTE:"}
+        last_message = contents[-1]
+        return contents[:-1] + [{'role': last_message['role'], 'parts': [grounding_part] + list(last_message['parts'])}]
@@ -0,0 +1,1295 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Analisi dei file caricati: coda di elaborazione, cache e indici condivisi.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import time
+import hashlib
+import uuid
+import logging
+import re
+import os
+import threading
+import queue
+import json
+import wave
+import mmap
+import shutil
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Dict, List, Tuple, Iterable, Iterator
+from io import BytesIO
+from PyPDF2 import PdfReader, PdfWriter
+import numpy as np
+
+from edubot.settings import (
+    ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_BYTES, AUDIO_FULL_QUALITY_SUBJECTS, AUDIO_LONG_MAX_SIZE_MB,
+    AUDIO_LONG_MIN_SECONDS, AUDIO_SEGMENT_SECONDS, AUDIO_VAD_FRAME_MS, FILE_PROCESSING_GLOBAL_LIMIT,
+    FILE_PROCESSING_MAX_WORKERS, IMAGE_HASH_INDEX_MAX_ENTRIES, IMAGE_HASH_MAX_DISTANCE, INLINE_REQUEST_MAX_MB,
+    MAX_AUDIO_SIZE_MB,
+    MAX_IMAGE_SIZE_MB, PDF_MAP_REDUCE_MAX_SIZE_MB, PDF_MAP_REDUCE_MIN_PAGES, PDF_MAX_SIZE_MB, PDF_PAGES_PER_RANGE,
+    PDF_PATCH_MAX_CHANGED_PAGES, PDF_TEXT_ONLY_MAX_CHARS, PDF_VERSION_INDEX_MAX_DOCUMENTS,
+    PDF_VERSION_MIN_SHARED_PAGES, PDF_VERSION_MIN_SHARED_RATIO, RETRIEVAL_CHUNK_CHARS, SESSION_TIMEOUT, SUBJECT_METHODOLOGY_CONFIGS,
+    UPLOAD_MEMORY_BUDGET_MB, UPLOAD_SPOOL_DIR, UPLOAD_SPOOL_MAX_MB
+)
+from edubot.models import ModelManager
+from edubot.documents import DocumentStore, PdfTextExtractor
+from edubot.media import AudioPreprocessor, ImagePreprocessor
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCache:
+    """
+    Cache su disco delle analisi dei file, condivisa da tutte le sessioni del processo.
+    La chiave combina l'hash SHA-256 del contenuto con materia, argomenti e modello, così la stessa
+    dispensa caricata da più studenti viene analizzata una sola volta, anche se rinominata.
+    Lo spazio occupato è limitato: oltre il limite si eliminano le analisi usate meno di recente.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._load_index()
+
+    def _load_index(self):
+        """Ricostruisce l'ordine LRU dai file già presenti, usando la data di ultimo utilizzo."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            stored = sorted(self.cache_dir.glob("*.json"), key=lambda path: path.stat().st_mtime)
+        except OSError as e:
+            logger.warning(f"⚠️ Cache delle analisi non disponibile: {e}")
+            return
+        for path in stored:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self.current_bytes += size
+
+    @staticmethod
+    def make_key(content_hash: str, subject_key: str, user_topics: str, model_name: str) -> str:
+        """Chiave della cache: contenuto del file più il contesto che influenza l'analisi."""
+        key_material = json.dumps([content_hash, subject_key, user_topics, model_name], ensure_ascii=False)
+        return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def get(self, key: str) -> Optional[str]:
+        """Restituisce l'analisi memorizzata, aggiornandone l'ultimo utilizzo."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                path = self._path(key)
+                analysis = json.loads(path.read_text(encoding="utf-8"))['analysis']
+                os.utime(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"⚠️ Voce della cache delle analisi illeggibile, verrà rimossa: {e}")
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return analysis
+
+    def put(self, key: str, analysis: str):
+        """Memorizza un'analisi, eliminando le meno usate oltre il limite di spazio."""
+        payload = json.dumps({'analysis': analysis, 'created_at': time.time()}, ensure_ascii=False).encode("utf-8")
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            path = self._path(key)
+            temp_path = path.with_suffix(".tmp")
+            try:
+                # Scrittura atomica: un'altra sessione non legge mai un file a metà
+                temp_path.write_bytes(payload)
+                os.replace(temp_path, path)
+            except OSError as e:
+                logger.warning(f"⚠️ Impossibile salvare l'analisi in cache: {e}")
+                return
+            self.current_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(payload)
+            self.current_bytes += len(payload)
+            while self.current_bytes > self.max_bytes and self._entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        self.current_bytes -= self._entries.pop(key, 0)
+        try:
+            self._path(key).unlink()
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict:
+        """Restituisce le statistiche di utilizzo della cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+@st.cache_resource
+def get_analysis_cache() -> AnalysisCache:
+    """Cache delle analisi condivisa da tutte le sessioni del processo."""
+    return AnalysisCache(ANALYSIS_CACHE_DIR, ANALYSIS_CACHE_MAX_BYTES)
+
+
+class PdfVersionIndex:
+    """
+    Indice delle impronte di pagina dei PDF analizzati, condiviso da tutte le sessioni del processo.
+    Riconosce una nuova versione di un documento già analizzato (gran parte delle pagine in comune),
+    così da aggiornarne l'analisi invece di rigenerarla. Si confrontano solo le pagine distintive.
+    """
+    # Nome mostrato al posto di quello di un documento caricato in un'altra sessione
+    OTHER_SESSION_LABEL = "un documento già analizzato"
+
+    def __init__(self, max_documents: int = PDF_VERSION_INDEX_MAX_DOCUMENTS, min_shared_ratio: float = PDF_VERSION_MIN_SHARED_RATIO,
+                 min_shared_pages: int = PDF_VERSION_MIN_SHARED_PAGES):
+        self.max_documents = max_documents
+        self.min_shared_ratio = min_shared_ratio
+        self.min_shared_pages = min_shared_pages
+        self._documents: "OrderedDict[str, Tuple[Tuple, frozenset, Optional[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, manifest_key: str, context: Tuple, page_fingerprints: List[str], session_id: Optional[str]):
+        """Ricorda le impronte delle pagine distintive di un documento analizzato e la sessione che lo ha caricato."""
+        with self._lock:
+            self._documents.pop(manifest_key, None)
+            self._documents[manifest_key] = (context, frozenset(page_fingerprints), session_id)
+            while len(self._documents) > self.max_documents:
+                self._documents.popitem(last=False)
+
+    def find_previous(self, page_fingerprints: List[str], context: Tuple, exclude_key: str) -> Optional[Dict]:
+        """
+        Restituisce il documento, analizzato nello stesso contesto, con più pagine in comune e la sessione
+        che lo ha caricato. La quota è calcolata sul più lungo dei due documenti: un documento breve
+        non diventa la "versione precedente" di uno molto più ampio che lo contiene.
+        """
+        current = set(page_fingerprints)
+        best, best_ratio = None, self.min_shared_ratio
+        with self._lock:
+            for manifest_key, (document_context, fingerprints, session_id) in self._documents.items():
+                if manifest_key == exclude_key or document_context != context:
+                    continue
+                shared_pages = len(current & fingerprints)
+                if shared_pages < self.min_shared_pages:
+                    continue
+                shared_ratio = shared_pages / max(len(current), len(fingerprints))
+                if shared_ratio >= best_ratio:
+                    best, best_ratio = {'manifest_key': manifest_key, 'session_id': session_id}, shared_ratio
+        return best
+
+
+@st.cache_resource
+def get_pdf_version_index() -> PdfVersionIndex:
+    """Indice delle versioni dei PDF condiviso da tutte le sessioni del processo."""
+    return PdfVersionIndex()
+
+
+class PerceptualHashIndex:
+    """
+    Indice delle impronte percettive delle immagini analizzate, condiviso da tutte le sessioni.
+    Le impronte sono tenute in un array numpy: la ricerca per distanza di Hamming è un'unica
+    operazione vettoriale (XOR e conteggio dei bit) anche con decine di migliaia di immagini.
+    Un'immagine quasi identica viene cercata solo tra quelle della stessa sessione: due schede
+    uguali con risposte diverse hanno impronte vicine, e tra sessioni diverse si riutilizzano
+    soltanto le analisi con lo stesso contenuto esatto (cache per hash del file).
+    """
+
+    def __init__(self, max_entries: int = IMAGE_HASH_INDEX_MAX_ENTRIES, max_distance: int = IMAGE_HASH_MAX_DISTANCE):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._contexts = np.zeros(1024, dtype=np.int32)
+        self._sessions = np.zeros(1024, dtype=np.uint64)
+        self._entries: List[Tuple[str, str, Optional[str]]] = [] # (chiave dell'analisi in cache, nome del file, sessione)
+        self._context_ids: Dict[Tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _session_key(session_id: Optional[str]) -> np.uint64:
+        """Riduce l'identificativo di sessione a 64 bit, così da confrontarlo nell'array numpy."""
+        digest = hashlib.blake2b((session_id or "").encode('utf-8'), digest_size=8).digest()
+        return np.uint64(int.from_bytes(digest, 'big'))
+
+    def add(self, image_hash: int, context: Tuple, cache_key: str, name: str, session_id: Optional[str]):
+        """Registra l'impronta di un'immagine analizzata nel contesto indicato e la sessione che l'ha caricata."""
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                # Scarta il 10% delle impronte più vecchie in un colpo solo
+                drop = max(1, self.max_entries // 10)
+                size = len(self._entries)
+                self._hashes[:size - drop] = self._hashes[drop:size]
+                self._contexts[:size - drop] = self._contexts[drop:size]
+                self._sessions[:size - drop] = self._sessions[drop:size]
+                del self._entries[:drop]
+            size = len(self._entries)
+            if size == len(self._hashes):
+                self._hashes = np.resize(self._hashes, size * 2)
+                self._contexts = np.resize(self._contexts, size * 2)
+                self._sessions = np.resize(self._sessions, size * 2)
+            self._hashes[size] = image_hash
+            self._contexts[size] = self._context_ids.setdefault(context, len(self._context_ids))
+            self._sessions[size] = self._session_key(session_id)
+            self._entries.append((cache_key, name, session_id))
+
+    def find(self, image_hash: int, context: Tuple, session_id: Optional[str]) -> Optional[Dict]:
+        """Restituisce l'immagine più simile analizzata nello stesso contesto e nella stessa sessione, se entro la soglia."""
+        with self._lock:
+            context_id = self._context_ids.get(context)
+            size = len(self._entries)
+            if context_id is None or size == 0:
+                return None
+            distances = np.bitwise_count(self._hashes[:size] ^ np.uint64(image_hash)).astype(np.int32)
+            distances[(self._contexts[:size] != context_id) | (self._sessions[:size] != self._session_key(session_id))] = 65
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+            cache_key, name, owner = self._entries[best]
+        return {'cache_key': cache_key, 'name': name, 'session_id': owner, 'distance': int(distances[best])}
+
+
+@st.cache_resource
+def get_perceptual_hash_index() -> PerceptualHashIndex:
+    """Indice delle immagini quasi identiche condiviso da tutte le sessioni del processo."""
+    return PerceptualHashIndex()
+
+
+class SpooledUpload:
+    """
+    File in coda salvato su disco, con la stessa interfaccia dei file caricati. Il contenuto viene letto
+    tramite mmap: il sistema operativo carica le pagine solo quando servono e può recuperarle,
+    senza copie complete nella memoria del processo.
+    """
+
+    def __init__(self, name: str, mime_type: str, path: str, size: int, session_id: str, spool: "UploadSpool"):
+        self.name = name
+        self.type = mime_type
+        self.path = path
+        self.size = size
+        self.session_id = session_id
+        self._spool = spool
+        self._map: Optional[mmap.mmap] = None
+
+    def getvalue(self):
+        """Vista in sola lettura del contenuto (supporta len, slicing e l'interfaccia buffer)."""
+        if self.size == 0:
+            return b""
+        if self._map is None:
+            with open(self.path, 'rb') as spool_file:
+                self._map = mmap.mmap(spool_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def release(self):
+        """Libera il disco occupato dal file, appena terminata l'analisi."""
+        self._spool.release(self)
+
+
+class UploadSpool:
+    """
+    Archivio temporaneo su disco dei file in coda, condiviso da tutte le sessioni del processo (una
+    cartella per sessione). Tiene il conto dello spazio occupato su disco e dei byte in elaborazione:
+    i file oltre lo spazio disponibile vengono rifiutati, quelli oltre il budget di memoria rimandati.
+    """
+
+    def __init__(self, root: str = UPLOAD_SPOOL_DIR, max_bytes: int = UPLOAD_SPOOL_MAX_MB * 1024 * 1024,
+                 memory_budget: int = UPLOAD_MEMORY_BUDGET_MB * 1024 * 1024, session_timeout: int = SESSION_TIMEOUT):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.memory_budget = memory_budget
+        self.session_timeout = session_timeout
+        self.spooled_bytes = 0
+        self.in_flight_bytes = 0
+        self._sessions: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._remove_stale_directories()
+
+    def _remove_stale_directories(self):
+        """Elimina le cartelle lasciate da processi precedenti e non più usate."""
+        if not self.root.exists():
+            return
+        for session_dir in self.root.iterdir():
+            if session_dir.is_dir() and time.time() - session_dir.stat().st_mtime > self.session_timeout:
+                shutil.rmtree(session_dir, ignore_errors=True)
+
+    def _sweep_expired_sessions(self):
+        """Libera i file delle sessioni inattive da oltre la durata massima di una sessione."""
+        now = time.time()
+        for session_id in [sid for sid, session in self._sessions.items() if now - session['last_seen'] > self.session_timeout]:
+            self.spooled_bytes -= self._sessions.pop(session_id)['bytes']
+            shutil.rmtree(self.root / session_id, ignore_errors=True)
+            logger.info(f"⌛ Coda su disco della sessione {session_id} eliminata per inattività")
+
+    def touch(self, session_id: str):
+        """Segna la sessione come attiva: i suoi file in coda non vengono eliminati per inattività."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session['last_seen'] = time.time()
+
+    def spill(self, session_id: str, file_obj) -> SpooledUpload:
+        """
+        Copia su disco, a blocchi, un file caricato o una registrazione. Solleva ValueError se lo spazio
+        per la coda è esaurito e OSError se il disco non è scrivibile.
+        """
+        size = file_obj.size if hasattr(file_obj, 'size') else len(file_obj.getvalue())
+        with self._lock:
+            self._sweep_expired_sessions()
+            if self.spooled_bytes + size > self.max_bytes:
+                raise ValueError("spazio per i file in coda esaurito sul server")
+            self.spooled_bytes += size
+            session = self._sessions.setdefault(session_id, {'bytes': 0, 'last_seen': 0.0})
+            session['bytes'] += size
+            session['last_seen'] = time.time()
+
+        path = self.root / session_id / uuid.uuid4().hex
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'wb') as spool_file:
+                if hasattr(file_obj, 'read'):
+                    file_obj.seek(0)
+                    shutil.copyfileobj(file_obj, spool_file, 1024 * 1024)
+                else:
+                    spool_file.write(file_obj.getvalue())
+        except OSError:
+            self._forget(session_id, size)
+            raise
+        return SpooledUpload(file_obj.name, getattr(file_obj, 'type', None), str(path), size, session_id, self)
+
+    def _forget(self, session_id: str, size: int):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session['bytes'] -= size
+                self.spooled_bytes -= size
+
+    def release(self, upload: SpooledUpload):
+        """Chiude la mappatura ed elimina il file dal disco."""
+        upload.close()
+        try:
+            os.remove(upload.path)
+        except FileNotFoundError:
+            return # Già eliminato (sessione scaduta)
+        self._forget(upload.session_id, upload.size)
+
+    def release_session(self, session_id: str):
+        """Elimina tutti i file in coda della sessione (reset o scadenza)."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session:
+                self.spooled_bytes -= session['bytes']
+        shutil.rmtree(self.root / session_id, ignore_errors=True)
+
+    def try_reserve_memory(self, size: int) -> bool:
+        """Riserva il budget di memoria per un file da elaborare; un file da solo viene sempre accettato."""
+        with self._lock:
+            if self.in_flight_bytes and self.in_flight_bytes + size > self.memory_budget:
+                return False
+            self.in_flight_bytes += size
+            return True
+
+    def release_memory(self, size: int):
+        with self._lock:
+            self.in_flight_bytes -= size
+
+    def get_status(self) -> Dict:
+        with self._lock:
+            return {'sessions': len(self._sessions), 'spooled_bytes': self.spooled_bytes, 'in_flight_bytes': self.in_flight_bytes}
+
+
+@st.cache_resource
+def get_upload_spool() -> UploadSpool:
+    """Archivio su disco dei file in coda condiviso da tutte le sessioni del processo."""
+    return UploadSpool()
+
+
+def release_queued_file(file_obj):
+    """Libera subito il disco occupato da un file in coda (nessun effetto sui file tenuti in memoria)."""
+    if isinstance(file_obj, SpooledUpload):
+        file_obj.release()
+
+
+@st.cache_resource
+def get_file_analysis_slots() -> threading.BoundedSemaphore:
+    """Slot di analisi condivisi da tutte le sessioni, per non monopolizzare la chiave API del server."""
+    return threading.BoundedSemaphore(FILE_PROCESSING_GLOBAL_LIMIT)
+
+
+class FileProcessorQueue:
+    """
+    Elabora i file caricati in parallelo, con un numero limitato di analisi contemporanee.
+    I risultati vengono aggiunti alla cronologia nell'ordine di caricamento, indipendentemente
+    dall'ordine di completamento.
+    """
+
+    def __init__(self, file_analyzer, max_workers: int = FILE_PROCESSING_MAX_WORKERS):
+        self.file_analyzer = file_analyzer
+        self.max_workers = max(1, max_workers)
+
+    @staticmethod
+    def _find_similar_image(job: Dict, image_index: PerceptualHashIndex) -> Optional[Dict]:
+        """Cerca un'immagine quasi identica già analizzata nella sessione per la stessa materia e gli stessi argomenti."""
+        image_stats = job.get('image_stats')
+        if not image_stats:
+            return None
+        similar_image = image_index.find(image_stats['dhash'], FileAnalyzer.analysis_context(job), job['session_id'])
+        if similar_image:
+            logger.info(f"🔁 '{job['name']}' quasi identica a '{similar_image['name']}' (distanza {similar_image['distance']})")
+        return similar_image
+
+    @staticmethod
+    def _reuse_cached_analysis(job: Dict, analysis: str) -> str:
+        """Riutilizza un'analisi in cache; il file viene comunque registrato per la consultazione in chat."""
+        if job['file_type'] == 'pdf':
+            FileAnalyzer.extract_pdf_passages(job)
+            FileAnalyzer.remember_pdf_version(job, analysis)
+        if job['file_type'] == 'audio' and FileAnalyzer._is_long_recording(job):
+            # Le registrazioni lunghe non vengono caricate: in chat si consulta la trascrizione
+            FileAnalyzer.restore_transcript_passages(job, analysis)
+        elif not job.get('text_only'):
+            FileAnalyzer.register_document(job)
+        return analysis
+
+    @classmethod
+    def _analyze_job(cls, job: Dict, image_index: PerceptualHashIndex, batch_hashes: Dict[str, Dict],
+                     batch_lock: threading.Lock) -> Optional[str]:
+        """
+        Eseguito nel thread di analisi: legge e preelabora il file, poi riutilizza l'analisi in cache
+        (stesso contenuto, o immagine quasi identica della stessa sessione) oppure la genera.
+        Restituisce None se il file viene scartato, con il motivo in job['rejected'].
+        """
+        try:
+            FileAnalyzer.load_file(job)
+            with batch_lock:
+                first = batch_hashes.setdefault(job['hash'], job)
+            if first is not job:
+                raise ValueError(f"stesso contenuto di '{first['name']}'")
+        except ValueError as e:
+            job['rejected'] = str(e)
+            return None
+        cached_analysis = job['analysis_cache'].get(job['cache_key'])
+        if cached_analysis is None:
+            similar_image = cls._find_similar_image(job, image_index)
+            cached_analysis = job['analysis_cache'].get(similar_image['cache_key']) if similar_image else None
+            job['similar_to'] = similar_image if cached_analysis is not None else None
+        if cached_analysis is not None:
+            job['cached'] = True
+            return cls._reuse_cached_analysis(job, cached_analysis)
+        return FileAnalyzer.run_analysis(job)
+
+    @staticmethod
+    def _show_streamed_chunks(chunk_queue: Optional["queue.Queue"], streamed_text: Dict[int, str],
+                              chat_messages: Dict, jobs: Dict[int, Dict], file_status: Dict):
+        """Attende brevemente i frammenti delle analisi in corso e aggiorna i relativi messaggi in chat."""
+        if chunk_queue is None:
+            return
+        updated = set()
+        try:
+            item = chunk_queue.get(timeout=0.1)
+            while True:
+                index, chunk_text = item
+                if index not in streamed_text:
+                    file_status[index].caption(f"✍️ {jobs[index]['name']}: analisi in scrittura nella chat")
+                streamed_text[index] = streamed_text.get(index, "") + chunk_text
+                updated.add(index)
+                item = chunk_queue.get_nowait()
+        except queue.Empty:
+            pass
+        for index in updated:
+            if index in chat_messages:
+                chat_messages[index].markdown(streamed_text[index])
+
+    def process_files(self, files_to_process: List, chat_container=None, avatar="🤖"):
+        """
+        Elabora una lista di file in parallelo, mostrando lo stato di ogni file. Se è indicato il contenitore
+        della chat, ogni analisi vi compare man mano che viene generata.
+        """
+        if st.session_state.get('processing_files', False):
+            return
+
+        st.session_state.processing_files = True
+        total_files = len(files_to_process)
+        progress_bar = st.progress(0, text=f"Avvio elaborazione di {total_files} file...")
+        file_status = {index: st.empty() for index in range(total_files)}
+
+        analysis_cache = get_analysis_cache()
+        image_index = get_perceptual_hash_index()
+        spool = get_upload_spool()
+        results: List[Optional[str]] = [None] * total_files
+        errors: Dict[int, str] = {}
+        jobs: Dict[int, Dict] = {}
+        reserved_memory: Dict[int, int] = {}
+        deferred: List[int] = []
+
+        def release_file(index: int):
+            """Il file elaborato (o scartato) non occupa più né budget di memoria né disco."""
+            spool.release_memory(reserved_memory.pop(index, 0))
+            release_queued_file(files_to_process[index])
+
+        try:
+            # La preparazione legge lo stato della sessione e va fatta nel thread principale;
+            # lettura, preelaborazione e hash dei file avvengono poi nei thread di analisi
+            for index, uploaded_file in enumerate(files_to_process):
+                file_size = getattr(uploaded_file, 'size', None) or len(uploaded_file.getvalue())
+                if not spool.try_reserve_memory(file_size):
+                    # Budget di memoria del processo esaurito: il file resta in coda per la prossima elaborazione
+                    deferred.append(index)
+                    file_status[index].caption(f"⏸️ {uploaded_file.name}: rimandato, il server sta già elaborando molti file")
+                    continue
+                reserved_memory[index] = file_size
+                try:
+                    jobs[index] = self.file_analyzer.prepare_analysis(uploaded_file)
+                    file_status[index].caption(f"⏳ {uploaded_file.name}: in attesa di analisi")
+                except ValueError as e:
+                    errors[index] = str(e)
+                    file_status[index].caption(f"⚠️ {uploaded_file.name}: {e}")
+                    release_file(index)
+
+            # Un messaggio in chat per ogni file, nell'ordine di caricamento, riempito man mano che arriva il testo
+            chat_messages = {}
+            if chat_container is not None:
+                with chat_container:
+                    for index, job in jobs.items():
+                        with st.chat_message("EduBot AI", avatar=avatar):
+                            chat_messages[index] = st.empty()
+                            chat_messages[index].caption(f"⏳ Analisi di '{job['name']}' in corso...")
+            chunk_queue = queue.Queue() if chat_messages and st.session_state.get("stream_responses", True) else None
+            streamed_text: Dict[int, str] = {}
+            for index, job in jobs.items():
+                job.update(index=index, chunk_queue=chunk_queue)
+            batch_hashes: Dict[str, Dict] = {}
+            batch_lock = threading.Lock()
+
+            completed = total_files - len(jobs) - len(deferred)
+            if jobs:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+                    futures = {
+                        executor.submit(self._analyze_job, job, image_index, batch_hashes, batch_lock): index
+                        for index, job in jobs.items()
+                    }
+                    pending = set(futures)
+                    shown_progress: Dict[int, int] = {}
+                    while pending:
+                        self._show_streamed_chunks(chunk_queue, streamed_text, chat_messages, jobs, file_status)
+                        done, pending = wait(pending, timeout=0 if chunk_queue else 0.5, return_when=FIRST_COMPLETED)
+                        # Avanzamento delle analisi a segmenti o a blocchi ancora in corso
+                        for future in pending:
+                            index = futures[future]
+                            progress = jobs[index].get('progress')
+                            if progress and shown_progress.get(index) != progress['done']:
+                                shown_progress[index] = progress['done']
+                                file_status[index].caption(f"🔄 {jobs[index]['name']}: {progress['done']}/{progress['total']} {progress['unit']} analizzati")
+                        for future in done:
+                            index = futures[future]
+                            file_name = jobs[index]['name']
+                            try:
+                                results[index] = future.result()
+                                similar_image = jobs[index].get('similar_to')
+                                if jobs[index].get('rejected'):
+                                    errors[index] = jobs[index]['rejected']
+                                    file_status[index].caption(f"⚠️ {file_name}: {errors[index]}")
+                                elif similar_image:
+                                    file_status[index].caption(
+                                        f"🔁 {file_name}: quasi identica a '{similar_image['name']}' "
+                                        f"({similar_image['distance']}/64 bit diversi), analisi riutilizzata"
+                                    )
+                                elif jobs[index].get('cached'):
+                                    file_status[index].caption(f"⚡ {file_name}: analisi recuperata dalla cache")
+                                else:
+                                    analysis_cache.put(jobs[index]['cache_key'], results[index])
+                                    image_stats = jobs[index].get('image_stats')
+                                    if image_stats:
+                                        image_index.add(image_stats['dhash'], FileAnalyzer.analysis_context(jobs[index]),
+                                                        jobs[index]['cache_key'], file_name, jobs[index]['session_id'])
+                                    file_status[index].caption(FileAnalyzer._completion_caption(jobs[index]))
+                            except Exception as e:
+                                logger.error(f"Errore durante l'analisi di '{file_name}': {e}")
+                                errors[index] = f"Errore durante l'analisi: {e}"
+                                file_status[index].caption(f"❌ {file_name}: {errors[index]}")
+                            if index in chat_messages:
+                                if results[index]:
+                                    chat_messages[index].markdown(results[index])
+                                elif jobs[index].get('rejected'):
+                                    chat_messages[index].empty()
+                                else:
+                                    chat_messages[index].error(f"❌ {file_name}: {errors[index]}")
+                            release_file(index)
+                            completed += 1
+                            progress_bar.progress(completed / total_files, text=f"🔄 Elaborati {completed}/{total_files} file")
+
+            # Le analisi entrano in cronologia nell'ordine di caricamento
+            for index, result in enumerate(results):
+                if result:
+                    job = jobs[index]
+                    st.session_state.history.append({'role': 'model', 'parts': [{'text': result}]})
+                    st.session_state.analyzed_files.append({
+                        'name': job['name'], 'type': job['file_type'], 'timestamp': time.time(),
+                        'hash': job['hash'], 'cached': job.get('cached', False),
+                        'text_only': job.get('text_only', False), 'passages': len(job.get('passages', [])),
+                        'patched_from': job.get('patched_from', {}).get('name'),
+                        'similar_to': (job.get('similar_to') or {}).get('name')
+                    })
+                    previous_version = job.get('patched_from', {}).get('name')
+                    if job.get('patched_from', {}).get('same_session') and any(f['name'] == previous_version for f in st.session_state.analyzed_files[:-1]):
+                        # La nuova versione sostituisce la precedente nella ricerca dei passaggi
+                        st.session_state.retrieval_index.remove_document(previous_version)
+                    if any(f['name'] == job['name'] for f in st.session_state.analyzed_files[:-1]):
+                        # Contenuto nuovo con un nome già usato: i passaggi della versione precedente non valgono più
+                        st.session_state.retrieval_index.remove_document(job['name'])
+                    if job.get('passages'):
+                        st.session_state.retrieval_index.add_passages(job['passages'])
+
+            st.session_state.file_processing_report = {
+                'processed': sum(1 for result in results if result),
+                'cached': sum(1 for index, job in jobs.items() if results[index] and job.get('cached')),
+                'similar_images': sum(1 for index, job in jobs.items() if results[index] and job.get('similar_to')),
+                'image_bytes_saved': sum(job['image_stats']['original_bytes'] - job['image_stats']['processed_bytes']
+                                         for job in jobs.values() if job.get('image_stats') and not job.get('rejected')),
+                'image_preprocessing_ms': [job['image_stats']['elapsed'] * 1000 for job in jobs.values() if job.get('image_stats') and not job.get('rejected')],
+                'audio_bytes_saved': sum(job['audio_stats']['original_bytes'] - job['audio_stats']['processed_bytes']
+                                         for job in jobs.values() if job.get('audio_stats') and not job.get('rejected')),
+                'errors': [(files_to_process[index].name, message) for index, message in sorted(errors.items())],
+                'deferred': [files_to_process[index].name for index in deferred]
+            }
+
+        except Exception as e:
+            logger.error(f"Errore durante l'elaborazione dei file: {e}")
+            st.error(f"Si è verificato un errore durante l'elaborazione: {e}")
+        finally:
+            for index in list(reserved_memory):
+                release_file(index)
+            st.session_state.processing_files = False
+            # Rimuovi i file processati dalla coda; quelli rimandati restano in attesa
+            deferred_files = [files_to_process[index] for index in deferred]
+            st.session_state.files_to_process = [f for f in st.session_state.files_to_process
+                                                 if f not in files_to_process or f in deferred_files]
+            st.rerun()
+
+
+class FileAnalyzer:
+    """Gestore per l'analisi multimodale dei file."""
+    FILE_TYPES_BY_EXTENSION = {
+        **{ext: 'image' for ext in ['png', 'jpg', 'jpeg', 'webp', 'gif', 'bmp', 'tiff']},
+        'pdf': 'pdf',
+        **{ext: 'audio' for ext in ['mp3', 'wav', 'ogg', 'm4a', 'flac', 'aac']},
+    }
+    MAX_SIZE_MB = {'image': MAX_IMAGE_SIZE_MB, 'pdf': PDF_MAP_REDUCE_MAX_SIZE_MB, 'audio': AUDIO_LONG_MAX_SIZE_MB}
+    TRANSCRIPT_HEADING = "#### 📝 Trascrizione"
+    _timestamp_pattern = re.compile(r"^\s*[-*]?\s*\[(?:(\d+):)?(\d{1,2}):(\d{2})\]\s*(.*)$")
+
+    def __init__(self, model_manager: ModelManager):
+        self.model_manager = model_manager
+        self.processor_queue = FileProcessorQueue(self) # Modificato da AsyncFileProcessor
+
+    @classmethod
+    def detect_file_type(cls, file_name: str) -> str:
+        file_ext = file_name.split('.')[-1].lower() if '.' in file_name else 'unknown'
+        return cls.FILE_TYPES_BY_EXTENSION.get(file_ext, 'unknown')
+
+    def prepare_analysis(self, uploaded_file) -> Dict:
+        """
+        Raccoglie nel thread principale tutto ciò che dipende dallo stato della sessione (modello,
+        metodologia, argomenti, file già analizzati), così che lettura, preelaborazione e analisi
+        possano girare in un thread separato (vedi load_file). Solleva ValueError se il file non può
+        essere analizzato.
+        """
+        file_name = getattr(uploaded_file, 'name', f'file_sconosciuto_{int(time.time())}')
+        file_type = self.detect_file_type(file_name)
+        if file_type == 'unknown':
+            raise ValueError("formato non supportato")
+        if not st.session_state.model:
+            raise ValueError("modello non inizializzato")
+
+        file_size = getattr(uploaded_file, 'size', None) or len(uploaded_file.getvalue())
+        file_size_mb = file_size / (1024 * 1024)
+        if file_size_mb > self.MAX_SIZE_MB[file_type]:
+            raise ValueError(f"file troppo grande ({file_size_mb:.1f}MB). Limite: {self.MAX_SIZE_MB[file_type]}MB")
+
+        current_methodology = st.session_state.get("selected_subject_methodology", "generale")
+        mime_types = {'image': getattr(uploaded_file, 'type', None) or 'image/png', 'pdf': 'application/pdf',
+                      'audio': getattr(uploaded_file, 'type', None) or 'audio/wav'}
+        methodology_config = SUBJECT_METHODOLOGY_CONFIGS.get(current_methodology, {})
+        user_topics = st.session_state.get('user_topics', 'argomenti generali')
+        model_name = st.session_state.get('selected_model', 'gemini-2.5-flash')
+        return {
+            'name': file_name,
+            'file_type': file_type,
+            'mime_type': mime_types[file_type],
+            'upload': uploaded_file,
+            'analyzed_hashes': {f['hash']: f['name'] for f in st.session_state.analyzed_files if f.get('hash')},
+            'audio_full_quality': current_methodology in AUDIO_FULL_QUALITY_SUBJECTS,
+            'subject_key': current_methodology,
+            'model_name': model_name,
+            'analysis_cache': get_analysis_cache(),
+            'analysis_slots': get_file_analysis_slots(),
+            'version_index': get_pdf_version_index(),
+            'session_id': st.session_state.get('anonymous_session_id'),
+            'model': st.session_state.model,
+            'document_store': st.session_state.get('document_store'),
+            'anonymizer': st.session_state.security_system.anonymizer,
+            'methodology_name': methodology_config.get('display_name', 'Approccio generale'),
+            'user_topics': user_topics,
+        }
+
+    @classmethod
+    def load_file(cls, job: Dict):
+        """
+        Legge e preelabora il file preparato da prepare_analysis e calcola la chiave della cache.
+        Gira nel thread di analisi, così immagini grandi e registrazioni WAV fino a 200 MB non
+        bloccano il thread principale. Solleva ValueError se il file non va analizzato.
+        """
+        file_bytes = job.pop('upload').getvalue()
+        # I duplicati si riconoscono dal contenuto: una copia rinominata è un duplicato,
+        # un file diverso con un nome già usato no
+        content_hash = hashlib.sha256(file_bytes).hexdigest()
+        duplicate = job['analyzed_hashes'].get(content_hash)
+        if duplicate:
+            raise ValueError(f"contenuto già analizzato (come '{duplicate}')")
+
+        mime_type = job['mime_type']
+        image_stats = audio_stats = None
+        if job['file_type'] == 'image':
+            file_bytes, mime_type, image_stats = cls.preprocess_image(job['name'], file_bytes, mime_type)
+        elif job['file_type'] == 'audio':
+            original_size_mb = len(file_bytes) / (1024 * 1024)
+            file_bytes, mime_type, audio_stats = cls.preprocess_audio(job['name'], file_bytes, mime_type, job['audio_full_quality'])
+            if mime_type != 'audio/wav' and len(file_bytes) > MAX_AUDIO_SIZE_MB * 1024 * 1024:
+                # Solo le registrazioni WAV possono essere divise in segmenti
+                raise ValueError(f"file troppo grande ({original_size_mb:.1f}MB). Limite: {MAX_AUDIO_SIZE_MB}MB "
+                                 f"(fino a {AUDIO_LONG_MAX_SIZE_MB}MB per le registrazioni WAV)")
+        # La chiave della cache dipende dai byte effettivamente inviati al modello
+        analysis_hash = hashlib.sha256(file_bytes).hexdigest() if image_stats or audio_stats else content_hash
+        job.update(
+            data=file_bytes, mime_type=mime_type, hash=content_hash, image_stats=image_stats, audio_stats=audio_stats,
+            cache_key=AnalysisCache.make_key(analysis_hash, job['subject_key'], job['user_topics'], job['model_name'])
+        )
+
+    @staticmethod
+    def preprocess_image(file_name: str, data: bytes, mime_type: str) -> Tuple[bytes, str, Optional[Dict]]:
+        """Riduce e normalizza l'immagine; se Pillow non riesce a leggerla viene inviata così com'è."""
+        try:
+            processed, processed_mime, stats = ImagePreprocessor().process(data, mime_type)
+        except Exception as e:
+            logger.warning(f"⚠️ Preelaborazione di '{file_name}' non riuscita, invio l'originale: {e}")
+            return data, mime_type, None
+        logger.info(f"🖼️ '{file_name}': {stats['original_size'][0]}×{stats['original_size'][1]} → "
+                    f"{stats['processed_size'][0]}×{stats['processed_size'][1]}, {stats['original_bytes'] / 1024:.0f} KB → "
+                    f"{stats['processed_bytes'] / 1024:.0f} KB in {stats['elapsed'] * 1000:.0f} ms")
+        return processed, processed_mime, stats
+
+    @staticmethod
+    def preprocess_audio(file_name: str, data: bytes, mime_type: str, full_quality: bool) -> Tuple[bytes, str, Optional[Dict]]:
+        """Riconosce il formato e alleggerisce le registrazioni di parlato; in caso di errore invia l'originale."""
+        try:
+            processed, processed_mime, stats = AudioPreprocessor().process(data, full_quality=full_quality)
+        except Exception as e:
+            logger.warning(f"⚠️ Preelaborazione di '{file_name}' non riuscita, invio l'originale: {e}")
+            return data, mime_type, None
+        if stats['processed_duration'] is not None:
+            logger.info(f"🎧 '{file_name}': {stats['original_duration']:.1f}s → {stats['processed_duration']:.1f}s, "
+                        f"{stats['original_bytes'] / 1024:.0f} KB → {stats['processed_bytes'] / 1024:.0f} KB "
+                        f"in {stats['elapsed'] * 1000:.0f} ms")
+        return processed, processed_mime, stats
+
+    @classmethod
+    def run_analysis(cls, job: Dict) -> str:
+        """Esegue l'analisi preparata da prepare_analysis. Non accede allo stato della sessione."""
+        analyzers = {
+            'image': cls.analyze_image_with_gemini,
+            'pdf': cls.analyze_pdf_with_gemini,
+            'audio': cls.analyze_audio_with_gemini,
+        }
+        return analyzers[job['file_type']](job)
+
+    @staticmethod
+    def _generate(job: Dict, contents: List, stream: bool = False) -> str:
+        """
+        Chiamata al modello che occupa uno degli slot condivisi da tutte le sessioni. Con stream=True
+        (solo per il testo che finisce in chat) i frammenti vengono passati al thread principale
+        man mano che arrivano.
+        """
+        with job['analysis_slots']:
+            chunk_queue = job.get('chunk_queue')
+            if not stream or chunk_queue is None:
+                return job['model'].generate_content(contents).text
+            response = job['model'].generate_content(contents, stream=True)
+            chunks = []
+            for chunk_text in ModelManager.iter_response_text(response):
+                chunks.append(chunk_text)
+                chunk_queue.put((job['index'], chunk_text))
+            return "".join(chunks)
+
+    @staticmethod
+    def _completion_caption(job: Dict) -> str:
+        """Riga di stato di un'analisi appena completata, con i dettagli dell'elaborazione."""
+        patched_from = job.get('patched_from')
+        if patched_from:
+            return (f"♻️ {job['name']}: aggiornata l'analisi di {patched_from['name']} "
+                    f"({patched_from['changed_pages']} pagine nuove o modificate, {patched_from['removed_pages']} rimosse)")
+        details = []
+        if job.get('ranges'):
+            details.append(f"{job['ranges']} blocchi di pagine")
+        image_stats = job.get('image_stats')
+        if image_stats:
+            details.append(f"immagine {image_stats['original_bytes'] / 1024:.0f} KB → "
+                           f"{image_stats['processed_bytes'] / 1024:.0f} KB in {image_stats['elapsed'] * 1000:.0f} ms")
+        audio_stats = job.get('audio_stats')
+        if audio_stats and audio_stats['processed_duration'] is not None:
+            details.append(f"audio {audio_stats['original_duration']:.0f}s → {audio_stats['processed_duration']:.0f}s, "
+                           f"{audio_stats['original_bytes'] / 1024:.0f} KB → {audio_stats['processed_bytes'] / 1024:.0f} KB")
+        if job.get('segments'):
+            details.append(f"{job['segments']} segmenti audio")
+        return f"✅ {job['name']}: analisi completata" + "".join(f" ({detail})" for detail in details)
+
+    @staticmethod
+    def extract_pdf_passages(job: Dict):
+        """Estrae in locale il testo del PDF (anonimizzato) e lo divide in passaggi per la ricerca in chat."""
+        if job['file_type'] != 'pdf' or 'passages' in job:
+            return
+        extractor = PdfTextExtractor()
+        try:
+            pages, text_only, page_fingerprints, distinctive_fingerprints = extractor.extract(job['data'])
+        except Exception as e:
+            logger.warning(f"⚠️ Estrazione del testo da '{job['name']}' non riuscita: {e}")
+            job.update(pages=[], page_count=0, page_fingerprints=[], distinctive_fingerprints=[], text_only=False, passages=[])
+            return
+        job['page_count'] = len(pages)
+        job['page_fingerprints'] = page_fingerprints
+        job['distinctive_fingerprints'] = distinctive_fingerprints
+        pages = [job['anonymizer'].anonymize(page_text) for page_text in pages]
+        job['pages'] = pages
+        job['text_only'] = text_only and sum(len(page_text) for page_text in pages) <= PDF_TEXT_ONLY_MAX_CHARS
+        job['passages'] = extractor.split_into_passages(job['name'], pages)
+
+    @staticmethod
+    def register_document(job: Dict) -> Optional[Dict]:
+        """Registra il file tra i documenti della sessione, caricandolo una sola volta."""
+        document_store = job['document_store']
+        return document_store.add(job['name'], job['mime_type'], job['data']) if document_store else None
+
+    @classmethod
+    def _document_part(cls, job: Dict) -> Dict:
+        """Richiama il file per riferimento; se il caricamento fallisce lo invia inline."""
+        document = cls.register_document(job)
+        if document:
+            return DocumentStore.file_part(document)
+        return {"mime_type": job['mime_type'], "data": bytes(job['data'])}
+
+    @staticmethod
+    @contextmanager
+    def _request_part(job: Dict, label: str, mime_type: str, data: bytes) -> Iterator[Dict]:
+        """
+        Parte di una singola richiesta (blocco di pagine, segmento audio): inviata direttamente se
+        piccola, altrimenti caricata come file temporaneo, perché oltre ~20MB l'API rifiuta la richiesta.
+        """
+        document_store = job['document_store']
+        if len(data) <= INLINE_REQUEST_MAX_MB * 1024 * 1024:
+            yield {"mime_type": mime_type, "data": data}
+        elif document_store is None:
+            raise ValueError(f"{label} troppo grande per l'invio diretto ({len(data) / (1024 * 1024):.1f}MB)")
+        else:
+            with document_store.temporary_part(f"{job['name']} - {label}", mime_type, data) as part:
+                yield part
+
+    @classmethod
+    def analyze_image_with_gemini(cls, job: Dict) -> str:
+        """Invia un file immagine a Gemini per un'analisi contestualizzata."""
+        methodology_name = job['methodology_name']
+        image_file = cls._document_part(job)
+        prompt = f"""
+            Sei un tutor esperto specializzato in **{methodology_name}**. Analizza l'immagine ('{job['name']}') nel contesto degli argomenti: **{job['user_topics']}**.
+            1. Descrivi gli elementi chiave dell'immagine.
+            2. Evidenzia la sua valenza didattica per la metodologia {methodology_name}.
+            3. Collega l'immagine agli argomenti di studio.
+            4. Concludi con una domanda mirata per stimolare l'apprendimento.
+            """
+        return cls._generate(job, [prompt, image_file], stream=True)
+
+    @classmethod
+    def analyze_pdf_with_gemini(cls, job: Dict) -> str:
+        """Analisi PDF contestualizzata, incrementale se il file è una nuova versione di un PDF già analizzato."""
+        cls.extract_pdf_passages(job)
+        analysis = cls._patch_previous_version(job)
+        if analysis is None:
+            analysis = cls._analyze_full_pdf(job)
+        cls.remember_pdf_version(job, analysis)
+        return analysis
+
+    @classmethod
+    def _analyze_full_pdf(cls, job: Dict) -> str:
+        methodology_name = job['methodology_name']
+        if len(job['data']) > PDF_MAX_SIZE_MB * 1024 * 1024 or job['page_count'] > PDF_MAP_REDUCE_MIN_PAGES:
+            if not job['text_only']:
+                # Come nel riuso dalla cache, il file resta consultabile in chat (le scansioni non hanno passaggi)
+                cls.register_document(job)
+            return cls._analyze_pdf_map_reduce(job)
+        if job['text_only']:
+            # PDF di solo testo: basta il testo estratto in locale, senza caricare il file
+            pdf_file = cls._pages_as_text(job, range(1, job['page_count'] + 1))
+        else:
+            pdf_file = cls._document_part(job)
+        prompt = f"""
+            Sei un tutor esperto in {methodology_name}. Analizza il PDF '{job['name']}'.
+            1. Identifica il contenuto principale.
+            2. Estrai i concetti chiave pertinenti a {methodology_name}.
+            3. Collega il contenuto agli argomenti: {job['user_topics']}.
+            4. Proponi domande di approfondimento specifiche per {methodology_name}.
+            """
+        return cls._generate(job, [prompt, pdf_file], stream=True)
+
+    @staticmethod
+    def _pages_as_text(job: Dict, page_numbers: Iterable[int]) -> str:
+        """Testo estratto delle pagine indicate (numerate da 1), con l'indicazione della pagina."""
+        return "\n\n".join(f"--- Pagina {number} ---\n{job['pages'][number - 1]}" for number in page_numbers)
+
+    @staticmethod
+    def _pdf_pages(data: bytes, page_numbers: Iterable[int]) -> bytes:
+        """Copia le pagine indicate (numerate da 1) in un nuovo PDF."""
+        reader = PdfReader(BytesIO(data))
+        writer = PdfWriter()
+        for number in page_numbers:
+            writer.add_page(reader.pages[number - 1])
+        output = BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    @staticmethod
+    def analysis_context(job: Dict) -> Tuple:
+        """Materia, argomenti e modello: analisi prodotte in contesti diversi non sono intercambiabili."""
+        return (job['subject_key'], job['user_topics'], job['model_name'])
+
+    @staticmethod
+    def _manifest_key(job: Dict) -> str:
+        return AnalysisCache.make_key(f"versione:{job['hash']}", job['subject_key'], job['user_topics'], job['model_name'])
+
+    @classmethod
+    def remember_pdf_version(cls, job: Dict, analysis: str):
+        """Memorizza impronte di pagina e analisi del PDF, per aggiornarle quando arriva una nuova versione."""
+        if not job.get('distinctive_fingerprints'):
+            return
+        manifest_key = cls._manifest_key(job)
+        manifest = {'name': job['name'], 'page_fingerprints': job['page_fingerprints'], 'analysis': analysis}
+        job['analysis_cache'].put(manifest_key, json.dumps(manifest, ensure_ascii=False))
+        job['version_index'].register(manifest_key, cls.analysis_context(job), job['distinctive_fingerprints'], job['session_id'])
+
+    @classmethod
+    def _patch_previous_version(cls, job: Dict) -> Optional[str]:
+        """
+        Se il PDF è una nuova versione di un documento già analizzato, invia al modello solo le pagine
+        modificate insieme all'analisi precedente, chiedendo di aggiornarla. Restituisce None se
+        non esiste una versione precedente o se le modifiche sono troppo estese.
+        """
+        page_fingerprints = job.get('page_fingerprints')
+        if not job.get('distinctive_fingerprints'):
+            return None
+        match = job['version_index'].find_previous(job['distinctive_fingerprints'], cls.analysis_context(job), cls._manifest_key(job))
+        manifest_json = job['analysis_cache'].get(match['manifest_key']) if match else None
+        if manifest_json is None:
+            return None
+        previous = json.loads(manifest_json)
+        # L'indice è condiviso tra le sessioni: il nome di un file caricato da altri non va mostrato
+        same_session = match['session_id'] == job['session_id']
+        previous_label = f"del PDF '{previous['name']}'" if same_session else "di un PDF"
+
+        previous_fingerprints, current_fingerprints = set(previous['page_fingerprints']), set(page_fingerprints)
+        changed_pages = [number for number, fingerprint in enumerate(page_fingerprints, start=1) if fingerprint not in previous_fingerprints]
+        removed_pages = [number for number, fingerprint in enumerate(previous['page_fingerprints'], start=1) if fingerprint not in current_fingerprints]
+        if len(changed_pages) > PDF_PATCH_MAX_CHANGED_PAGES:
+            return None
+
+        job['patched_from'] = {'name': previous['name'] if same_session else PdfVersionIndex.OTHER_SESSION_LABEL,
+                               'same_session': same_session, 'changed_pages': len(changed_pages), 'removed_pages': len(removed_pages)}
+        logger.info(f"♻️ '{job['name']}' è una nuova versione di '{previous['name']}': "
+                    f"{len(changed_pages)} pagine nuove o modificate, {len(removed_pages)} rimosse")
+        if not changed_pages and not removed_pages:
+            return previous['analysis'] # Stesso contenuto (es. cambiano solo i metadati del file)
+
+        methodology_name = job['methodology_name']
+        prompt = f"""
+            Sei un tutor esperto in {methodology_name}. Lo studente ha caricato '{job['name']}', una nuova versione
+            {previous_label} che hai già analizzato. Ricevi l'analisi precedente e solo le pagine nuove o modificate.
+            Aggiorna l'analisi tenendo conto delle modifiche, senza stravolgere le parti ancora valide e mantenendo la struttura:
+            1. Identifica il contenuto principale.
+            2. Estrai i concetti chiave pertinenti a {methodology_name}.
+            3. Collega il contenuto agli argomenti: {job['user_topics']}.
+            4. Proponi domande di approfondimento specifiche per {methodology_name}.
+            Pagine nuove o modificate (numerazione della nuova versione): {', '.join(map(str, changed_pages)) or 'nessuna'}.
+            Pagine della versione precedente rimosse o sostituite: {', '.join(map(str, removed_pages)) or 'nessuna'}.
+            """
+        contents = [prompt, f"--- ANALISI DELLA VERSIONE PRECEDENTE ---\n{previous['analysis']}"]
+        if not changed_pages:
+            return cls._generate(job, contents, stream=True)
+        if job['text_only']:
+            return cls._generate(job, contents + [cls._pages_as_text(job, changed_pages)], stream=True)
+        with cls._request_part(job, "pagine modificate", "application/pdf", cls._pdf_pages(job['data'], changed_pages)) as pages_part:
+            return cls._generate(job, contents + [pages_part], stream=True)
+
+    @classmethod
+    def _analyze_pdf_range(cls, job: Dict, start: int, end: int) -> str:
+        """Analisi parziale di un blocco di pagine, memorizzata in cache per poter ripetere solo i blocchi falliti."""
+        # La chiave dipende dal contenuto delle pagine: i blocchi invariati di una nuova versione restano validi
+        range_fingerprints = job['page_fingerprints'][start - 1:end]
+        range_identity = hashlib.sha256("".join(range_fingerprints).encode()).hexdigest() if range_fingerprints else f"{job['hash']}:{start}-{end}"
+        range_key = AnalysisCache.make_key(f"pagine:{range_identity}", job['subject_key'], job['user_topics'], job['model_name'])
+        cached_analysis = job['analysis_cache'].get(range_key)
+        if cached_analysis is not None:
+            return cached_analysis
+
+        methodology_name = job['methodology_name']
+        prompt = f"""
+            Sei un tutor esperto in {methodology_name}. Analizza le pagine {start}-{end} del PDF '{job['name']}'.
+            Questa è solo una parte del documento: la tua analisi verrà unita a quella delle altre parti.
+            - Riassumi il contenuto di queste pagine.
+            - Elenca i concetti chiave pertinenti a {methodology_name}, indicando le pagine.
+            - Segnala i collegamenti con gli argomenti: {job['user_topics']}.
+            """
+        if job['text_only']:
+            partial_analysis = cls._generate(job, [prompt, cls._pages_as_text(job, range(start, end + 1))])
+        else:
+            range_data = cls._pdf_pages(job['data'], range(start, end + 1))
+            with cls._request_part(job, f"pagine {start}-{end}", "application/pdf", range_data) as range_part:
+                partial_analysis = cls._generate(job, [prompt, range_part])
+        job['analysis_cache'].put(range_key, partial_analysis)
+        return partial_analysis
+
+    @classmethod
+    def _analyze_pdf_map_reduce(cls, job: Dict) -> str:
+        """
+        Analisi dei PDF di grandi dimensioni: i blocchi di pagine vengono analizzati in parallelo (map)
+        e le analisi parziali unite in un'unica analisi con la struttura consueta (reduce).
+        """
+        page_count = job['page_count'] or len(PdfReader(BytesIO(job['data'])).pages)
+        page_ranges = [(start, min(start + PDF_PAGES_PER_RANGE - 1, page_count))
+                       for start in range(1, page_count + 1, PDF_PAGES_PER_RANGE)]
+        job['ranges'] = len(page_ranges)
+        job['progress'] = {'done': 0, 'total': len(page_ranges), 'unit': 'blocchi di pagine'}
+        logger.info(f"📚 Analisi di '{job['name']}' in {len(page_ranges)} blocchi da {PDF_PAGES_PER_RANGE} pagine")
+
+        partial_analyses: Dict[Tuple[int, int], str] = {}
+        failed_ranges = []
+        with ThreadPoolExecutor(max_workers=min(FILE_PROCESSING_MAX_WORKERS, len(page_ranges))) as executor:
+            futures = {executor.submit(cls._analyze_pdf_range, job, start, end): (start, end) for start, end in page_ranges}
+            for future in as_completed(futures):
+                try:
+                    partial_analyses[futures[future]] = future.result()
+                except Exception as e:
+                    logger.error(f"Errore nell'analisi delle pagine {futures[future]} di '{job['name']}': {e}")
+                    failed_ranges.append(futures[future])
+                job['progress']['done'] += 1
+        if failed_ranges:
+            # I blocchi riusciti restano in cache: ricaricando il file si ripetono solo quelli falliti
+            ranges_text = ", ".join(f"{start}-{end}" for start, end in sorted(failed_ranges))
+            raise RuntimeError(f"analisi non riuscita per le pagine {ranges_text}. Ricarica il file per ripetere solo queste parti")
+
+        methodology_name = job['methodology_name']
+        partial_text = "\n\n".join(f"### Pagine {start}-{end}\n{partial_analyses[(start, end)]}" for start, end in page_ranges)
+        prompt = f"""
+            Sei un tutor esperto in {methodology_name}. Di seguito trovi le analisi parziali del PDF '{job['name']}',
+            divise per blocchi di pagine. Uniscile in un'unica analisi coerente e senza ripetizioni:
+            1. Identifica il contenuto principale.
+            2. Estrai i concetti chiave pertinenti a {methodology_name}.
+            3. Collega il contenuto agli argomenti: {job['user_topics']}.
+            4. Proponi domande di approfondimento specifiche per {methodology_name}.
+            """
+        return cls._generate(job, [prompt, f"--- ANALISI PARZIALI ---\n{partial_text}"], stream=True)
+
+    @staticmethod
+    def _format_timestamp(seconds: float) -> str:
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+    @classmethod
+    def _is_long_recording(cls, job: Dict) -> bool:
+        if job['mime_type'] != 'audio/wav':
+            return False
+        try:
+            duration = AudioPreprocessor.wav_duration(job['data'])
+        except (wave.Error, EOFError):
+            return False
+        return duration > AUDIO_LONG_MIN_SECONDS or len(job['data']) > MAX_AUDIO_SIZE_MB * 1024 * 1024
+
+    @classmethod
+    def _analyze_audio_segment(cls, job: Dict, segment: Dict) -> str:
+        """Trascrizione e note di un segmento, memorizzate in cache per poter ripetere solo i segmenti falliti."""
+        segment_hash = hashlib.sha256(segment['data']).hexdigest()
+        segment_key = AnalysisCache.make_key(f"segmento:{segment_hash}", job['subject_key'], job['user_topics'], job['model_name'])
+        cached_analysis = job['analysis_cache'].get(segment_key)
+        if cached_analysis is not None:
+            return cached_analysis
+
+        methodology_name = job['methodology_name']
+        prompt = f"""
+            Sei un tutor esperto in {methodology_name}. Questo è il segmento {segment['number']} della registrazione '{job['name']}'.
+            È solo una parte della registrazione: il tuo lavoro verrà unito a quello degli altri segmenti.
+            Rispondi con due sezioni, usando esattamente questi titoli:
+            ### TRASCRIZIONE
+            Una riga per frase, ciascuna preceduta dal tempo [mm:ss] misurato dall'inizio di questo segmento.
+            ### NOTE
+            I concetti chiave pertinenti a {methodology_name} e i collegamenti con gli argomenti: {job['user_topics']}.
+            """
+        # A qualità piena (es. materie musicali) un segmento di 5 minuti supera il limite della richiesta diretta
+        with cls._request_part(job, f"segmento {segment['number']}", 'audio/wav', segment['data']) as audio_part:
+            segment_analysis = cls._generate(job, [prompt, audio_part])
+        job['analysis_cache'].put(segment_key, segment_analysis)
+        return segment_analysis
+
+    @staticmethod
+    def _original_time(job: Dict, moment: float) -> float:
+        """Riporta un tempo dell'audio ripulito dai silenzi al tempo corrispondente della registrazione originale."""
+        kept_frames = (job.get('audio_stats') or {}).get('kept_frames')
+        if kept_frames is None:
+            return moment
+        frame_seconds = AUDIO_VAD_FRAME_MS / 1000
+        position = min(int(moment / frame_seconds), len(kept_frames) - 1)
+        return kept_frames[position] * frame_seconds + (moment - position * frame_seconds)
+
+    @classmethod
+    def _merge_transcripts(cls, job: Dict, segments: List[Dict],
+                           segment_analyses: Dict[int, str]) -> Tuple[List[Tuple[float, str]], List[str]]:
+        """
+        Riporta i tempi di ogni segmento sulla registrazione originale e scarta le frasi ripetute nella
+        sovrapposizione: ogni frase appartiene al segmento in cui cade tra i due tagli.
+        """
+        transcript: List[Tuple[float, str]] = []
+        notes = []
+        for segment in segments:
+            text = segment_analyses[segment['number']]
+            transcript_text, _, notes_text = text.partition("### NOTE")
+            notes.append(f"### Segmento {segment['number']} ({cls._format_timestamp(cls._original_time(job, segment['cut_start']))}–"
+                         f"{cls._format_timestamp(cls._original_time(job, segment['cut_end']))})\n{notes_text.strip()}")
+            cut_end = segment['cut_end'] if segment is not segments[-1] else float('inf')
+            keep_line = False
+            for line in transcript_text.replace("### TRASCRIZIONE", "").splitlines():
+                match = cls._timestamp_pattern.match(line)
+                if match:
+                    hours, minutes, seconds, sentence = match.groups()
+                    moment = segment['start'] + int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds)
+                    keep_line = segment['cut_start'] <= moment < cut_end
+                    if keep_line:
+                        transcript.append((cls._original_time(job, moment), sentence.strip()))
+                elif keep_line and line.strip():
+                    # Frase andata a capo: appartiene alla riga precedente
+                    transcript[-1] = (transcript[-1][0], f"{transcript[-1][1]} {line.strip()}")
+        return transcript, notes
+
+    @classmethod
+    def _transcript_passages(cls, job: Dict, transcript: List[Tuple[float, str]]) -> List[Dict]:
+        """Divide la trascrizione (anonimizzata) in passaggi per la ricerca in chat."""
+        passages, lines, passage_start = [], [], 0.0
+        for moment, sentence in transcript:
+            if not lines:
+                passage_start = moment
+            lines.append(f"[{cls._format_timestamp(moment)}] {job['anonymizer'].anonymize(sentence)}")
+            if sum(len(line) for line in lines) >= RETRIEVAL_CHUNK_CHARS:
+                section = f"{cls._format_timestamp(passage_start)}–{cls._format_timestamp(moment)}"
+                passages.append(PdfTextExtractor._make_passage(job['name'], None, section, lines))
+                lines = []
+        if lines:
+            section = f"{cls._format_timestamp(passage_start)}–{cls._format_timestamp(transcript[-1][0])}"
+            passages.append(PdfTextExtractor._make_passage(job['name'], None, section, lines))
+        return passages
+
+    @classmethod
+    def _analyze_long_audio(cls, job: Dict) -> str:
+        """
+        Registrazioni lunghe: i segmenti vengono trascritti e analizzati in parallelo, le trascrizioni
+        unite in un'unica trascrizione con i tempi della registrazione intera e le note in un'analisi finale.
+        """
+        segments = AudioPreprocessor().split_segments(job['data'])
+        job['segments'] = len(segments)
+        job['progress'] = {'done': 0, 'total': len(segments), 'unit': 'segmenti'}
+        logger.info(f"🎧 Analisi di '{job['name']}' in {len(segments)} segmenti da circa {AUDIO_SEGMENT_SECONDS}s")
+
+        segment_analyses: Dict[int, str] = {}
+        failed_segments = []
+        with ThreadPoolExecutor(max_workers=min(FILE_PROCESSING_MAX_WORKERS, len(segments))) as executor:
+            futures = {executor.submit(cls._analyze_audio_segment, job, segment): segment for segment in segments}
+            for future in as_completed(futures):
+                segment = futures[future]
+                try:
+                    segment_analyses[segment['number']] = future.result()
+                except Exception as e:
+                    logger.error(f"Errore nell'analisi del segmento {segment['number']} di '{job['name']}': {e}")
+                    failed_segments.append(segment)
+                job['progress']['done'] += 1
+        if failed_segments:
+            # I segmenti riusciti restano in cache: ricaricando il file si ripetono solo quelli falliti
+            failed_text = ", ".join(f"{cls._format_timestamp(cls._original_time(job, segment['cut_start']))}–"
+                                    f"{cls._format_timestamp(cls._original_time(job, segment['cut_end']))}"
+                                    for segment in sorted(failed_segments, key=lambda segment: segment['number']))
+            raise RuntimeError(f"analisi non riuscita per i tratti {failed_text}. Ricarica il file per ripetere solo queste parti")
+
+        transcript, notes = cls._merge_transcripts(job, segments, segment_analyses)
+        # La trascrizione finisce nel prompt finale e nell'analisi salvata: va anonimizzata come il resto
+        transcript = [(moment, job['anonymizer'].anonymize(sentence)) for moment, sentence in transcript]
+        job['passages'] = cls._transcript_passages(job, transcript)
+        transcript_text = "\n".join(f"[{cls._format_timestamp(moment)}] {sentence}" for moment, sentence in transcript)
+
+        methodology_name = job['methodology_name']
+        prompt = f"""
+            Sei un tutor esperto in {methodology_name}. Di seguito trovi la trascrizione della registrazione '{job['name']}'
+            e le note raccolte per ciascun segmento. Scrivi un'unica analisi coerente e senza ripetizioni:
+            1. **Contenuto**: Riassumi la registrazione, citando i tempi dei passaggi più importanti.
+            2. **Analisi Disciplinare**: Analizza secondo i principi di {methodology_name}.
+            3. **Connessioni Didattiche**: Collega agli argomenti: {job['user_topics']}.
+            4. **Domande Guida**: Proponi domande specifiche per {methodology_name}.
+            """
+        notes_text = "\n\n".join(notes)
+        final_analysis = cls._generate(job, [prompt, f"--- NOTE PER SEGMENTO ---\n{notes_text}\n\n--- TRASCRIZIONE ---\n{transcript_text}"],
+                                       stream=True)
+        return f"{final_analysis}\n\n---\n{cls.TRANSCRIPT_HEADING} di '{job['name']}'\n\n" + "  \n".join(transcript_text.splitlines())
+
+    @classmethod
+    def restore_transcript_passages(cls, job: Dict, analysis: str):
+        """Ricostruisce i passaggi della trascrizione da un'analisi in cache di una registrazione lunga."""
+        _, _, transcript_text = analysis.partition(cls.TRANSCRIPT_HEADING)
+        transcript = []
+        for line in transcript_text.splitlines():
+            match = cls._timestamp_pattern.match(line)
+            if match:
+                hours, minutes, seconds, sentence = match.groups()
+                transcript.append((int(hours or 0) * 3600 + int(minutes) * 60 + int(seconds), sentence.strip()))
+        job['passages'] = cls._transcript_passages(job, transcript) if transcript else []
+
+    @classmethod
+    def analyze_audio_with_gemini(cls, job: Dict) -> str:
+        """Analisi audio contestualizzata; le registrazioni lunghe vengono analizzate a segmenti."""
+        if cls._is_long_recording(job):
+            return cls._analyze_long_audio(job)
+        methodology_name = job['methodology_name']
+        prompt = f"""
+            Sei un tutor esperto in {methodology_name}. Analizza il file audio '{job['name']}'.
+            ANALISI PER {methodology_name.upper()}:
+            1. **Contenuto**: Trascrivi parti significative o descrivi il contenuto.
+            2. **Analisi Disciplinare**: Analizza secondo i principi di {methodology_name}.
+            3. **Connessioni Didattiche**: Collega agli argomenti: {job['user_topics']}.
+            4. **Domande Guida**: Proponi domande specifiche per {methodology_name}.
+            """
+        audio_file = cls._document_part(job)
+        return cls._generate(job, [prompt, audio_file], stream=True)
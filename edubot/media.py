@@ -0,0 +1,264 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Preparazione di immagini e registrazioni audio prima dell'analisi.
+# -----------------------------------------------------------------------------
+
+import time
+import wave
+from typing import Optional, Dict, List, Tuple
+from io import BytesIO
+from PIL import Image, ImageOps
+import numpy as np
+
+from edubot.settings import (
+    AUDIO_MAX_SILENCE_S, AUDIO_SEGMENT_OVERLAP_S, AUDIO_SEGMENT_SEARCH_S, AUDIO_SEGMENT_SECONDS,
+    AUDIO_SPEECH_SAMPLE_RATE, AUDIO_VAD_FRAME_MS, AUDIO_VAD_MARGIN_DB, AUDIO_VAD_PADDING_MS, IMAGE_JPEG_QUALITY,
+    IMAGE_MAX_EDGE_PX
+)
+
+
+class ImagePreprocessor:
+    """
+    Prepara le immagini prima dell'analisi: rotazione secondo i dati EXIF, riduzione al lato massimo
+    configurato, un solo fotogramma per i formati animati o multipagina (GIF, TIFF) e ricodifica
+    in un formato compatto. Le foto della lavagna da 4000px diventano poche centinaia di KB.
+    """
+    COMPACT_MIME_TYPES = {'image/jpeg', 'image/png', 'image/webp'}
+
+    def __init__(self, max_edge: int = IMAGE_MAX_EDGE_PX, quality: int = IMAGE_JPEG_QUALITY):
+        self.max_edge = max_edge
+        self.quality = quality
+
+    def process(self, data: bytes, mime_type: str) -> Tuple[bytes, str, Dict]:
+        """Restituisce i byte elaborati, il loro tipo MIME e le statistiche dell'elaborazione."""
+        start_time = time.perf_counter()
+        with Image.open(BytesIO(data)) as image:
+            original_size = image.size
+            image.seek(0) # Primo fotogramma di GIF animate e TIFF multipagina
+            rotated = image.getexif().get(0x0112, 1) != 1 # Tag EXIF "Orientation"
+            frame = ImageOps.exif_transpose(image)
+            changed = rotated or getattr(image, 'n_frames', 1) > 1
+
+            if max(frame.size) > self.max_edge:
+                frame.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+                changed = True
+            perceptual_hash = self.dhash(frame)
+
+            has_alpha = frame.mode in ('RGBA', 'LA') or (frame.mode == 'P' and 'transparency' in frame.info)
+            output = BytesIO()
+            if has_alpha:
+                frame.convert('RGBA').save(output, format='WEBP', quality=self.quality)
+                processed_mime = 'image/webp'
+            else:
+                frame.convert('RGB').save(output, format='JPEG', quality=self.quality, optimize=True)
+                processed_mime = 'image/jpeg'
+            processed = output.getvalue()
+            processed_size = frame.size
+
+        if not changed and mime_type in self.COMPACT_MIME_TYPES and len(processed) >= len(data):
+            # Immagine già compatta: la ricodifica non porterebbe vantaggi
+            processed, processed_mime, processed_size = data, mime_type, original_size
+
+        stats = {
+            'original_bytes': len(data),
+            'processed_bytes': len(processed),
+            'original_size': original_size,
+            'processed_size': processed_size,
+            'dhash': perceptual_hash,
+            'elapsed': time.perf_counter() - start_time
+        }
+        return processed, processed_mime, stats
+
+    @staticmethod
+    def dhash(image) -> int:
+        """
+        Impronta percettiva a 64 bit (difference hash): confronta la luminosità di pixel adiacenti
+        nell'immagine ridotta a 9x8. Resiste a ricompressione, ridimensionamento e piccoli ritagli.
+        """
+        pixels = np.asarray(image.convert('L').resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+        bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+        return int.from_bytes(bits.tobytes(), 'big')
+
+
+class AudioPreprocessor:
+    """
+    Prepara l'audio prima dell'analisi: riconosce il formato reale dai primi byte e, per le
+    registrazioni WAV, converte il parlato in mono a 16 kHz eliminando i silenzi iniziali, finali
+    e le pause lunghe (rilevamento dell'attività vocale basato sull'energia). Gli altri formati
+    sono già compressi e vengono inviati così come sono, con il tipo MIME corretto.
+    """
+    _signatures = [
+        (b"RIFF", 0, "audio/wav"),
+        (b"fLaC", 0, "audio/flac"),
+        (b"OggS", 0, "audio/ogg"),
+        (b"ID3", 0, "audio/mp3"),
+        (b"FORM", 0, "audio/aiff"),
+        (b"ftyp", 4, "audio/mp4"),
+        (b"\x1a\x45\xdf\xa3", 0, "audio/webm"),
+    ]
+
+    def __init__(self, sample_rate: int = AUDIO_SPEECH_SAMPLE_RATE, max_silence_s: float = AUDIO_MAX_SILENCE_S):
+        self.sample_rate = sample_rate
+        self.max_silence_s = max_silence_s
+
+    @classmethod
+    def sniff_mime_type(cls, data: bytes) -> Optional[str]:
+        """Tipo MIME reale del file audio, indipendentemente da nome ed estensione."""
+        for signature, offset, mime_type in cls._signatures:
+            if data[offset:offset + len(signature)] == signature:
+                return mime_type
+        if len(data) > 1 and data[0] == 0xFF and data[1] & 0xF6 == 0xF0:
+            return "audio/aac" # Flusso ADTS
+        if len(data) > 1 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0:
+            return "audio/mp3" # Frame MPEG senza tag ID3
+        return None
+
+    def process(self, data: bytes, full_quality: bool = False) -> Tuple[bytes, str, Dict]:
+        """Restituisce i byte elaborati, il loro tipo MIME e le statistiche dell'elaborazione."""
+        start_time = time.perf_counter()
+        mime_type = self.sniff_mime_type(data)
+        if mime_type is None:
+            raise ValueError("formato audio non riconosciuto")
+        stats = {'original_bytes': len(data), 'processed_bytes': len(data), 'format': mime_type.split('/')[1],
+                 'original_duration': None, 'processed_duration': None, 'kept_frames': None, 'elapsed': 0.0}
+        if mime_type != "audio/wav" or full_quality:
+            stats['elapsed'] = time.perf_counter() - start_time
+            return data, mime_type, stats
+
+        samples, sample_rate = self._decode_wav(data)
+        stats['original_duration'] = len(samples) / sample_rate
+        target_rate = min(sample_rate, self.sample_rate)
+        samples, kept_frames = self.trim_silence(self._resample(samples, sample_rate, target_rate), target_rate)
+        processed = self._encode_wav(samples, target_rate)
+        if len(processed) >= len(data):
+            processed = data
+        else:
+            stats['processed_duration'] = len(samples) / target_rate
+            stats['kept_frames'] = kept_frames
+        stats['processed_bytes'] = len(processed)
+        stats['elapsed'] = time.perf_counter() - start_time
+        return processed, mime_type, stats
+
+    @staticmethod
+    def _decode_wav(data: bytes) -> Tuple[np.ndarray, int]:
+        """Decodifica un WAV PCM in campioni mono a virgola mobile tra -1 e 1."""
+        with wave.open(BytesIO(data)) as wav_file:
+            channels, sample_width, sample_rate = wav_file.getnchannels(), wav_file.getsampwidth(), wav_file.getframerate()
+            frames = wav_file.readframes(wav_file.getnframes())
+        if sample_width == 1:
+            samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+        elif sample_width == 3:
+            raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+            values = raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8) | (raw[:, 2].astype(np.int32) << 16)
+            samples = (np.where(values >= 1 << 23, values - (1 << 24), values) / float(1 << 23)).astype(np.float32)
+        else:
+            dtype = {2: np.int16, 4: np.int32}[sample_width]
+            samples = np.frombuffer(frames, dtype=dtype).astype(np.float32) / float(np.iinfo(dtype).max)
+        # Mixaggio in mono
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels).mean(axis=1)
+        return samples, sample_rate
+
+    @staticmethod
+    def _resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+        """Ricampionamento verso il basso con filtro passa-basso (sinc finestrato) e interpolazione lineare."""
+        if source_rate <= target_rate or len(samples) == 0:
+            return samples
+        cutoff = 0.5 * target_rate / source_rate
+        taps = np.arange(-32, 33)
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hamming(len(taps))
+        filtered = np.convolve(samples, kernel / kernel.sum(), mode='same')
+        target_times = np.arange(int(len(samples) * target_rate / source_rate)) * (source_rate / target_rate)
+        return np.interp(target_times, np.arange(len(samples)), filtered).astype(np.float32)
+
+    def trim_silence(self, samples: np.ndarray, sample_rate: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Elimina i silenzi iniziali e finali e accorcia le pause lunghe. Un blocco è considerato parlato
+        se la sua energia supera di AUDIO_VAD_MARGIN_DB il rumore di fondo della registrazione.
+        Restituisce anche gli indici dei blocchi conservati, per risalire ai tempi della registrazione originale.
+        """
+        frame_length = int(sample_rate * AUDIO_VAD_FRAME_MS / 1000)
+        frame_count = len(samples) // frame_length
+        if frame_count < 2:
+            return samples, None
+        frames = samples[:frame_count * frame_length].reshape(frame_count, frame_length)
+        energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        noise_floor = np.percentile(energy_db, 10)
+        # Soglia mai più di 30 dB sotto il picco, per non scartare tutto nelle registrazioni senza pause
+        threshold = min(max(noise_floor + AUDIO_VAD_MARGIN_DB, -60.0), energy_db.max() - 30)
+        speech = energy_db > threshold
+        if not speech.any():
+            return samples, None
+
+        padding = max(1, AUDIO_VAD_PADDING_MS // AUDIO_VAD_FRAME_MS)
+        keep = np.convolve(speech, np.ones(2 * padding + 1), mode='same') > 0
+        # Delle pause lunghe si conservano solo i primi blocchi
+        max_silent_frames = int(self.max_silence_s * 1000 / AUDIO_VAD_FRAME_MS)
+        silent_run = 0
+        for position in range(np.argmax(keep), frame_count - np.argmax(keep[::-1])):
+            silent_run = 0 if keep[position] else silent_run + 1
+            if 0 < silent_run <= max_silent_frames:
+                keep[position] = True
+        return frames[keep].reshape(-1), np.flatnonzero(keep)
+
+    @staticmethod
+    def wav_duration(data: bytes) -> float:
+        """Durata in secondi letta dall'intestazione WAV, senza decodificare i campioni."""
+        with wave.open(BytesIO(data)) as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+
+    def split_segments(self, data: bytes, segment_s: float = AUDIO_SEGMENT_SECONDS,
+                       overlap_s: float = AUDIO_SEGMENT_OVERLAP_S) -> List[Dict]:
+        """
+        Divide un WAV in segmenti sovrapposti. Ogni taglio cade nel punto più silenzioso degli ultimi
+        AUDIO_SEGMENT_SEARCH_S secondi prima del confine, per non spezzare le frasi. I segmenti
+        conservano formato e qualità dell'originale.
+        """
+        with wave.open(BytesIO(data)) as wav_file:
+            params = wav_file.getparams()
+            frames = wav_file.readframes(params.nframes)
+        samples, sample_rate = self._decode_wav(data)
+        duration = len(samples) / sample_rate
+        frame_length = int(sample_rate * AUDIO_VAD_FRAME_MS / 1000)
+        frame_count = len(samples) // frame_length
+        energy = np.mean(samples[:frame_count * frame_length].reshape(frame_count, frame_length) ** 2, axis=1)
+
+        cuts = [0.0]
+        while duration - cuts[-1] > segment_s * 1.2: # Evita un ultimo segmento di pochi secondi
+            search_end = int((cuts[-1] + segment_s) * 1000 / AUDIO_VAD_FRAME_MS)
+            search_start = max(int((cuts[-1] + segment_s - AUDIO_SEGMENT_SEARCH_S) * 1000 / AUDIO_VAD_FRAME_MS), 0)
+            quietest = search_start + int(np.argmin(energy[search_start:search_end]))
+            cuts.append(quietest * AUDIO_VAD_FRAME_MS / 1000)
+        cuts.append(duration)
+
+        bytes_per_frame = params.nchannels * params.sampwidth
+        segments = []
+        for number, (cut_start, cut_end) in enumerate(zip(cuts, cuts[1:]), 1):
+            start, end = max(cut_start - overlap_s, 0.0), min(cut_end + overlap_s, duration)
+            output = BytesIO()
+            with wave.open(output, 'wb') as segment_file:
+                segment_file.setparams(params)
+                segment_file.writeframes(frames[int(start * sample_rate) * bytes_per_frame:int(end * sample_rate) * bytes_per_frame])
+            segments.append({'number': number, 'start': start, 'end': end, 'cut_start': cut_start, 'cut_end': cut_end,
+                             'data': output.getvalue()})
+        return segments
+
+    @staticmethod
+    def _encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+        output = BytesIO()
+        with wave.open(output, 'wb') as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes((np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes())
+        return output.getvalue()
+
+
+class RecordedAudioFile:
+    """Registrazione del microfono con la stessa interfaccia dei file caricati; il formato è ricavato dai dati."""
+
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self._data = data
+        self.type = AudioPreprocessor.sniff_mime_type(data) or "audio/wav"
+
+    def getvalue(self) -> bytes:
+        return self._data
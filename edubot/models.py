@@ -0,0 +1,407 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Gestione del modello Gemini e rilevamento della materia.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import google.generativeai as genai
+import time
+import logging
+import re
+import os
+import json
+from typing import Optional, Dict, List, Tuple, Iterator
+import numpy as np
+
+from edubot.settings import (
+    GENERATION_METRICS_HISTORY, MODEL_CONFIGS, PROMPT_FILE_PATH, SUBJECT_CONTEXT_DECAY,
+    SUBJECT_EXAMPLES_PATH, SUBJECT_LOCAL_MIN_CONFIDENCE, SUBJECT_METHODOLOGY_CONFIGS, SUBJECT_SUGGESTION_MIN_CONFIDENCE,
+    SUBJECT_TRAINING_LOG_PATH
+)
+from edubot.configuration import ConfigurationManager, FileManager
+from edubot.text_processing import ItalianTextProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class SubjectClassifier:
+    """
+    Classificatore locale della materia (naive Bayes multinomiale sulle radici italiane, senza
+    parole funzionali). È addestrato sui testi di config.py (nome, descrizione, parole chiave,
+    metodologia e suggerimenti di prompt), sulle domande etichettate di subject_examples.jsonl e,
+    facoltativamente, su chat etichettate nello stesso formato ({"text": ..., "subject_key": ...}).
+    """
+    SMOOTHING = 0.05 # Conteggio aggiunto a ogni radice: più basso rende più netta la confidenza
+
+    def __init__(self, examples_path: Optional[str] = SUBJECT_EXAMPLES_PATH, training_log_path: Optional[str] = None):
+        documents, labels = self._training_documents(examples_path, training_log_path)
+        tokenized = [ItalianTextProcessor.content_stems(doc) for doc in documents]
+        vocabulary = sorted({token for doc in tokenized for token in doc})
+        self.vocabulary = {token: i for i, token in enumerate(vocabulary)}
+        self.subject_keys = list(SUBJECT_METHODOLOGY_CONFIGS.keys())
+
+        # Log-probabilità di ogni radice per materia, con smoothing additivo
+        counts = np.zeros((len(self.subject_keys), len(vocabulary)))
+        for doc, label in zip(tokenized, labels):
+            counts[self.subject_keys.index(label)] += self.count_vector(doc)
+        self.log_likelihoods = np.log(
+            (counts + self.SMOOTHING) / (counts.sum(axis=1, keepdims=True) + self.SMOOTHING * len(vocabulary))
+        )
+
+    def _training_documents(self, examples_path: Optional[str], training_log_path: Optional[str]) -> Tuple[List[str], List[str]]:
+        """Raccoglie i testi di addestramento: una frase per documento."""
+        documents, labels = [], []
+
+        def add(text: str, subject_key: str):
+            for sentence in re.split(r"[\n.;]+", text):
+                if sentence.strip():
+                    documents.append(sentence)
+                    labels.append(subject_key)
+
+        for key, config in SUBJECT_METHODOLOGY_CONFIGS.items():
+            add(config['display_name'], key)
+            add(config['description'], key)
+            for keyword in config.get('keywords', "").split(","):
+                add(keyword, key)
+            add(config['methodology_template'], key)
+            for suggestions in config.get('prompt_suggestions', {}).values():
+                for suggestion in suggestions:
+                    add(suggestion, key)
+
+        for path in (examples_path, training_log_path):
+            if not path or not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        record = json.loads(line)
+                        if record.get('subject_key') in SUBJECT_METHODOLOGY_CONFIGS and record.get('text'):
+                            documents.append(record['text'])
+                            labels.append(record['subject_key'])
+                logger.info(f"✅ Messaggi etichettati caricati da '{path}' per il classificatore delle materie.")
+            except Exception as e:
+                logger.error(f"❌ Errore nel caricamento dei messaggi etichettati '{path}': {e}")
+        return documents, labels
+
+    def count_vector(self, tokens: List[str]) -> np.ndarray:
+        """Conteggio delle radici note al vocabolario."""
+        counts = np.zeros(len(self.vocabulary))
+        for token in tokens:
+            index = self.vocabulary.get(token)
+            if index is not None:
+                counts[index] += 1
+        return counts
+
+    def predict_counts(self, counts: np.ndarray) -> Tuple[str, float]:
+        """Restituisce (chiave della materia, probabilità 0-1) per un vettore di conteggi."""
+        if not counts.any():
+            return "generale", 0.0
+        log_posteriors = self.log_likelihoods @ counts # Materie equiprobabili a priori
+        probabilities = np.exp(log_posteriors - log_posteriors.max())
+        probabilities /= probabilities.sum()
+        best = int(np.argmax(probabilities))
+        return self.subject_keys[best], float(probabilities[best])
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Classifica un singolo testo."""
+        return self.predict_counts(self.count_vector(ItalianTextProcessor.content_stems(text)))
+
+    @staticmethod
+    def is_reliable(subject_key: str, confidence: float) -> bool:
+        """
+        Indica se la stima locale può sostituire il modello AI. "generale" raccoglie le parole comuni
+        a ogni richiesta di studio: non viene mai accettata in locale, ci pensa il modello.
+        """
+        return subject_key != "generale" and confidence >= SUBJECT_LOCAL_MIN_CONFIDENCE
+
+
+class SubjectContextTracker:
+    """
+    Vettore delle caratteristiche della conversazione di una sessione, aggiornato in modo
+    incrementale a ogni nuovo messaggio. I messaggi meno recenti pesano progressivamente meno.
+    """
+    def __init__(self, classifier: SubjectClassifier, decay: float = SUBJECT_CONTEXT_DECAY):
+        self.classifier = classifier
+        self.decay = decay
+        self.counts = np.zeros(len(classifier.vocabulary))
+        self.observed_messages = 0
+
+    def observe(self, text: str, weight: float = 1.0):
+        """Aggiunge un messaggio al contesto."""
+        self.counts *= self.decay
+        self.counts += weight * self.classifier.count_vector(ItalianTextProcessor.content_stems(text))
+
+    def sync(self, history: List[Dict]):
+        """Osserva solo i messaggi della cronologia non ancora elaborati."""
+        if len(history) < self.observed_messages:
+            # La cronologia è stata azzerata: si riparte da capo
+            self.counts[:] = 0
+            self.observed_messages = 0
+        for message in history[self.observed_messages:]:
+            # Le risposte di EduBot sono lunghe e riprendono la domanda: pesano meno dei messaggi dell'utente
+            weight = 1.0 if message['role'] == 'user' else 0.5
+            self.observe(message['parts'][0]['text'], weight)
+        self.observed_messages = len(history)
+
+    def predict(self) -> Tuple[str, float]:
+        return self.classifier.predict_counts(self.counts)
+
+
+@st.cache_resource
+def get_subject_classifier() -> SubjectClassifier:
+    """Classificatore delle materie condiviso dal processo (addestrato una sola volta)."""
+    return SubjectClassifier(SUBJECT_EXAMPLES_PATH, SUBJECT_TRAINING_LOG_PATH)
+
+
+class ModelManager:
+    """Gestore dei modelli AI e delle loro configurazioni."""
+    def __init__(self, config_manager: ConfigurationManager):
+        self.config_manager = config_manager
+
+    @staticmethod
+    def build_generation_settings(model_name: str) -> Tuple[genai.types.GenerationConfig, List[Dict]]:
+        """Parametri di generazione e filtri di sicurezza per il modello e la materia correnti."""
+        base_model_config = MODEL_CONFIGS.get(model_name, {})
+        selected_subject = st.session_state.get("selected_subject_methodology", "generale")
+
+        subject_params = base_model_config.get("subject_configs", {}).get(selected_subject, {})
+
+        temp_override = st.session_state.get("temp_override")
+        top_k_override = st.session_state.get("top_k_override")
+
+        final_temp = temp_override if temp_override is not None else subject_params.get("temperature", base_model_config.get("temperature", 0.7))
+        final_top_k = top_k_override if top_k_override is not None else subject_params.get("top_k", base_model_config.get("top_k", 40))
+
+        safety_settings = [
+            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_LOW_AND_ABOVE"},
+            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_LOW_AND_ABOVE"},
+            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_LOW_AND_ABOVE"},
+            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_LOW_AND_ABOVE"},
+        ]
+
+        generation_config = genai.types.GenerationConfig(
+            temperature=final_temp,
+            top_p=base_model_config.get("top_p", 0.9),
+            top_k=final_top_k,
+            max_output_tokens=base_model_config.get("max_output_tokens", 4096),
+        )
+        return generation_config, safety_settings
+
+    def initialize_model_safe(self, model_name: str, system_prompt: str, force_reinit: bool = False) -> Optional[genai.GenerativeModel]:
+        """Inizializzazione sicura del modello che evita re-inizializzazioni inutili."""
+        try:
+            if (not force_reinit and
+                st.session_state.get('model_initialized', False) and
+                st.session_state.get('model') is not None and
+                st.session_state.get('selected_model') == model_name):
+                logger.info(f"✅ Modello '{model_name}' già inizializzato, uso cache")
+                return st.session_state.model
+
+            generation_config, safety_settings = self.build_generation_settings(model_name)
+
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                system_instruction=system_prompt,
+                generation_config=generation_config,
+                safety_settings=safety_settings
+            )
+            
+            logger.info(f"✅ Modello '{model_name}' INIZIALIZZATO. Temp: {generation_config.temperature}, Top-K: {generation_config.top_k}")
+            return model
+
+        except Exception as e:
+            logger.error(f"❌ Errore critico nell'inizializzazione del modello: {e}")
+            st.error(f"Errore nell'inizializzazione del modello: {e}")
+            return None
+
+    def auto_initialize_system(self, file_manager: FileManager) -> bool:
+        """Inizializzazione automatica del sistema all'avvio."""
+        if st.session_state.get('auto_initialization_done', False):
+            return True
+            
+        try:
+            if not st.session_state.get('api_key_configured', False):
+                return False
+                
+            with st.spinner("🚀 Inizializzazione automatica del sistema..."):
+                base_template = file_manager.load_base_template_from_file(PROMPT_FILE_PATH)
+                system_prompt = self.config_manager.build_dynamic_system_prompt(base_template)
+                st.session_state.current_system_prompt = system_prompt
+                
+                model = self.initialize_model_safe(
+                    st.session_state.get('selected_model', 'gemini-1.5-flash'), 
+                    system_prompt,
+                    force_reinit=True
+                )
+                
+                if model:
+                    st.session_state.model = model
+                    st.session_state.model_initialized = True
+                    logger.info("✅ Sistema auto-inizializzato con successo")
+                    return True
+                    
+        except Exception as e:
+            logger.error(f"Errore auto-inizializzazione: {e}")
+        
+        return False
+
+    # def generate_topic_suggestions_direct(self) -> str:
+    # All'interno della classe ModelManager
+
+    @st.cache_data
+    def generate_topic_suggestions_direct(_self, methodology_name: str) -> str:
+        """Genera 6 suggerimenti argomenti semplici e brevi con chiamata diretta (con cache)."""
+        try:
+            simple_model = genai.GenerativeModel('gemini-1.5-flash')
+            
+            suggestion_prompt = f"""
+            Sei un assistente per docenti di scuola secondaria. Il tuo compito è suggerire esattamente 6 argomenti di studio per la materia "{methodology_name}".
+
+            REQUISITI OBBLIGATORI:
+            - Livello: Gli argomenti devono essere adatti a studenti di scuola secondaria (14-18 anni).
+            - Semplicità: Usa un linguaggio chiaro e diretto.
+            - Brevità: Formula ogni argomento come una frase breve e concisa (massimo 10 parole).
+            - Specificità: Evita argomenti troppo generici (es. "La storia di Roma"). Sii più specifico (es. "Le guerre puniche tra Roma e Cartagine").
+
+            FORMATO RISPOSTA:
+            Rispondi SOLO con i 6 argomenti separati da virgole, senza numerazione, trattini o altre spiegazioni.
+            """
+            
+            response = simple_model.generate_content(
+                suggestion_prompt,
+                generation_config=genai.types.GenerationConfig(
+                    temperature=0.8,
+                    max_output_tokens=250
+                )
+            )
+            return response.text.strip() if response and response.text else "Errore nella generazione dei suggerimenti"
+            
+        except Exception as e:
+            logger.error(f"Errore generazione suggerimenti: {e}")
+            return "Le guerre puniche, Il teorema di Pitagora, La Divina Commedia di Dante, La cellula animale, La Rivoluzione Francese, I principi della termodinamica"
+    
+    @staticmethod
+    def build_subject_context(history_messages: int = 4, user_turns_only: bool = False) -> str:
+        """
+        Prepara il contesto (ultimi messaggi e file analizzati) per il rilevamento della materia.
+        Con user_turns_only vengono esclusi i messaggi del modello, che possono riportare il contenuto
+        dei file caricati: serve quando il contesto accompagna una verifica di sicurezza.
+        """
+        # Di default gli ultimi 4 messaggi (2 scambi utente-bot)
+        messages = [msg for msg in st.session_state.history if not user_turns_only or msg['role'] == 'user']
+        history_context = "\n".join([f"{msg['role']}: {msg['parts'][0]['text']}" for msg in messages[-history_messages:]])
+        files_context = ", ".join([f['name'] for f in st.session_state.analyzed_files])
+        return f"CONTESTO CHAT:\n{history_context}\n\nFILE ANALIZZATI:\n{files_context}"
+
+    @staticmethod
+    def update_subject_suggestion(subject_key: str, confidence: float, source: str):
+        """Aggiorna il suggerimento di materia mostrato nei Preset Materie."""
+        st.session_state.last_subject_detection = {
+            'subject_key': subject_key, 'confidence': confidence, 'source': source, 'timestamp': time.time()
+        }
+        if subject_key == st.session_state.get("selected_subject_methodology"):
+            st.session_state.pop('suggested_subject', None)
+        elif confidence >= SUBJECT_SUGGESTION_MIN_CONFIDENCE:
+            st.session_state.suggested_subject = subject_key
+
+    @staticmethod
+    def get_subject_tracker() -> SubjectContextTracker:
+        """Restituisce il tracker della sessione, allineato alla cronologia attuale."""
+        tracker = st.session_state.get("subject_tracker")
+        if tracker is None:
+            tracker = SubjectContextTracker(get_subject_classifier())
+            st.session_state.subject_tracker = tracker
+        tracker.sync(st.session_state.history)
+        return tracker
+
+    def detect_subject_from_context(self) -> Tuple[str, float, str]:
+        """
+        Analizza la chat e i file per dedurre la materia più pertinente.
+        Usa prima il classificatore locale; il modello AI viene interrogato solo se la confidenza è bassa.
+        Restituisce (chiave della materia, confidenza, origine).
+        """
+        tracker = self.get_subject_tracker()
+        # I nomi dei file analizzati contribuiscono alla stima senza alterare il contesto persistente
+        local_counts = tracker.counts + tracker.classifier.count_vector(
+            ItalianTextProcessor.content_stems(" ".join(f['name'] for f in st.session_state.analyzed_files))
+        )
+        subject_key, confidence = tracker.classifier.predict_counts(local_counts)
+        if tracker.classifier.is_reliable(subject_key, confidence):
+            return subject_key, confidence, "locale"
+        return self._detect_subject_with_ai(self.build_subject_context()), 1.0, "ai"
+
+    @classmethod
+    def _detect_subject_with_ai(cls, full_context: str) -> str:
+        """Classifica la materia con il modello AI a partire dal contesto testuale."""
+        try:
+            # 1. Prepara l'elenco delle materie da config.py
+            subject_list = ConfigurationManager.subject_options_for_prompt()
+
+            # 2. Costruisci il prompt per il classificatore
+            system_prompt = f"""
+            Sei un esperto classificatore accademico. Il tuo unico compito è analizzare il testo fornito
+            e restituire la "Chiave" della materia più pertinente dall'elenco sottostante.
+
+            ELENCO MATERIE DISPONIBILI:
+            {subject_list}
+
+            REGOLE:
+            - La tua risposta DEVE contenere ESCLUSIVAMENTE la chiave della materia (es. 'storia_filosofia').
+            - Se il contesto non è chiaro o è generico, rispondi 'generale'.
+            - Non aggiungere spiegazioni o altre parole.
+            """
+
+            # 3. Esegui la classificazione con un modello veloce
+            classifier_model = genai.GenerativeModel('gemini-1.5-flash')
+            response = classifier_model.generate_content(
+                f"{system_prompt}\n\n--- TESTO DA CLASSIFICARE ---\n{full_context}",
+                generation_config=genai.types.GenerationConfig(temperature=0.0)
+            )
+
+            detected_key = response.text.strip()
+            # Valida che la chiave esista, altrimenti usa 'generale'
+            return detected_key if detected_key in SUBJECT_METHODOLOGY_CONFIGS else "generale"
+
+        except Exception as e:
+            logger.error(f"Errore durante il rilevamento della materia: {e}")
+            return "generale" # Fallback sicuro
+
+    @staticmethod
+    def build_request_contents(history: List[Dict]) -> List[Dict]:
+        """Prepara la cronologia per il modello, escludendo i metadati usati solo dall'interfaccia."""
+        return [{'role': msg['role'], 'parts': msg['parts']} for msg in history]
+
+    @staticmethod
+    def iter_response_text(response) -> Iterator[str]:
+        """Estrae il testo dai frammenti di una risposta in streaming, ignorando quelli vuoti."""
+        for chunk in response:
+            try:
+                chunk_text = chunk.text
+            except ValueError:
+                # Frammento senza testo (es. risposta interrotta dai filtri di sicurezza)
+                continue
+            if chunk_text:
+                yield chunk_text
+
+    @staticmethod
+    def record_generation_metrics(time_to_first_token: Optional[float], total_time: float, streamed: bool,
+                                  security_time: Optional[float] = None, latency_saved: Optional[float] = None,
+                                  context_stats: Optional[Dict] = None):
+        """Registra le metriche di latenza e di contesto dell'ultimo turno di chat."""
+        context_stats = context_stats or {}
+        metrics = st.session_state.setdefault("generation_metrics", [])
+        metrics.append({
+            'timestamp': time.time(),
+            'time_to_first_token': time_to_first_token,
+            'total_time': total_time,
+            'streamed': streamed,
+            'security_time': security_time,
+            'speculative': latency_saved is not None,
+            'latency_saved': latency_saved,
+            'context_tokens_before': context_stats.get('tokens_before'),
+            'context_tokens_after': context_stats.get('tokens_after')
+        })
+        del metrics[:-GENERATION_METRICS_HISTORY]
+        logger.info(f"⏱️ Generazione completata in {total_time:.2f}s (primo token: "
+                    f"{f'{time_to_first_token:.2f}s' if time_to_first_token is not None else 'n/d'}, streaming: {streamed})")
@@ -0,0 +1,126 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Stato della sessione utente.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import time
+import hashlib
+import uuid
+
+from edubot.settings import CHAT_HISTORY_WINDOW, CONTEXT_TOKEN_BUDGET, DEPLOYMENT_MODE, SESSION_TIMEOUT
+from edubot.security import SecuritySystem
+from edubot.chat import ChatRenderCache
+from edubot.documents import DocumentRetrievalIndex, DocumentStore, create_document_backend, get_document_store_registry
+from edubot.files import get_upload_spool
+
+
+class SessionManager:
+    """Gestore dello stato della sessione e della configurazione."""
+    def __init__(self):
+        self.session_timeout = SESSION_TIMEOUT
+        self.deployment_mode = DEPLOYMENT_MODE
+
+    def initialize_session_state(self):
+        """Inizializza lo stato della sessione in modo pulito."""
+        welcome_message = {
+            'role': 'model',
+            'parts': [{'text': "Ciao! Sono EduBot, il tuo tutor pedagogico. Il mio compito è guidarti nello studio e nell'apprendimento."}]
+        }
+
+        defaults = {
+            "api_key_configured": False,
+            "model_initialized": False,
+            "setup_step": "welcome",
+            "api_key_entered": False if self.deployment_mode == "user_api" else True,
+            "final_privacy_accepted": False,
+            "informative_index": 0,
+            "all_informatives_read": False,
+            "anonymous_session_id": f"session_{uuid.uuid4().hex[:12]}",
+            "api_key_hash": None,
+            "session_start_time": time.time(),
+            "deployment_mode": self.deployment_mode,
+            "selected_subject_methodology": "generale",
+            "custom_pedagogical_principles": [],
+            "user_methodology": "Nessuna metodologia specifica fornita.",
+            "security_system": None,
+            "document_store": None,
+            "retrieval_index": None,
+            "attach_documents_to_chat": True,
+            "selected_model": "gemini-2.5-flash",
+            "model": None,
+            "history": [welcome_message],
+            "user_topics": "Nessun argomento specifico fornito.",
+            "analyzed_files": [],
+            "files_to_process": [],
+            "file_upload_key": 0,
+            "security_stats": {"blocked_attempts": 0},
+            "current_system_prompt": None,
+            "last_methodology_change": 0,
+            "processing_files": False,
+            "file_processing_report": None,
+            "notification_cooldown": 0,
+            "stream_responses": True,
+            "speculative_generation": False,
+            "generation_metrics": [],
+            "rerun_metrics": [],
+            "chat_visible_messages": CHAT_HISTORY_WINDOW,
+            "chat_render_cache": None,
+            "context_token_budget": CONTEXT_TOKEN_BUDGET,
+            "context_summary": {"text": "", "covered_messages": 0},
+            "custom_prompt_sections": {
+                "ruolo_personalita": None,
+                "metodologia_base": None,
+                "obiettivi_comportamento": None
+            }
+        }
+
+        for key, default_value in defaults.items():
+            if key not in st.session_state:
+                st.session_state[key] = default_value
+
+        if st.session_state.security_system is None:
+            st.session_state.security_system = SecuritySystem(st.session_state.anonymous_session_id)
+
+        if st.session_state.retrieval_index is None:
+            st.session_state.retrieval_index = DocumentRetrievalIndex()
+
+        if st.session_state.chat_render_cache is None:
+            st.session_state.chat_render_cache = ChatRenderCache()
+
+        if st.session_state.document_store is None:
+            st.session_state.document_store = DocumentStore(
+                create_document_backend(), st.session_state.session_start_time + self.session_timeout
+            )
+            # Il registro elimina i documenti alla scadenza anche se la sessione viene abbandonata
+            get_document_store_registry().register(st.session_state.anonymous_session_id, st.session_state.document_store)
+
+    @staticmethod
+    def mark_activity():
+        """Chiamato a ogni rerun: la coda su disco della sessione resta valida finché la sessione è in uso."""
+        get_upload_spool().touch(st.session_state.anonymous_session_id)
+
+    def check_session_timeout(self) -> bool:
+        """Controlla se la sessione è scaduta."""
+        return time.time() - st.session_state.session_start_time > self.session_timeout
+
+    def reset_session(self):
+        """Reset completo della sessione."""
+        if st.session_state.get('document_store'):
+            st.session_state.document_store.clear()
+        if st.session_state.get('anonymous_session_id'):
+            get_upload_spool().release_session(st.session_state.anonymous_session_id)
+        keys_to_keep = {
+            'anonymous_session_id': st.session_state.get('anonymous_session_id'),
+            'session_start_time': st.session_state.get('session_start_time')
+        }
+        st.session_state.clear()
+        for key, value in keys_to_keep.items():
+            if value is not None:
+                st.session_state[key] = value
+        self.initialize_session_state()
+        st.rerun()
+
+    @staticmethod
+    def hash_api_key(api_key: str) -> str:
+        """Crea un hash sicuro della chiave API."""
+        return hashlib.sha256(api_key.encode()).hexdigest()
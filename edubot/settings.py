@@ -0,0 +1,150 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Configurazioni, variabili d'ambiente e costanti dell'applicazione.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import time
+import logging
+import os
+import tempfile
+from typing import Dict
+
+# Inizio del caricamento del pacchetto: edubot viene importato una sola volta per processo
+PACKAGE_IMPORT_STARTED = time.perf_counter()
+STARTUP_METRICS: Dict[str, float] = {} # Tempi di avvio del processo, completati da edubot.application
+
+# --- CARICAMENTO CONFIGURAZIONI ---
+# Assicurati che il file config.py sia presente e contenga i dizionari necessari.
+# Come da tue istruzioni, i dati sono in config.py
+try:
+    import config
+    # Riesportati da edubot.settings: il resto del pacchetto li importa da qui
+    SUBJECT_METHODOLOGY_CONFIGS = config.SUBJECT_METHODOLOGY_CONFIGS
+    MODEL_CONFIGS = config.MODEL_CONFIGS
+    PEDAGOGICAL_PRINCIPLES = config.PEDAGOGICAL_PRINCIPLES
+except (ImportError, AttributeError):
+    st.error("ERRORE CRITICO: Il file 'config.py' non è stato trovato o è incompleto. L'applicazione non può avviarsi.")
+    st.stop()
+
+# Configurazione logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# --- CARICAMENTO VARIABILI D'AMBIENTE ---
+if not os.path.exists('/.dockerenv'):
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+        logger.info("📍 Rilevato ambiente locale. File .env caricato.")
+    except ImportError:
+        logger.info("📍 Ambiente locale rilevato ma python-dotenv non installato.")
+
+# --- CONFIGURAZIONE E GESTIONE VARIABILI D'AMBIENTE ---
+SERVER_API_KEY = os.getenv("GOOGLE_API_KEY")
+PROMPT_FILE_PATH = os.getenv("PROMPT_FILE_PATH", "prompt.md")
+DEPLOYMENT_MODE = "server" if SERVER_API_KEY else "user_api"
+
+# --- COSTANTI DI CONFIGURAZIONE ---
+SESSION_TIMEOUT = 3600
+PDF_MAX_SIZE_MB = 10
+MAX_IMAGE_SIZE_MB = 5
+MAX_AUDIO_SIZE_MB = 10
+GENERATION_METRICS_HISTORY = 50 # Numero di turni di cui conservare le metriche di generazione
+RERUN_METRICS_HISTORY = 50 # Numero di rerun dell'interfaccia di cui conservare il tempo di esecuzione
+
+# --- PRE-FILTRO LOCALE DI SICUREZZA ---
+# Soglie (0-1): via libera locale sotto ALLOW sul punteggio di rischio, blocco locale oltre BLOCK
+# sulla similarità con gli esempi di minaccia. I valori intermedi vengono verificati dal modello AI.
+INJECTION_PREFILTER_ENABLED = os.getenv("INJECTION_PREFILTER_ENABLED", "true").lower() in ("1", "true", "yes")
+INJECTION_ALLOW_THRESHOLD = float(os.getenv("INJECTION_ALLOW_THRESHOLD", "0.25"))
+INJECTION_BLOCK_THRESHOLD = float(os.getenv("INJECTION_BLOCK_THRESHOLD", "0.85"))
+INJECTION_LOCAL_MAX_CHARS = int(os.getenv("INJECTION_LOCAL_MAX_CHARS", "1000"))
+
+# --- CACHE CONDIVISA DEI VERDETTI DI SICUREZZA ---
+INJECTION_CACHE_MAX_BYTES = 2 * 1024 * 1024 # Memoria massima occupata dai verdetti
+INJECTION_CACHE_TTL = 6 * 3600 # Durata di validità di un verdetto (secondi)
+INJECTION_CACHE_MAX_TEXT_BYTES = 4096 # I testi più lunghi non vengono memorizzati
+SUBJECT_SUGGESTION_MIN_CONFIDENCE = 0.7 # Confidenza minima per proporre automaticamente un cambio di materia
+
+# --- CLASSIFICATORE LOCALE DELLE MATERIE ---
+SUBJECT_LOCAL_MIN_CONFIDENCE = float(os.getenv("SUBJECT_LOCAL_MIN_CONFIDENCE", "0.9")) # Sotto questa soglia si interroga il modello AI
+SUBJECT_CONTEXT_DECAY = 0.8 # Peso residuo dei messaggi precedenti a ogni nuovo messaggio
+SUBJECT_EXAMPLES_PATH = os.getenv("SUBJECT_EXAMPLES_PATH", "subject_examples.jsonl") # Domande etichettate distribuite con EduBot
+SUBJECT_TRAINING_LOG_PATH = os.getenv("SUBJECT_TRAINING_LOG_PATH") # Chat etichettate (JSONL) facoltative
+SECURITY_BATCH_MAX_WORKERS = 3 # Chiamate parallele massime se la verifica in blocco non è disponibile
+
+# --- CONTESTO DELLA CONVERSAZIONE ---
+# Budget di token per ogni richiesta: i turni recenti restano testuali, i più vecchi confluiscono in un riepilogo.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+CONTEXT_SUMMARY_MAX_TOKENS = 800 # Lunghezza massima del riepilogo dei turni precedenti
+CONTEXT_REFILL_RATIO = 0.6 # Dopo un riepilogo i turni testuali occupano al più questa quota del budget
+CONTEXT_CHARS_PER_TOKEN = 4 # Stima locale dei token, senza chiamate all'API
+
+# --- RIFERIMENTI AI DOCUMENTI CARICATI ---
+# "gemini" usa Files API e context caching, "local" simula il ciclo di vita senza rete (per le prove offline).
+DOCUMENT_BACKEND = os.getenv("DOCUMENT_BACKEND", "gemini")
+DOCUMENT_CACHE_MIN_TTL = 300 # Sotto questa durata residua della sessione non conviene creare un contesto in cache
+DOCUMENT_SWEEP_INTERVAL = int(os.getenv("DOCUMENT_SWEEP_INTERVAL", "300")) # Secondi tra due controlli dei documenti scaduti
+INLINE_REQUEST_MAX_MB = 15 # Parti più grandi vengono caricate come file invece che inviate nella richiesta (limite API: 20MB)
+
+# --- ELABORAZIONE PARALLELA DEI FILE ---
+FILE_PROCESSING_MAX_WORKERS = int(os.getenv("FILE_PROCESSING_MAX_WORKERS", "4")) # Analisi contemporanee per sessione
+FILE_PROCESSING_GLOBAL_LIMIT = int(os.getenv("FILE_PROCESSING_GLOBAL_LIMIT", "8")) # Analisi contemporanee per l'intero server
+
+# --- CACHE DELLE ANALISI DEI FILE ---
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", ".cache/analisi_file")
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# --- ESTRAZIONE DEL TESTO DAI PDF E RICERCA NEI DOCUMENTI ---
+PDF_TEXT_ONLY_MIN_CHARS_PER_PAGE = 100 # Sotto questa soglia una pagina è considerata scansionata o grafica
+PDF_TEXT_ONLY_MAX_CHARS = 200_000 # Oltre questa lunghezza il PDF viene comunque inviato come file
+RETRIEVAL_CHUNK_CHARS = 1200 # Lunghezza massima di un passaggio indicizzato
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4")) # Passaggi allegati a ogni domanda
+
+# --- ANALISI MAP-REDUCE DEI PDF DI GRANDI DIMENSIONI ---
+PDF_MAP_REDUCE_MAX_SIZE_MB = 50 # Limite per i PDF analizzati a blocchi di pagine (oltre PDF_MAX_SIZE_MB)
+PDF_MAP_REDUCE_MIN_PAGES = 40 # Oltre questo numero di pagine il PDF viene analizzato a blocchi
+PDF_PAGES_PER_RANGE = 20 # Pagine di ogni blocco analizzato separatamente
+
+# --- PREELABORAZIONE DELLE IMMAGINI ---
+IMAGE_MAX_EDGE_PX = int(os.getenv("IMAGE_MAX_EDGE_PX", "1536")) # Lato massimo dopo il ridimensionamento
+IMAGE_JPEG_QUALITY = 85 # Qualità di ricodifica (JPEG per le foto, WebP per le immagini con trasparenza)
+
+# --- RICONOSCIMENTO DELLE IMMAGINI QUASI IDENTICHE ---
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "6")) # Bit diversi (su 64) per considerare due immagini uguali
+IMAGE_HASH_INDEX_MAX_ENTRIES = 50_000 # Immagini ricordate dall'indice condiviso
+
+# --- PREELABORAZIONE DELL'AUDIO ---
+AUDIO_SPEECH_SAMPLE_RATE = 16_000 # Frequenza di campionamento per il parlato (mono, 16 bit)
+AUDIO_VAD_FRAME_MS = 30 # Durata dei blocchi su cui si misura l'energia del segnale
+AUDIO_VAD_MARGIN_DB = 12 # Un blocco è parlato se supera di questo margine il rumore di fondo
+AUDIO_VAD_PADDING_MS = 200 # Margine conservato prima e dopo ogni tratto di parlato
+AUDIO_MAX_SILENCE_S = 1.0 # I silenzi interni più lunghi vengono accorciati a questa durata
+AUDIO_FULL_QUALITY_SUBJECTS = {'musicali'} # Materie in cui timbro e dinamica contano: audio inviato intatto
+
+# --- ANALISI A SEGMENTI DELLE REGISTRAZIONI LUNGHE ---
+AUDIO_LONG_MAX_SIZE_MB = 200 # Limite per le registrazioni WAV analizzate a segmenti (oltre MAX_AUDIO_SIZE_MB)
+AUDIO_LONG_MIN_SECONDS = 600 # Oltre questa durata la registrazione viene analizzata a segmenti
+AUDIO_SEGMENT_SECONDS = 300 # Durata indicativa di ogni segmento
+AUDIO_SEGMENT_OVERLAP_S = 5 # Sovrapposizione tra segmenti consecutivi, per non perdere le frasi sul confine
+AUDIO_SEGMENT_SEARCH_S = 30 # Il taglio cade nel punto più silenzioso degli ultimi secondi prima del confine
+
+# --- CODA DEI FILE CARICATI ---
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "edubot_coda"))
+UPLOAD_SPOOL_MAX_MB = int(os.getenv("UPLOAD_SPOOL_MAX_MB", "2048")) # Spazio su disco per i file in coda di tutte le sessioni
+UPLOAD_MEMORY_BUDGET_MB = int(os.getenv("UPLOAD_MEMORY_BUDGET_MB", "512")) # File in elaborazione contemporanea nell'intero processo
+
+# --- RIANALISI INCREMENTALE DELLE NUOVE VERSIONI DEI PDF ---
+PDF_VERSION_MIN_SHARED_RATIO = 0.5 # Quota minima di pagine in comune (sul più lungo dei due documenti) per riconoscere una nuova versione
+PDF_VERSION_MIN_SHARED_PAGES = 3 # Pagine in comune richieste comunque, perché documenti brevi non si somiglino per caso
+PDF_VERSION_MIN_PAGE_CHARS = 40 # Pagine senza immagini e con meno testo (bianche, solo titolo o numero) non contano
+PDF_PATCH_MAX_CHANGED_PAGES = 20 # Oltre questo numero di pagine modificate l'analisi viene rigenerata
+PDF_VERSION_INDEX_MAX_DOCUMENTS = 500 # Documenti ricordati dall'indice delle versioni
+
+# --- ICONA DELL'APPLICAZIONE ---
+ICON_THUMBNAIL_PX = 64 # Lato massimo della miniatura usata come avatar (il doppio dei 32px mostrati, per gli schermi ad alta densità)
+ICON_THUMBNAIL_COLORS = 128 # Colori della tavolozza PNG della miniatura
+
+# --- VISUALIZZAZIONE DELLA CHAT ---
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "30")) # Messaggi mostrati all'apertura e aggiunti a ogni "mostra precedenti"
+CHAT_RENDER_CACHE_MAX_ENTRIES = 500 # Messaggi di cui conservare il testo già preparato per la visualizzazione
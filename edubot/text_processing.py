@@ -0,0 +1,48 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Normalizzazione e stemming del testo italiano.
+# -----------------------------------------------------------------------------
+
+import re
+import unicodedata
+from typing import List
+from nltk.stem.snowball import SnowballStemmer
+
+
+
+class ItalianTextProcessor:
+    """Normalizzazione e tokenizzazione del testo italiano per i classificatori locali."""
+    _stemmer = SnowballStemmer("italian")
+    _token_pattern = re.compile(r"[a-z0-9]+")
+    _whitespace_pattern = re.compile(r"\s+")
+    # Parole funzionali (già normalizzate, senza accenti): compaiono in ogni materia e non la indicano
+    STOPWORDS = frozenset("""
+        a ad al allo alla ai agli alle all da dal dallo dalla dai dagli dalle dall di del dello della dei degli delle dell d
+        in nel nello nella nei negli nelle nell su sul sullo sulla sui sugli sulle sull con col coi per tra fra
+        il lo la i gli le l un uno una e ed o od ma se anche pero oppure ne che cui chi come cosa cos cose
+        quale quali qual quanto quanta quanti quante perche quando dove mentre poi piu meno molto molti molta molte
+        poco tanto troppo gia ancora sempre mai non no si io tu lui lei noi voi loro me te mi ti ci vi li
+        mio mia miei mie tuo tua tuoi tue suo sua suoi sue nostro nostra questo questa questi queste
+        quello quella quelli quelle quel quei stesso altro altra altri altre ogni tutto tutti tutta tutte
+        sono sei siamo siete era erano fu furono sara essere stato stata stati state ho hai ha abbiamo avete hanno
+        avere aveva fa fare faccio fai fanno fatto puo posso puoi possono potrei dovrei devo deve vorrei voglio
+        spieghi spiegami spiega spiegare aiuti aiutami aiuta aiutare capire capito capisco dire dici dice
+        significa vuol vuole c ce senza qualche qualcosa niente nulla solo proprio bene meglio cioe ecc
+    """.split())
+
+    @classmethod
+    def normalize(cls, text: str) -> str:
+        """Rimuove accenti e differenze di maiuscole/spaziatura mantenendo il contenuto."""
+        decomposed = unicodedata.normalize("NFKD", text)
+        without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        return cls._whitespace_pattern.sub(" ", without_accents.casefold()).strip()
+
+    @classmethod
+    def stem_tokens(cls, text: str) -> List[str]:
+        """Restituisce le radici (stem) delle parole del testo normalizzato."""
+        return [cls._stemmer.stem(token) for token in cls._token_pattern.findall(cls.normalize(text))]
+
+    @classmethod
+    def content_stems(cls, text: str) -> List[str]:
+        """Come stem_tokens, ma scarta le parole funzionali (articoli, preposizioni, pronomi, ausiliari)."""
+        return [cls._stemmer.stem(token) for token in cls._token_pattern.findall(cls.normalize(text))
+                if token not in cls.STOPWORDS]
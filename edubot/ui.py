@@ -0,0 +1,1259 @@
+# -----------------------------------------------------------------------------
+# EduBot AI - Interfaccia utente Streamlit.
+# -----------------------------------------------------------------------------
+
+import streamlit as st
+import google.generativeai as genai
+import time
+import logging
+import re
+import base64
+import statistics
+from typing import Optional, Dict, List, Tuple, Iterator
+from streamlit_mic_recorder import mic_recorder
+from streamlit.errors import StreamlitAPIException
+
+from edubot.settings import (
+    CHAT_HISTORY_WINDOW, CONTEXT_CHARS_PER_TOKEN, CONTEXT_TOKEN_BUDGET, MODEL_CONFIGS, PEDAGOGICAL_PRINCIPLES,
+    RERUN_METRICS_HISTORY, SERVER_API_KEY, SESSION_TIMEOUT, STARTUP_METRICS, SUBJECT_METHODOLOGY_CONFIGS
+)
+from edubot.configuration import ConfigurationManager, FileManager
+from edubot.models import ModelManager
+from edubot.chat import ConversationContextManager, SpeculativeGeneration
+from edubot.documents import DocumentRetrievalIndex
+from edubot.media import RecordedAudioFile
+from edubot.files import FileAnalyzer, get_upload_spool, release_queued_file
+from edubot.session import SessionManager
+
+logger = logging.getLogger(__name__)
+
+
+class IntelligentNotificationSystem:
+    """Sistema di notificazioni intelligenti con controllo anti-duplicazione."""
+    def __init__(self, model_manager: ModelManager):
+        self.model_manager = model_manager
+        self.last_states = {}
+
+    def initialize_state_tracking(self):
+        """Inizializza il tracking dello stato per rilevare cambiamenti."""
+        if 'notification_system' not in st.session_state:
+            st.session_state.notification_system = {
+                'last_topics': st.session_state.get('user_topics', ''),
+                'last_methodology': st.session_state.get('selected_subject_methodology', ''),
+                'last_file_count': len(st.session_state.get('analyzed_files', [])),
+                'last_custom_methodology': st.session_state.get('user_methodology', ''),
+                'last_pedagogical_principles': st.session_state.get('custom_pedagogical_principles', []),
+                'pending_notifications': [],
+                'notification_enabled': True,
+                'last_notification_time': 0
+            }
+
+    def should_generate_notification(self, change_type: str) -> bool:
+        """Determina se deve generare una notificazione per evitare duplicati."""
+        current_time = time.time()
+        last_notification = st.session_state.get('notification_cooldown', 0)
+        if current_time - last_notification < 3:
+            return False
+        if st.session_state.get('processing_files', False):
+            return False
+        return True
+
+    def generate_contextual_response(self, change_type: str, change_details: Dict) -> Optional[str]:
+        """Genera una risposta contestualizzata basata sul cambiamento specifico."""
+        if not st.session_state.get('model_initialized', False) or not self.should_generate_notification(change_type):
+            return None
+        
+        try:
+            methodology_name = SUBJECT_METHODOLOGY_CONFIGS.get(st.session_state.get("selected_subject_methodology", "generale"), {}).get('display_name', 'Approccio generale')
+            current_topics = st.session_state.get('user_topics', 'argomenti generali')
+            
+            prompt = ""
+            if change_type == 'methodology_changed':
+                prompt = f"""Come EduBot, hai appena rilevato un cambio di metodologia a "{methodology_name}". Rispondi come se ti fossi accorto del cambio. Spiega brevemente i vantaggi e come influenzerà le tue spiegazioni, collegandoti agli argomenti attuali ({current_topics}). Concludi con un invito specifico. STILE: Entusiasta, proattivo, max 100 parole."""
+            elif change_type == 'topics_changed':
+                prompt = f"""Come EduBot con metodologia {methodology_name}, hai notato nuovi argomenti: "{current_topics}". Mostra entusiasmo, spiega come la metodologia si adatta e suggerisci una prima attività. STILE: Coinvolgente, specifico, max 100 parole."""
+            elif change_type == 'principles_changed':
+                principles_names = [PEDAGOGICAL_PRINCIPLES[p]['name'] for p in st.session_state.get('custom_pedagogical_principles', []) if p in PEDAGOGICAL_PRINCIPLES]
+                prompt = f"""Come EduBot con metodologia {methodology_name}, hai integrato i principi: {', '.join(principles_names)}. Spiega come si integrano con {methodology_name} e come cambierà il tuo approccio, collegandoti agli argomenti ({current_topics}). STILE: Professionale, specifico, max 100 parole."""
+            else:
+                return None
+            
+            response = st.session_state.model.generate_content(
+                prompt,
+                generation_config=genai.types.GenerationConfig(temperature=0.7, max_output_tokens=150)
+            )
+            st.session_state.notification_cooldown = time.time()
+            return response.text if response and response.text else None
+        except Exception as e:
+            logger.error(f"Errore generazione risposta contestuale: {e}")
+            return None
+
+    def add_notification_to_chat(self, message: str, change_type: str):
+        """Aggiunge una notificazione intelligente alla cronologia chat."""
+        if message and st.session_state.get('model_initialized', False):
+            notification_message = {
+                'role': 'model',
+                'parts': [{'text': message}],
+                'metadata': {'type': 'intelligent_notification', 'change_type': change_type}
+            }
+            st.session_state.history.append(notification_message)
+
+    def detect_and_respond_to_changes(self):
+        """Rileva cambiamenti e genera una sola risposta contestualizzata."""
+        self.initialize_state_tracking()
+        current_state = st.session_state.notification_system
+        
+        current_methodology = st.session_state.get('selected_subject_methodology', '')
+        if current_methodology != current_state['last_methodology']:
+            current_state['last_methodology'] = current_methodology
+            response = self.generate_contextual_response('methodology_changed', {'methodology': current_methodology})
+            if response:
+                self.add_notification_to_chat(response, 'methodology_changed')
+                return True
+        
+        current_topics = st.session_state.get('user_topics', '')
+        if current_topics != current_state['last_topics'] and current_topics != "Nessun argomento specifico fornito.":
+            current_state['last_topics'] = current_topics
+            response = self.generate_contextual_response('topics_changed', {'topics': current_topics})
+            if response:
+                self.add_notification_to_chat(response, 'topics_changed')
+                return True
+        
+        current_principles = st.session_state.get('custom_pedagogical_principles', [])
+        if set(current_principles) != set(current_state['last_pedagogical_principles']) and current_principles:
+            current_state['last_pedagogical_principles'] = current_principles
+            response = self.generate_contextual_response('principles_changed', {'principles': current_principles})
+            if response:
+                self.add_notification_to_chat(response, 'principles_changed')
+                return True
+        
+        return False
+
+
+class StyleManager:
+    """Gestore degli stili CSS."""
+    @staticmethod
+    def inject_custom_css():
+        """Carica e inietta CSS personalizzato da file o fallback."""
+        try:
+            with open("style.css", "r", encoding="utf-8") as f:
+                st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+        except FileNotFoundError:
+            fallback_css = """
+            .custom-avatar { width: 32px; height: 32px; border-radius: 50%; display: inline-block; vertical-align: middle; margin-right: 8px; }
+            .welcome-screen { text-align: center; max-width: 600px; margin: auto; }
+            """
+            st.markdown(f"<style>{fallback_css}</style>", unsafe_allow_html=True)
+
+
+class InformativeManager:
+    """Gestore delle schermate informative e di sicurezza."""
+    def __init__(self, deployment_mode: str):
+        self.deployment_mode = deployment_mode
+
+    def get_informative_content(self, index: int) -> Optional[Dict]:
+        """Restituisce il contenuto delle informative di sicurezza."""
+        common_informatives = [
+            {
+                "title": "🔒 INFORMATIVA PRIVACY E PROTEZIONE DATI", "icon": "🛡️",
+                "content": f"**EduBot implementa un sistema 'Privacy by Design'**: le chat sono temporanee e anonime, e la sessione scade dopo {SESSION_TIMEOUT//60} minuti. "
+                           "**Attenzione ai file caricati:** il testo delle analisi viene conservato sul server, senza anonimizzazione e senza legarlo a te, "
+                           "per riutilizzarlo quando lo stesso file viene caricato di nuovo; i file inviati al modello vengono eliminati alla scadenza della sessione. "
+                           "Non caricare documenti che contengono dati personali."
+            },
+            {
+                "title": "🤖 LIMITAZIONI DELL'INTELLIGENZA ARTIFICIALE", "icon": "⚠️",
+                "content": "**L'AI può commettere errori.** Verifica sempre le informazioni fornite. EduBot è uno strumento di supporto, non un sostituto dell'expertise umana."
+            }
+        ]
+        user_api_informative = {
+            "title": "📋 INFORMATIVA OBBLIGATORIA - Utilizzo Chiavi API", "icon": "🔑",
+            "content": "**Sei l'unico responsabile per l'uso e i costi della tua chiave API.** La chiave non viene memorizzata e viene utilizzata solo per la durata della sessione."
+        }
+        
+        informatives = [user_api_informative] + common_informatives if self.deployment_mode == "user_api" else common_informatives
+        
+        return informatives[index] if 0 <= index < len(informatives) else None
+
+
+class UserInterface:
+    """Gestore dell'interfaccia utente e delle interazioni."""
+    def __init__(self, session_manager: SessionManager, config_manager: ConfigurationManager,
+                 model_manager: ModelManager, file_analyzer: FileAnalyzer, 
+                 informative_manager: InformativeManager, file_manager: FileManager):
+        self.session_manager = session_manager
+        self.config_manager = config_manager
+        self.model_manager = model_manager
+        self.file_analyzer = file_analyzer
+        self.informative_manager = informative_manager
+        self.file_manager = file_manager
+        # Gli avatar ricevono i byte della miniatura: Streamlit la serve una sola volta come file
+        # multimediale e nei messaggi invia solo il suo URL. Le intestazioni HTML la incorporano (pochi KB).
+        icon_thumbnail = self.file_manager.load_icon_thumbnail()
+        self.page_icon_data = icon_thumbnail or "🤖"
+        self.header_icon_src = f"data:image/png;base64,{base64.b64encode(icon_thumbnail).decode()}" if icon_thumbnail else "🤖"
+        self.chat_container = None # Impostato dalla scheda chat, per mostrarvi le analisi dei file in tempo reale
+
+    def show_api_guide_popup(self):
+        """Mostra la guida per ottenere la chiave API."""
+        st.info("""
+        **📋 Come ottenere la tua chiave API di Google Gemini**
+        1. Vai su: https://aistudio.google.com/app/apikey
+        2. Accedi e clicca su "Create API Key".
+        3. Copia la chiave e incollala qui. La chiave non viene salvata.
+        """)
+
+    def show_welcome_content(self):
+        """Mostra il contenuto di benvenuto."""
+        st.markdown('<div class="welcome-screen">', unsafe_allow_html=True)
+        st.markdown(f'<h1><img src="{self.header_icon_src}" class="custom-avatar"> EduBot</h1>', unsafe_allow_html=True)
+        st.markdown("### Il tuo assistente didattico AI")
+        st.markdown("🛡️ Sicurezza Avanzata & 🤖 Funzionalità AI di Ultima Generazione")
+        if st.button("🚀 Inizia Configurazione", type="primary", use_container_width=True):
+            st.session_state.setup_step = "informative"
+            st.rerun()
+        st.markdown('</div>', unsafe_allow_html=True)
+        self.app_footer()
+
+    def show_informative_sequential(self):
+        """Mostra le informative in modo sequenziale."""
+        max_informatives = 2 if self.session_manager.deployment_mode == "server" else 3
+        info = self.informative_manager.get_informative_content(st.session_state.informative_index)
+        
+        if not info:
+            st.session_state.all_informatives_read = True
+            next_step = "final_privacy" if self.session_manager.deployment_mode == "server" else "api_key"
+            st.session_state.setup_step = next_step
+            st.rerun()
+            return
+        
+        st.markdown(f"### {info['icon']} {info['title']}")
+        st.info(info['content'])
+        
+        current = st.session_state.informative_index + 1
+        st.progress(current / max_informatives)
+        st.caption(f"Informativa {current} di {max_informatives}")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.session_state.informative_index > 0:
+                if st.button("← Precedente"):
+                    st.session_state.informative_index -= 1
+                    st.rerun()
+        with col2:
+            if st.session_state.informative_index < max_informatives - 1:
+                if st.button("Successiva →", type="primary"):
+                    st.session_state.informative_index += 1
+                    st.rerun()
+            else:
+                if st.button("Ho Letto Tutto ✓", type="primary"):
+                    st.session_state.all_informatives_read = True
+                    next_step = "final_privacy" if self.session_manager.deployment_mode == "server" else "api_key"
+                    st.session_state.setup_step = next_step
+                    st.rerun()
+        self.app_footer()
+
+    def show_final_privacy_content(self):
+        """Mostra il contenuto per l'accettazione finale."""
+        st.markdown("### 🔒 Conferma Finale Condizioni di Sicurezza")
+        recap_message = "✅ **RIEPILOGO CONDIZIONI ACCETTATE:** Protezione da prompt injection, gestione privacy-by-design, consapevolezza dei limiti AI."
+        if self.session_manager.deployment_mode == "user_api":
+            recap_message += " Piena responsabilità per l'uso della chiave API."
+        st.success(recap_message)
+        
+        privacy_final_accepted = st.checkbox("✅ Confermo di aver letto, compreso e accettato tutte le condizioni.")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("← Indietro"):
+                prev_step = "informative" if self.session_manager.deployment_mode == "server" else "api_key"
+                st.session_state.setup_step = prev_step
+                st.rerun()
+        with col2:
+            if st.button("🚀 Avvia EduBot", type="primary", disabled=not privacy_final_accepted):
+                if self.session_manager.deployment_mode == "server":
+                    genai.configure(api_key=SERVER_API_KEY)
+                st.session_state.final_privacy_accepted = True
+                st.session_state.setup_step = "ready"
+                st.session_state.api_key_configured = True
+                
+                success = self.model_manager.auto_initialize_system(self.file_manager)
+                if not success:
+                    st.warning("⚠️ Sistema avviato ma modello non inizializzato. Vai alle Impostazioni.")
+                time.sleep(1)
+                st.rerun()
+        self.app_footer()
+
+    def gestore_setup_chiave_api(self):
+        """Gestisce il flusso di configurazione della chiave API."""
+        st.markdown("### 🔑 Configurazione Sicura Chiave API")
+        if not st.session_state.api_key_entered:
+            with st.expander("ℹ️ Come ottenere la chiave API"):
+                self.show_api_guide_popup()
+            
+            google_api_key = st.text_input("Chiave API Google Gemini", type="password", placeholder="Incolla qui la tua chiave API...")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("← Indietro"):
+                    st.session_state.setup_step = "informative"
+                    st.rerun()
+            with col2:
+                if st.button("🔍 Verifica Chiave API", type="primary"):
+                    if google_api_key and len(google_api_key.strip()) > 0:
+                        with st.spinner("Verifica in corso..."):
+                            try:
+                                genai.configure(api_key=google_api_key.strip())
+                                test_model = genai.GenerativeModel('gemini-1.5-flash')
+                                test_response = test_model.generate_content("Test")
+                                if test_response and test_response.text:
+                                    st.session_state.api_key_hash = self.session_manager.hash_api_key(google_api_key.strip())
+                                    st.session_state.api_key_entered = True
+                                    st.success("✅ Chiave API valida!")
+                                    time.sleep(1)
+                                    st.rerun()
+                                else:
+                                    raise Exception("Risposta API non valida")
+                            except Exception as e:
+                                st.error(f"❌ Chiave API non valida o errore di connessione. Dettagli: {e}")
+                    else:
+                        st.warning("⚠️ Inserisci una chiave API valida")
+        else:
+            st.success("✅ Chiave API configurata e protetta!")
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("🔄 Cambia Chiave"):
+                    st.session_state.api_key_entered = False
+                    st.rerun()
+            with col2:
+                if st.button("Continua →", type="primary"):
+                    st.session_state.setup_step = "final_privacy"
+                    st.rerun()
+
+    def queue_file(self, file_obj) -> bool:
+        """
+        Mette in coda un file caricato o una registrazione, salvandolo su disco per non tenerlo in memoria
+        fino all'elaborazione. Se il disco non è scrivibile il file resta in memoria.
+        """
+        try:
+            queued_file = get_upload_spool().spill(st.session_state.anonymous_session_id, file_obj)
+        except ValueError as e:
+            st.warning(f"⚠️ **{file_obj.name}** non aggiunto alla coda: {e}. Riprova più tardi.")
+            return False
+        except OSError as e:
+            logger.warning(f"⚠️ Salvataggio su disco di '{file_obj.name}' non riuscito, il file resta in memoria: {e}")
+            queued_file = file_obj
+        st.session_state.files_to_process.append(queued_file)
+        return True
+
+    def show_file_management_tab(self):
+        """Interfaccia completa per la gestione dei documenti e file multimediali."""
+        st.header("🗂️ Archivio Documenti")
+        st.caption("Carica e gestisci file PDF, immagini e audio per l'analisi con EduBot")
+        
+        # SEZIONE CARICAMENTO FILE
+        st.subheader("📤 Carica Nuovi File")
+        
+        uploaded_files = st.file_uploader(
+            "Seleziona uno o più file",
+            type=['pdf', 'png', 'jpg', 'jpeg', 'webp', 'gif', 'bmp', 'tiff', 
+                  'mp3', 'wav', 'ogg', 'm4a', 'flac', 'aac'],
+            accept_multiple_files=True,
+            key=f"file_uploader_{st.session_state.get('file_upload_key', 0)}",
+            help="Formati supportati: PDF per documenti, PNG/JPG/WEBP per immagini, MP3/WAV/OGG per audio"
+        )
+        
+        # Gestione file caricati
+        if uploaded_files:
+            new_files_added = False
+            for uploaded_file in uploaded_files:
+                if not any(f.name == uploaded_file.name for f in st.session_state.files_to_process):
+                    new_files_added = self.queue_file(uploaded_file) or new_files_added
+            
+            if new_files_added:
+                st.success(f"✅ {len(uploaded_files)} file aggiunti alla coda di elaborazione!")
+                st.session_state.file_upload_key += 1
+                st.rerun()
+        
+        # REGISTRAZIONE AUDIO
+        st.markdown("---")
+        st.subheader("🎙️ Registrazione Audio")
+        st.caption("Registra direttamente audio per l'analisi musicale o linguistica")
+        
+        try:
+            audio_bytes = mic_recorder(
+                start_prompt="🔴 Avvia Registrazione", 
+                stop_prompt="⏹️ Ferma Registrazione",
+                key='audio_recorder_main',
+                format='wav', # PCM non compresso: può essere convertito e ripulito dai silenzi prima dell'invio
+                just_once=False,
+                use_container_width=True
+            )
+            
+            if audio_bytes:
+                file_name = f"registrazione_{int(time.time())}.wav"
+                
+                if not any(f.name == file_name for f in st.session_state.files_to_process):
+                    if self.queue_file(RecordedAudioFile(file_name, audio_bytes['bytes'])):
+                        st.success(f"✅ Registrazione '{file_name}' aggiunta alla coda!")
+                        st.rerun()
+        except Exception as e:
+            st.warning("⚠️ Microfono non disponibile o errore nella registrazione")
+            logger.warning(f"Errore registrazione audio: {e}")
+        
+        report = st.session_state.get('file_processing_report')
+        if report:
+            cached_note = f" (⚡ {report['cached']} recuperati dalla cache)" if report['cached'] else ""
+            if report.get('similar_images'):
+                cached_note += f" (🔁 {report['similar_images']} immagini quasi identiche a quelle già analizzate)"
+            st.success(f"✅ Ultima elaborazione: {report['processed']} file analizzati e aggiunti alla chat{cached_note}.")
+            if report.get('image_preprocessing_ms'):
+                timings = report['image_preprocessing_ms']
+                st.caption(f"🖼️ {len(timings)} immagini preelaborate in media in {sum(timings) / len(timings):.0f} ms, "
+                           f"{report['image_bytes_saved'] / (1024 * 1024):.1f} MB risparmiati nell'invio.")
+            if report.get('audio_bytes_saved'):
+                st.caption(f"🎧 Audio convertito e ripulito dai silenzi: {report['audio_bytes_saved'] / (1024 * 1024):.1f} MB risparmiati nell'invio.")
+            for file_name, message in report['errors']:
+                st.warning(f"⚠️ **{file_name}**: {message}")
+            if report.get('deferred'):
+                st.info(f"⏸️ {len(report['deferred'])} file rimandati perché il server sta già elaborando molti file: "
+                        f"sono ancora in coda, premi di nuovo «Elabora Tutti i File» tra poco.")
+
+        # SEZIONE FILE IN ATTESA
+        if st.session_state.files_to_process:
+            st.markdown("---")
+            st.subheader("📋 File in Attesa di Elaborazione")
+            st.caption(f"**{len(st.session_state.files_to_process)} file** pronti per l'analisi")
+            
+            for i, file_obj in enumerate(st.session_state.files_to_process):
+                # ... (il codice che elenca i file rimane invariato)
+                pass # Lascio pass per brevità, il tuo codice che mostra i file va qui
+
+            # --- INIZIO SEZIONE DA SOSTITUIRE ---
+            # Sostituisci i vecchi pulsanti con questo nuovo blocco
+            st.markdown("---")
+            col1, col2 = st.columns([2, 1])
+            
+            with col1:
+                # Questo è il blocco di codice che mi hai chiesto
+                if st.button("✅ Elabora Tutti i File", type="primary", use_container_width=True):
+                    if not st.session_state.get('model_initialized', False):
+                        st.error("⚠️ Modello non inizializzato. Vai alle Impostazioni.")
+                    elif st.session_state.files_to_process:
+                        # Analisi in parallelo: i risultati compaiono man mano che vengono generati, in chat
+                        # se è visibile, altrimenti qui sotto (con le schede pigre la chat non viene disegnata)
+                        self.file_analyzer.processor_queue.process_files(
+                            list(st.session_state.files_to_process),
+                            chat_container=self.chat_container or st.container(), avatar=self.page_icon_data
+                        )
+                    else:
+                        st.warning("Nessun file nella coda di elaborazione.")
+            
+            with col2:
+                if st.button("🔄 Pulisci Coda", use_container_width=True):
+                    for queued_file in st.session_state.files_to_process:
+                        release_queued_file(queued_file)
+                    st.session_state.files_to_process = []
+                    st.success("🧹 Coda file pulita!")
+                    st.rerun()
+            # --- FINE SEZIONE DA SOSTITUIRE ---
+
+        else:
+            st.info("📂 Nessun file in attesa. Carica file utilizzando i controlli sopra.")
+      
+        if st.session_state.analyzed_files:
+            st.subheader("✅ File Analizzati")
+            for file_info in st.session_state.analyzed_files:
+                details = [file_info['type']]
+                if file_info.get('passages'):
+                    details.append(f"{file_info['passages']} passaggi indicizzati")
+                if file_info.get('text_only'):
+                    details.append("testo estratto in locale")
+                if file_info.get('patched_from'):
+                    details.append(f"nuova versione di {file_info['patched_from']}")
+                st.markdown(f"• **{file_info['name']}** ({', '.join(details)}){' ⚡ dalla cache' if file_info.get('cached') else ''}")
+            document_status = st.session_state.document_store.get_status()
+            if document_status['documents']:
+                modalita = "contesto in cache" if document_status['cached'] else "riferimenti diretti"
+                scadenza = time.strftime('%H:%M', time.localtime(document_status['expires_at']))
+                st.caption(f"📎 {document_status['documents']} documenti consultabili in chat ({modalita}), disponibili fino alle {scadenza}.")
+            if st.button("🧹 Pulisci Cronologia File"):
+                st.session_state.analyzed_files = []
+                st.session_state.document_store.clear()
+                st.session_state.retrieval_index = DocumentRetrievalIndex()
+                st.rerun()
+
+    def enhanced_chat_with_notifications(self):
+        """Chat migliorata con notificazioni intelligenti."""
+        st.header("💬 Chat con EduBot AI")
+        if not st.session_state.get("model_initialized", False):
+            st.warning("⚠️ Modello non inizializzato. Vai a **⚙️ Impostazioni**.")
+            return
+
+        notification_system = IntelligentNotificationSystem(self.model_manager)
+        notification_system.detect_and_respond_to_changes()
+        self.chat_fragment()
+
+    @staticmethod
+    def show_earlier_messages():
+        """Allarga la finestra della chat ai messaggi precedenti, prima del rerun del frammento."""
+        st.session_state.chat_visible_messages = st.session_state.get("chat_visible_messages", CHAT_HISTORY_WINDOW) + CHAT_HISTORY_WINDOW
+
+    @st.fragment
+    def chat_fragment(self):
+        """
+        Cronologia e invio dei messaggi, isolati in un frammento: scrivere e inviare una domanda
+        riesegue solo la chat e non il resto dell'app. Vengono mostrati solo gli ultimi messaggi.
+        """
+        contenitore_chat = st.container(height=600, border=True)
+        self.chat_container = contenitore_chat
+        with contenitore_chat:
+            history = st.session_state.history
+            visible_messages = st.session_state.get("chat_visible_messages", CHAT_HISTORY_WINDOW)
+            hidden_messages = len(history) - visible_messages
+            if hidden_messages > 0:
+                st.button(f"⬆️ Mostra messaggi precedenti ({hidden_messages} nascosti)", key="chat_load_earlier",
+                          on_click=self.show_earlier_messages, use_container_width=True)
+            render_cache = st.session_state.chat_render_cache
+            for messaggio in history[-visible_messages:]:
+                ruolo = "Tu" if messaggio['role'] == 'user' else "EduBot AI"
+                avatar = "🧑‍🎓" if ruolo == "Tu" else self.page_icon_data
+                with st.chat_message(ruolo, avatar=avatar):
+                    st.markdown(render_cache.get(messaggio))
+
+        if prompt_utente := st.chat_input("Scrivi la tua domanda..."):
+            security_system = st.session_state.security_system
+            anonymized_prompt = security_system.anonymize_data(prompt_utente)
+            user_message = {'role': 'user', 'parts': [{'text': anonymized_prompt}]}
+
+            # Prima la verifica locale: un messaggio bloccato non costa riepiloghi, cache dei documenti né ricerche
+            turn_start = time.perf_counter()
+            verdict = security_system.check_locally(prompt_utente)
+            security_time = time.perf_counter() - turn_start
+            speculation = None
+            classification = None
+            request = None
+            if verdict is None:
+                if st.session_state.get("speculative_generation", False):
+                    # La generazione parte subito sul prompt anonimizzato, in parallelo alla verifica AI
+                    request = self._prepare_chat_request(anonymized_prompt, user_message)
+                    speculation = SpeculativeGeneration(request[0], request[1])
+                ai_check_start = time.perf_counter()
+                subject_context = self.model_manager.build_subject_context(history_messages=3, user_turns_only=True)
+                # Un'unica chiamata restituisce verdetto, materia suggerita e presenza di dati personali
+                verdict, classification = security_system.classify_message(prompt_utente, subject_context)
+                security_time += time.perf_counter() - ai_check_start
+
+            is_injection, reason = verdict
+            if is_injection:
+                if speculation:
+                    speculation.cancel()
+                st.error(f"🛡️ Input bloccato per sicurezza. ({reason})")
+                return
+
+            chat_model, contents, context_stats = request or self._prepare_chat_request(anonymized_prompt, user_message)
+
+            st.session_state.history.append(user_message)
+            if classification:
+                self.model_manager.update_subject_suggestion(
+                    classification['subject_key'], classification['subject_confidence'], source="ai"
+                )
+                if classification['contains_pii']:
+                    st.toast("🔒 Il messaggio sembra contenere dati personali: evita di condividerli con EduBot.")
+            else:
+                # Messaggio risolto in locale: la materia viene suggerita solo se il classificatore locale è affidabile
+                tracker = self.model_manager.get_subject_tracker()
+                subject_key, confidence = tracker.predict()
+                if tracker.classifier.is_reliable(subject_key, confidence):
+                    self.model_manager.update_subject_suggestion(subject_key, confidence, source="locale")
+
+            with contenitore_chat:
+                with st.chat_message("Tu", avatar="🧑‍🎓"):
+                    st.markdown(anonymized_prompt)
+                with st.chat_message("EduBot AI", avatar=self.page_icon_data):
+                    if speculation:
+                        risposta_testuale = self._release_speculative_response(speculation, security_time, context_stats)
+                    elif st.session_state.get("stream_responses", True):
+                        risposta_testuale = self._stream_model_response(chat_model, contents, security_time, context_stats)
+                    else:
+                        risposta_testuale = self._generate_model_response(chat_model, contents, security_time, context_stats)
+
+            # La risposta viene salvata in cronologia una sola volta, a generazione conclusa
+            st.session_state.history.append({'role': 'model', 'parts': [{'text': risposta_testuale}]})
+            try:
+                st.rerun(scope="fragment")
+            except StreamlitAPIException:
+                # Invio avvenuto durante un'esecuzione completa dello script (non del solo frammento)
+                st.rerun()
+
+    def _prepare_chat_request(self, anonymized_prompt: str, user_message: Dict) -> Tuple[genai.GenerativeModel, List[Dict], Dict]:
+        """
+        Prepara modello e contenuti della richiesta: contesto entro il budget (con eventuale riepilogo),
+        documenti caricati e passaggi pertinenti. Può richiedere chiamate di rete.
+        """
+        context_manager = ConversationContextManager(st.session_state.get("context_token_budget", CONTEXT_TOKEN_BUDGET))
+        contents, context_stats = context_manager.build(st.session_state.history + [user_message])
+        chat_model = st.session_state.model
+        if st.session_state.get("attach_documents_to_chat", True):
+            # I documenti caricati restano consultabili in chat senza inviarne di nuovo i byte
+            chat_model, contents = st.session_state.document_store.prepare_chat_request(
+                chat_model, contents, st.session_state.get('selected_model', 'gemini-2.5-flash'),
+                st.session_state.get('current_system_prompt') or ""
+            )
+            passages = st.session_state.retrieval_index.search(anonymized_prompt)
+            if passages:
+                contents = DocumentRetrievalIndex.ground_request(contents, passages)
+                context_stats['tokens_after'] += sum(ConversationContextManager.estimate_tokens(p['text']) for p in passages)
+                context_stats['retrieved_passages'] = len(passages)
+        return chat_model, contents, context_stats
+
+    def _generate_model_response(self, model: genai.GenerativeModel, contents: List[Dict], security_time: float,
+                                 context_stats: Dict) -> str:
+        """Genera la risposta completa in un'unica chiamata, mostrando uno spinner."""
+        start_time = time.perf_counter()
+        with st.spinner("🤖 EduBot AI sta elaborando..."):
+            try:
+                response = model.generate_content(contents)
+                risposta_testuale = response.text
+            except Exception as e:
+                risposta_testuale = f"🔧 Si è verificato un errore: {e}"
+                logger.error(f"Errore generazione: {e}")
+            st.markdown(risposta_testuale)
+        total_time = time.perf_counter() - start_time
+        self.model_manager.record_generation_metrics(total_time, total_time, streamed=False, security_time=security_time,
+                                                     context_stats=context_stats)
+        return risposta_testuale
+
+    def _render_response_chunks(self, chunks: Iterator[str], received_chunks: List[str]) -> str:
+        """Mostra i frammenti di risposta man mano che arrivano e restituisce il testo completo."""
+        try:
+            if st.session_state.get("stream_responses", True):
+                st.write_stream(chunks)
+            else:
+                with st.spinner("🤖 EduBot AI sta elaborando..."):
+                    for _ in chunks:
+                        pass
+                st.markdown("".join(received_chunks))
+            risposta_testuale = "".join(received_chunks)
+            if not risposta_testuale:
+                risposta_testuale = "⚠️ Il modello non ha prodotto una risposta. Prova a riformulare la domanda."
+                st.markdown(risposta_testuale)
+        except Exception as e:
+            logger.error(f"Errore generazione in streaming: {e}")
+            errore = f"🔧 Si è verificato un errore: {e}"
+            risposta_testuale = f"{''.join(received_chunks)}\n\n{errore}" if received_chunks else errore
+            st.markdown(errore)
+        return risposta_testuale
+
+    def _stream_model_response(self, model: genai.GenerativeModel, contents: List[Dict], security_time: float,
+                               context_stats: Dict) -> str:
+        """Genera la risposta in streaming, mostrando i frammenti man mano che arrivano."""
+        start_time = time.perf_counter()
+        received_chunks = []
+        first_token_time = None
+
+        def chunk_generator():
+            nonlocal first_token_time
+            response = model.generate_content(contents, stream=True)
+            for chunk_text in self.model_manager.iter_response_text(response):
+                if first_token_time is None:
+                    first_token_time = time.perf_counter() - start_time
+                received_chunks.append(chunk_text)
+                yield chunk_text
+
+        risposta_testuale = self._render_response_chunks(chunk_generator(), received_chunks)
+        self.model_manager.record_generation_metrics(first_token_time, time.perf_counter() - start_time,
+                                                     streamed=True, security_time=security_time,
+                                                     context_stats=context_stats)
+        return risposta_testuale
+
+    def _release_speculative_response(self, speculation: SpeculativeGeneration, security_time: float,
+                                      context_stats: Dict) -> str:
+        """Rilascia la risposta generata in anticipo, ora che il verdetto di sicurezza è positivo."""
+        risposta_testuale = self._render_response_chunks(speculation.iter_chunks(), speculation.chunks)
+        total_time = speculation.total_time or (time.perf_counter() - speculation.start_time)
+        # In modalità seriale la generazione sarebbe partita solo dopo la verifica di sicurezza:
+        # il risparmio è la parte di verifica sovrapposta alla generazione.
+        latency_saved = min(security_time, total_time)
+        self.model_manager.record_generation_metrics(speculation.first_token_time, total_time, streamed=True,
+                                                     security_time=security_time, latency_saved=latency_saved,
+                                                     context_stats=context_stats)
+        return risposta_testuale
+
+    def show_subject_methodology_presets(self):
+        """Interfaccia per i preset metodologici e il rilevamento automatico."""
+        st.header("📚 Preset Metodologici")
+
+        # Sezione per il rilevamento automatico
+        with st.container(border=True):
+            st.subheader("🔬 Rilevamento Automatico")
+            st.info("EduBot analizza ogni messaggio e suggerisce il preset metodologico più adatto. Puoi anche richiedere un'analisi completa del contesto.")
+            last_detection = st.session_state.get('last_subject_detection')
+            if last_detection:
+                detected_name = SUBJECT_METHODOLOGY_CONFIGS[last_detection['subject_key']]['display_name']
+                source_label = "classificatore locale" if last_detection['source'] == "locale" else "modello AI"
+                st.caption(f"Ultimo rilevamento: **{detected_name}** (confidenza {last_detection['confidence']:.0%}, {source_label})")
+            if st.button("Analizza Contesto Attuale", type="primary", use_container_width=True):
+                with st.spinner("Analisi in corso..."):
+                    detected_subject_key, confidence, source = self.model_manager.detect_subject_from_context()
+                    self.model_manager.update_subject_suggestion(detected_subject_key, confidence, source)
+                    if detected_subject_key == st.session_state.selected_subject_methodology:
+                        st.success("✅ Il preset attuale sembra già essere il più appropriato!")
+
+            if st.session_state.get('suggested_subject'):
+                subject_key = st.session_state.suggested_subject
+                subject_name = SUBJECT_METHODOLOGY_CONFIGS[subject_key]['display_name']
+                st.warning(f"**Suggerimento:** Dalla conversazione sembra che l'argomento sia **{subject_name}**. Vuoi cambiare preset?")
+                col1, col2 = st.columns(2)
+                with col1:
+                    if st.button(f"Sì, passa a {subject_name}", use_container_width=True, type="primary"):
+                        st.session_state.selected_subject_methodology = subject_key
+                        del st.session_state.suggested_subject
+                        st.session_state.model_initialized = False
+                        self.model_manager.auto_initialize_system(self.file_manager)
+                        st.rerun()
+                with col2:
+                    if st.button("No, ignora", use_container_width=True):
+                        del st.session_state.suggested_subject
+                        st.rerun()
+        
+        st.markdown("---")
+        st.subheader("Selezione Manuale")
+        cols = st.columns(2)
+        for i, (key, config) in enumerate(SUBJECT_METHODOLOGY_CONFIGS.items()):
+            col = cols[i % 2]
+            is_active = (key == st.session_state.selected_subject_methodology)
+            with col, st.container(border=True):
+                st.markdown(f"### {config['display_name']}") # Usa l'emoji dal config!
+                st.write(f"**Descrizione:** {config['description']}")
+                if is_active:
+                    st.success("✅ Preset Attivo")
+                else:
+                    if st.button(f"Attiva {config['display_name']}", key=f"activate_{key}"):
+                        st.session_state.selected_subject_methodology = key
+                        if "temp_override" in st.session_state: del st.session_state.temp_override
+                        if "top_k_override" in st.session_state: del st.session_state.top_k_override
+                        st.session_state.model_initialized = False
+                        self.model_manager.auto_initialize_system(self.file_manager)
+                        st.rerun()
+                        
+
+    def topic_management_interface(self):
+        """Interfaccia migliorata per la gestione degli argomenti di studio con suggerimenti cliccabili e aggiornabili."""
+        st.header("🎯 Gestione Argomenti di Studio")
+        st.caption("Configura argomenti specifici o lasciati ispirare dai suggerimenti generati dall'AI.")
+
+        # --- Sezione di Inserimento Manuale (ora in cima) ---
+        st.subheader("✏️ Argomenti di Studio Attivi")
+        
+        current_topics = st.session_state.get("user_topics", "Nessun argomento specifico fornito.")
+        new_topics_str = st.text_area(
+            "Inserisci o modifica i tuoi argomenti di studio (separati da virgola):",
+            value="" if current_topics == "Nessun argomento specifico fornito." else current_topics,
+            placeholder="Esempio: Programmazione in Python, Machine Learning, Storia del Rinascimento",
+            height=120,
+            label_visibility="collapsed"
+        )
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("✅ Applica e Reinizializza", type="primary", use_container_width=True):
+                if new_topics_str.strip():
+                    verdicts = st.session_state.security_system.detect_injection_batch({"argomenti": new_topics_str})
+                    is_injection, reason = verdicts["argomenti"]
+                    if is_injection:
+                        st.error(f"🛡️ Argomenti bloccati per sicurezza. ({reason})")
+                        return
+
+                    anonymized_topics = st.session_state.security_system.anonymize_data(new_topics_str)
+                    topics_list = [topic.strip() for topic in anonymized_topics.replace('\n', ',').split(',') if topic.strip()]
+                    unique_topics = ", ".join(list(dict.fromkeys(topics_list)))
+                    st.session_state.user_topics = unique_topics
+
+                    st.session_state.model_initialized = False
+                    self.model_manager.auto_initialize_system(self.file_manager)
+                    st.success(f"✅ Argomenti aggiornati: {unique_topics}")
+
+                else:
+                    st.session_state.user_topics = "Nessun argomento specifico fornito."
+                    st.session_state.model_initialized = False
+                    self.model_manager.auto_initialize_system(self.file_manager)
+                    st.info("ℹ️ Argomenti rimossi. EduBot userà un approccio generale.")
+
+                time.sleep(1)
+                st.rerun()
+
+        with col2:
+            if st.button("🔄 Reset Argomenti", use_container_width=True):
+                st.session_state.user_topics = "Nessun argomento specifico fornito."
+                st.session_state.model_initialized = False
+                self.model_manager.auto_initialize_system(self.file_manager)
+                st.success("🔄 Argomenti resettati alla configurazione generale.")
+                time.sleep(1)
+                st.rerun()
+
+        st.markdown("---")
+
+        # --- Sezione Suggerimenti Cliccabili (ora in fondo) ---
+        with st.container(border=True):
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.subheader("💡 Suggerimenti per Argomenti")
+            with col2:
+                if st.button("🔄 Nuovi Suggerimenti", use_container_width=True, help="Pulisce la cache e genera nuove idee per la materia corrente."):
+                    st.cache_data.clear()
+                    st.rerun()
+
+            current_methodology_key = st.session_state.get("selected_subject_methodology", "generale")
+            methodology_config = self.config_manager.get_methodology_config(current_methodology_key)
+            methodology_name = methodology_config.get('display_name', 'Generale')
+
+            with st.spinner(f"Cerco suggerimenti per {methodology_name}..."):
+                suggestions_string = self.model_manager.generate_topic_suggestions_direct(methodology_name)
+            
+            suggestions_list = []
+            if "Errore" not in suggestions_string:
+                suggestions_raw = re.split(r'\s*,\s*|\n', suggestions_string)
+                for s in suggestions_raw:
+                    cleaned_s = re.sub(r'^\s*\d+\.\s*|^\s*[-\*]\s*', '', s.strip())
+                    if cleaned_s:
+                        suggestions_list.append(cleaned_s)
+
+            if suggestions_list:
+                st.write("Clicca su un suggerimento per aggiungerlo all'elenco qui sopra:")
+                # Layout fisso a 3 colonne per i 6 suggerimenti
+                cols1 = st.columns(3)
+                cols2 = st.columns(3)
+                
+                for i, suggestion in enumerate(suggestions_list):
+                    # Suddivide i 6 suggerimenti su due righe
+                    if i < 3:
+                        col = cols1[i % 3]
+                    else:
+                        col = cols2[i % 3]
+                    
+                    if col.button(suggestion, key=f"suggestion_{i}", use_container_width=True):
+                        current_topics_str = st.session_state.get("user_topics", "")
+                        if current_topics_str == "Nessun argomento specifico fornito.":
+                            current_topics_str = ""
+                        
+                        topics_list = [t.strip() for t in current_topics_str.split(',') if t.strip()]
+                        if suggestion not in topics_list:
+                            topics_list.append(suggestion)
+                        
+                        st.session_state.user_topics = ", ".join(topics_list)
+                        st.rerun()
+            else:
+                st.warning("Non è stato possibile generare suggerimenti per questa metodologia.")
+    def methodology_management_interface(self):
+        """Interfaccia per la gestione della metodologia."""
+        st.header("🧠 Gestione Principi Pedagogici")
+        
+        # NUOVO: Inizializza uno stato separato per il text_area se non esiste
+        if "custom_methodology_text" not in st.session_state:
+            st.session_state.custom_methodology_text = ""
+
+        st.subheader("🎯 Configurazione Base Attiva")
+        current_config = self.config_manager.get_methodology_config(st.session_state.selected_subject_methodology)
+        st.success(f"**Metodologia:** {current_config['display_name']}")
+        
+        st.subheader("🧠 Principi Pedagogici Integrativi")
+        selected_principles = st.multiselect(
+            "Seleziona principi da integrare:",
+            options=list(PEDAGOGICAL_PRINCIPLES.keys()),
+            format_func=lambda key: PEDAGOGICAL_PRINCIPLES[key]['name'],
+            default=st.session_state.custom_pedagogical_principles
+        )
+        
+        # CORREZIONE: Il valore del text_area ora usa il suo stato separato
+        custom_methodology = st.text_area(
+            "Aggiungi principi personalizzati (uno per riga):",
+            value=st.session_state.custom_methodology_text,
+            placeholder="Esempio:\n- Uso frequente di esempi pratici\n- Approccio socratico con domande guidate"
+        )
+
+        if st.button("✅ Applica Principi", type="primary", use_container_width=True):
+            # NUOVO: Controllo di sicurezza AI sul testo personalizzato
+            verdicts = st.session_state.security_system.detect_injection_batch({"principi_personalizzati": custom_methodology})
+            is_injection, reason = verdicts["principi_personalizzati"]
+            if is_injection:
+                st.error(f"🛡️ Testo personalizzato bloccato per sicurezza. ({reason})")
+                return # Interrompe l'esecuzione se viene rilevata una minaccia
+
+            # Le modifiche vengono salvate negli stati corretti
+            st.session_state.custom_pedagogical_principles = selected_principles
+            # CORREZIONE: Salva il testo personalizzato nel suo stato separato
+            st.session_state.custom_methodology_text = custom_methodology.strip()
+            
+            st.session_state.model_initialized = False
+            self.model_manager.auto_initialize_system(self.file_manager)
+            st.success("✅ Principi aggiornati e sistema reinizializzato!")
+            time.sleep(1)
+            st.rerun()
+
+    def show_advanced_settings_tab(self):
+        """Impostazioni avanzate di sistema."""
+        st.header("⚙️ Impostazioni Avanzate di Sistema")
+        
+        st.subheader("🤖 Configurazione Modello AI")
+        current_model = st.session_state.get('selected_model', 'gemini-1.5-flash')
+        selected_model = st.selectbox(
+            "Seleziona Modello AI:",
+            options=list(MODEL_CONFIGS.keys()),
+            index=list(MODEL_CONFIGS.keys()).index(current_model),
+            format_func=lambda x: MODEL_CONFIGS[x]["display_name"]
+        )
+        if selected_model != current_model:
+            st.session_state.selected_model = selected_model
+            st.session_state.model_initialized = False
+            st.success(f"🔄 Modello cambiato in: {MODEL_CONFIGS[selected_model]['display_name']}")
+
+        st.session_state.stream_responses = st.toggle(
+            "⚡ Risposte in streaming",
+            value=st.session_state.get("stream_responses", True),
+            help="Mostra la risposta di EduBot man mano che viene generata, invece di attendere il testo completo."
+        )
+        st.session_state.speculative_generation = st.toggle(
+            "🚀 Generazione speculativa",
+            value=st.session_state.get("speculative_generation", False),
+            help="Avvia la risposta in parallelo alla verifica di sicurezza AI. La risposta viene mostrata solo se il messaggio è sicuro, altrimenti viene scartata."
+        )
+        st.session_state.context_token_budget = st.number_input(
+            "🧠 Budget di contesto (token per richiesta)",
+            min_value=2000, max_value=100000, step=1000,
+            value=st.session_state.get("context_token_budget", CONTEXT_TOKEN_BUDGET),
+            help="Oltre questa soglia i turni meno recenti vengono riassunti: la cronologia completa resta visibile in chat."
+        )
+        st.session_state.attach_documents_to_chat = st.toggle(
+            "📎 Documenti consultabili in chat",
+            value=st.session_state.get("attach_documents_to_chat", True),
+            help="Allega a ogni domanda i file analizzati e gli estratti più pertinenti dei PDF, così puoi chiedere dettagli (es. una pagina specifica) senza ricaricarli."
+        )
+
+        st.subheader("🚀 Controllo Sistema")
+        if st.button("🚀 Inizializza/Reinizializza Sistema", type="primary"):
+            if st.session_state.get('api_key_configured', False):
+                with st.spinner("🔄 Inizializzazione..."):
+                    st.session_state.model_initialized = False
+                    success = self.model_manager.auto_initialize_system(self.file_manager)
+                    if success: st.success("✅ Sistema inizializzato!")
+                    else: st.error("❌ Errore nell'inizializzazione.")
+                st.rerun()
+            else:
+                st.error("❌ Chiave API non configurata.")
+
+    def show_prompt_inspector_advanced(self):
+        """Ispettore e editor del prompt avanzato con suggerimenti dinamici."""
+        st.header("🕵️ Editor Prompt Avanzato")
+        st.caption("Personalizza il comportamento di EduBot o usa i suggerimenti contestuali per iniziare.")
+
+        # --- Setup Iniziale ---
+        current_prompt = st.session_state.get("current_system_prompt", "Prompt non generato.")
+        custom_sections = st.session_state.get("custom_prompt_sections", {})
+
+        # Recupera i suggerimenti specifici per la materia attualmente selezionata
+        current_subject_key = st.session_state.selected_subject_methodology
+        suggestions = SUBJECT_METHODOLOGY_CONFIGS.get(current_subject_key, {}).get("prompt_suggestions", {})
+
+        # --- Editor a Tab ---
+        st.subheader("✏️ Editor Sezioni Personalizzabili")
+        tabs_editor = st.tabs(["👤 Ruolo e Personalità", "📚 Metodologia Base", "🎯 Obiettivi e Regole"])
+
+        # Funzione helper per non ripetere il codice dei suggerimenti in ogni tab
+        def create_suggestion_widget(tab_name: str, section_key: str):
+            tab_suggestions = suggestions.get(section_key, [])
+            if tab_suggestions:
+                st.markdown("###### Suggerimenti per iniziare")
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    selected = st.selectbox(
+                        "Scegli un punto di partenza:",
+                        [""] + tab_suggestions,
+                        key=f"{section_key}_selector",
+                        label_visibility="collapsed"
+                    )
+                with col2:
+                    if st.button("➕ Aggiungi", key=f"add_{section_key}", use_container_width=True):
+                        if selected:
+                            current_text = custom_sections.get(section_key, "")
+                            new_text = f"{current_text}\n- {selected}".strip()
+                            st.session_state.custom_prompt_sections[section_key] = new_text
+                            st.rerun()
+
+        # Tab 1: Ruolo e Personalità
+        with tabs_editor[0]:
+            create_suggestion_widget("Ruolo e Personalità", "ruolo_personalita")
+            custom_sections["ruolo_personalita"] = st.text_area(
+                "Definisci il ruolo, la personalità e il tono di EduBot:",
+                value=custom_sections.get("ruolo_personalita", ""),
+                height=150,
+                key="ruolo_text_area"
+            )
+
+        # Tab 2: Metodologia Base
+        with tabs_editor[1]:
+            create_suggestion_widget("Metodologia Base", "metodologia_base")
+            custom_sections["metodologia_base"] = st.text_area(
+                "Definisci la metodologia didattica di base:",
+                value=custom_sections.get("metodologia_base", ""),
+                height=150,
+                key="metodologia_text_area"
+            )
+
+        # Tab 3: Obiettivi e Regole
+        with tabs_editor[2]:
+            create_suggestion_widget("Obiettivi e Regole", "obiettivi_comportamento")
+            custom_sections["obiettivi_comportamento"] = st.text_area(
+                "Definisci obiettivi, regole assolute o comportamenti specifici:",
+                value=custom_sections.get("obiettivi_comportamento", ""),
+                height=150,
+                key="obiettivi_text_area"
+            )
+
+        st.session_state.custom_prompt_sections = custom_sections
+        st.markdown("---")
+
+        # --- Pulsante di Salvataggio con Controllo di Sicurezza ---
+        if st.button("💾 Salva Modifiche e Reinizializza", type="primary", use_container_width=True):
+            sezione_a_rischio = False
+            with st.spinner("Verifica di sicurezza delle sezioni..."):
+                verdicts = st.session_state.security_system.detect_injection_batch(
+                    {name: text for name, text in custom_sections.items() if text}
+                )
+            for section_name, (is_injection, reason) in verdicts.items():
+                if is_injection:
+                    st.error(f"🚫 Testo nella sezione '{section_name.replace('_', ' ').title()}' bloccato per sicurezza. ({reason})")
+                    sezione_a_rischio = True
+
+            if not sezione_a_rischio:
+                with st.spinner("Salvataggio e reinizializzazione del sistema..."):
+                    st.session_state.model_initialized = False
+                    self.model_manager.auto_initialize_system(self.file_manager)
+                    time.sleep(1)
+                st.success("✅ Modifiche al prompt salvate e sistema reinizializzato!")
+                st.rerun()
+
+        st.markdown("---")
+        # --- Visualizzatore del Prompt Generato ---
+        st.subheader("📋 Prompt Completo Generato")
+        
+        # Nascondi la sezione #1 del prompt prima di visualizzarlo
+        pattern_to_hide = r'## 1\..*?(?=## 2\.)'
+        replacement_text = "[PRIMA SEZIONE NASCOSTA PER SICUREZZA]\n\n"
+        prompt_to_display = re.sub(pattern_to_hide, replacement_text, current_prompt, 1, re.DOTALL | re.IGNORECASE)
+      
+        st.text_area(
+            "Contenuto del Prompt di Sistema (sola lettura):",
+            value=prompt_to_display,
+            height=400,
+            disabled=True,
+            help="Questo è il prompt finale che viene inviato al modello AI, generato dinamicamente dalle tue configurazioni."
+        )
+        
+    def show_security_dashboard(self):
+        """Dashboard di sicurezza migliorata, più chiara e interattiva."""
+        st.header("🛡️ Centro Sicurezza EduBot")
+        st.caption("Monitora e testa in tempo reale le protezioni attive sull'applicazione.")
+
+        if not st.session_state.security_system:
+            st.error("❌ Sistema di sicurezza non inizializzato.")
+            return
+
+        st.markdown("---")
+
+        # --- Sezione 1: Metriche Principali ---
+        stats = st.session_state.security_system.get_security_stats()
+        col1, col2, col3 = st.columns(3)
+
+        with col1:
+            st.success("#### ✅ Sistema Operativo")
+            st.caption("Tutti i livelli di protezione sono attivi e funzionanti.")
+
+        with col2:
+            st.metric(
+                label="🚫 Minacce Bloccate",
+                value=stats['blocked_attempts'],
+                help="Il numero di input bloccati dal sistema di sicurezza in questa sessione."
+            )
+
+        with col3:
+            st.metric(
+                label="🔍 Modello Sicurezza",
+                value=stats['security_model'],
+                help="Indica che la protezione principale è affidata a un modello AI dedicato."
+            )
+
+        local_decisions = stats['local_allowed'] + stats['local_blocked'] + stats['cache_hits']
+        total_checks = local_decisions + stats['ai_checks']
+        if total_checks:
+            cache_stats = stats['verdict_cache']
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("⚡ Decisioni Locali", local_decisions,
+                        help="Controlli risolti dal pre-filtro locale o dalla cache dei verdetti, senza chiamare il modello AI.")
+            col2.metric("🤖 Verifiche AI", stats['ai_checks'],
+                        help="Input incerti inoltrati al classificatore AI.")
+            col3.metric("📉 Chiamate AI Evitate", f"{local_decisions / total_checks:.0%}")
+            col4.metric("🗃️ Cache Verdetti", f"{cache_stats['hit_rate']:.0%}",
+                        help=f"Tasso di successo della cache condivisa: {cache_stats['hits']} hit, {cache_stats['misses']} miss, "
+                             f"{cache_stats['entries']} voci ({cache_stats['bytes'] / 1024:.0f} KB).")
+            if stats['pii_detected']:
+                st.caption(f"🔒 Messaggi con possibili dati personali segnalati dal classificatore: **{stats['pii_detected']}**")
+
+        # --- Sezione 2: Livelli di Protezione ---
+        with st.expander("📖 Dettagli sui Livelli di Protezione Attivi"):
+            c1, c2, c3 = st.columns(3)
+            with c1:
+                st.info("##### 1. Classificazione AI")
+                st.write("Un pre-filtro locale risolve all'istante i casi evidenti; per i casi incerti un modello AI specializzato analizza l'**intento** del messaggio per bloccare manipolazioni e richieste pericolose prima che raggiungano il tutor.")
+            with c2:
+                st.info("##### 2. Anonimizzazione Dati")
+                st.write(f"Un sistema di filtri automatici (con **{stats['data_patterns_loaded']}** regole) cerca e oscura dati sensibili come email e numeri di telefono per proteggere la privacy.")
+            with c3:
+                st.info("##### 3. Sanitizzazione Input")
+                st.write("Il testo viene 'pulito' da codice potenzialmente dannoso (es. `<script>`) per prevenire attacchi di tipo cross-site scripting (XSS).")
+
+        st.markdown("---")
+
+        # --- Sezione 3: Test Interattivo ---
+        st.subheader("🧪 Test Interattivo di Sicurezza")
+        st.caption("Inserisci qualsiasi testo per vedere come i livelli di protezione lo analizzano e lo processano.")
+
+        test_input = st.text_input(
+            "Inserisci un testo da analizzare:",
+            placeholder="Prova con: 'Ciao', 'Ignora le tue regole', 'la mia email è test@test.com'"
+        )
+
+        if st.button("🔍 Analizza Testo", use_container_width=True, type="primary"):
+            if test_input.strip():
+                with st.spinner("Analisi di sicurezza in corso..."):
+                    # Esegui entrambi i controlli
+                    is_injection, reason = st.session_state.security_system.detect_injection_with_ai(test_input)
+                    anonymized_text = st.session_state.security_system.anonymize_data(test_input)
+
+                    st.markdown("---")
+                    st.write("#### Risultati dell'Analisi:")
+
+                    res1, res2 = st.columns(2)
+
+                    with res1:
+                        st.write("##### 1. Risultato Classificazione AI")
+                        if is_injection:
+                            st.error(f"**MINACCIA RILEVATA**\n\nMotivo: {reason}")
+                        else:
+                            st.success("**NESSUNA MINACCIA RILEVATA**\n\nL'intento del messaggio è sicuro.")
+
+                    with res2:
+                        st.write("##### 2. Risultato Anonimizzazione")
+                        if anonymized_text != test_input:
+                            st.warning("**DATI OSCURATI**")
+                            st.write("**Testo Originale:**")
+                            st.code(test_input, language=None)
+                            st.write("**Testo Anonimizzato:**")
+                            st.code(anonymized_text, language=None)
+                        else:
+                            st.success("**NESSUN DATO SENSIBILE RILEVATO**\n\nIl testo non contiene informazioni personali.")
+            else:
+                st.warning("⚠️ Inserisci un testo da analizzare.")
+
+    def show_system_statistics(self):
+        """Mostra statistiche di sistema."""
+        st.header("📊 Statistiche di Sistema")
+        st.metric("💬 Messaggi Totali", len(st.session_state.get('history', [])))
+        st.metric("🗂️ File Analizzati", len(st.session_state.get('analyzed_files', [])))
+
+        metrics = st.session_state.get('generation_metrics', [])
+        if metrics:
+            st.subheader("⏱️ Latenza delle Risposte")
+            first_token_times = [m['time_to_first_token'] for m in metrics if m['time_to_first_token'] is not None]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Primo token (media)", f"{sum(first_token_times) / len(first_token_times):.2f}s" if first_token_times else "n/d")
+            col2.metric("Generazione totale (media)", f"{sum(m['total_time'] for m in metrics) / len(metrics):.2f}s")
+            col3.metric("Ultimo turno", f"{metrics[-1]['total_time']:.2f}s")
+
+            speculative_turns = [m for m in metrics if m.get('speculative')]
+            if speculative_turns:
+                saved = [m['latency_saved'] for m in speculative_turns]
+                col1, col2 = st.columns(2)
+                col1.metric("🚀 Turni speculativi", len(speculative_turns))
+                col2.metric("Tempo risparmiato (medio)", f"{sum(saved) / len(saved):.2f}s",
+                            help="Durata della verifica di sicurezza AI sovrapposta alla generazione della risposta.")
+
+            context_turns = [m for m in metrics if m.get('context_tokens_before')]
+            if context_turns:
+                st.subheader("🧠 Contesto Inviato al Modello")
+                last_turn = context_turns[-1]
+                tokens_before = sum(m['context_tokens_before'] for m in context_turns)
+                tokens_after = sum(m['context_tokens_after'] for m in context_turns)
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Cronologia completa (ultimo turno)", f"{last_turn['context_tokens_before']:,} token")
+                col2.metric("Token inviati (ultimo turno)", f"{last_turn['context_tokens_after']:,} token",
+                            delta=f"{last_turn['context_tokens_after'] - last_turn['context_tokens_before']:,}", delta_color="inverse")
+                col3.metric("Riduzione complessiva", f"{1 - tokens_after / tokens_before:.0%}")
+                summary = st.session_state.get('context_summary', {})
+                if summary.get('covered_messages'):
+                    st.caption(f"📝 {summary['covered_messages']} messaggi meno recenti sono inviati come riepilogo (stima: ~{CONTEXT_CHARS_PER_TOKEN} caratteri per token).")
+
+        rerun_metrics = st.session_state.get('rerun_metrics', [])
+        if rerun_metrics:
+            st.subheader("🖥️ Tempo di Esecuzione dell'Interfaccia")
+            st.caption("Ad ogni interazione viene eseguita solo la scheda visibile. Mediana degli ultimi rerun per scheda (intero script):")
+            elapsed_by_tab = {}
+            for metric in rerun_metrics:
+                elapsed_by_tab.setdefault(metric['tab'], []).append(metric['elapsed'])
+            columns = st.columns(min(len(elapsed_by_tab), 3))
+            for position, (tab_name, timings) in enumerate(elapsed_by_tab.items()):
+                columns[position % len(columns)].metric(tab_name, f"{statistics.median(timings) * 1000:.0f}ms",
+                                                        help=f"{len(timings)} rerun registrati")
+
+        st.subheader("🚀 Avvio")
+        col1, col2 = st.columns(2)
+        package_import = STARTUP_METRICS.get('package_import')
+        col1.metric("Caricamento del pacchetto", f"{package_import * 1000:.0f}ms" if package_import is not None else "N/D",
+                    help="Import di edubot, eseguito una sola volta per processo e condiviso da tutte le sessioni.")
+        setup_time = st.session_state.get('application_setup_time')
+        col2.metric("Preparazione della sessione", f"{setup_time * 1000:.0f}ms" if setup_time is not None else "N/D",
+                    help="Creazione dei gestori dell'applicazione, eseguita una sola volta per sessione.")
+
+    def app_footer(self):
+        """Footer dell'applicazione."""
+        st.markdown("---")
+        st.markdown("<div style='text-align: center; font-size: 0.9em; color: #666;'><p><strong>EduBot AI © 2025 Edoardo Salza.</strong></p></div>", unsafe_allow_html=True)
+        
+    @staticmethod
+    def record_rerun_metrics(tab_name: str, elapsed: float):
+        """Registra il tempo di esecuzione dello script per la scheda visibile."""
+        metrics = st.session_state.setdefault("rerun_metrics", [])
+        metrics.append({'timestamp': time.time(), 'tab': tab_name, 'elapsed': elapsed})
+        del metrics[:-RERUN_METRICS_HISTORY]
+        logger.debug(f"🖥️ Rerun della scheda '{tab_name}' eseguito in {elapsed * 1000:.0f}ms")
+
+    def main_interface(self) -> Optional[str]:
+        """Interfaccia principale con tab. Restituisce il nome della scheda eseguita."""
+        self.chat_container = None # L'interfaccia vive nella sessione: il contenitore del rerun precedente non è più valido
+        # Controlla semplicemente se l'app è configurata ma il modello non è ancora attivo.
+        if (st.session_state.get('api_key_configured', False) and 
+            not st.session_state.get('model_initialized', False)):
+            self.model_manager.auto_initialize_system(self.file_manager)
+        st.markdown(f'<h2 style="text-align: center;"><img src="{self.header_icon_src}" class="custom-avatar"> EduBot AI - Tutor Intelligente</h2>', unsafe_allow_html=True)
+        
+        tab_sections = {
+            "💬 Chat AI": self.enhanced_chat_with_notifications,
+            "📚 Preset Materie": self.show_subject_methodology_presets,
+            "🗂️ Gestione File": self.show_file_management_tab,
+            "🎯 Argomenti": self.topic_management_interface,
+            "🧠 Principi Pedagogici": self.methodology_management_interface,
+            "⚙️ Impostazioni": self.show_advanced_settings_tab,
+            "🕵️ Editor Prompt": self.show_prompt_inspector_advanced,
+            "🛡️ Sicurezza": self.show_security_dashboard,
+            "📊 Statistiche": self.show_system_statistics,
+        }
+        # Cambiare scheda provoca un rerun: viene eseguita solo la scheda visibile, non tutte e nove
+        tab_widgets = st.tabs(list(tab_sections), key="active_tab", on_change="rerun")
+        active_tab = None
+        for (name, show_section), tab_widget in zip(tab_sections.items(), tab_widgets):
+            if tab_widget.open:
+                active_tab = name
+                with tab_widget: show_section()
+
+        self.app_footer()
+        return active_tab